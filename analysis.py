@@ -0,0 +1,267 @@
+import sys
+import hashlib
+import threading
+import logging
+from collections import OrderedDict, namedtuple
+import numpy as np
+import scipy.linalg as la
+
+logger = logging.getLogger(__name__)
+
+# Above this order closed-loop spectra come from ARPACK instead of a dense eigvals
+DENSE_EIG_LIMIT = 500
+
+# Default frequency grid (rad/s) for the return-difference margins
+DEFAULT_FREQUENCIES = np.logspace(-2, 3, 200)
+
+ClosedLoopAnalysis = namedtuple('ClosedLoopAnalysis', [
+    'eigenvalues', 'spectral_abscissa', 'damping', 'natural_frequency', 'stable'
+])
+
+def _issparse(M):
+    # scipy.sparse is only imported by the sparse code paths; a sparse input
+    # cannot exist unless something already imported it
+    sparse = sys.modules.get('scipy.sparse')
+    return sparse is not None and sparse.issparse(M)
+
+def _dense(M):
+    return M.toarray() if _issparse(M) else np.asarray(M, dtype=float)
+
+def _default_tol(A, B):
+    # Relative to the size of [A B], with sqrt(eps) headroom as in ctrbf: the
+    # staircase similarities leave roundoff in the coupling blocks that grows
+    # with every step, and computed eigenvalues carry errors of the same kind,
+    # so an eps-sized absolute threshold counts uncontrollable modes as rank
+    scale = max(np.sqrt(la.norm(A, 'fro')**2 + la.norm(B, 'fro')**2), 1.0)
+    return np.sqrt(np.finfo(float).eps) * scale
+
+def controllability_staircase(A, B, tol=None):
+    """Orthogonal staircase (controllability Hessenberg) form of (A, B).
+
+    Returns (n_controllable, Z, blocks) where Z is orthogonal, Z.T @ A @ Z has
+    the block upper Hessenberg staircase structure with controllable block
+    sizes `blocks`, and the leading n_controllable states of the new basis
+    span the controllable subspace. Uses rank-revealing QR at each step, so it
+    is O(n^3) and never forms the n x (n*m) Kalman matrix.
+    """
+    A = _dense(A).copy()
+    B = _dense(B)
+    n = A.shape[0]
+    if tol is None:
+        tol = _default_tol(A, B)
+
+    Z = np.eye(n)
+    blocks = []
+    nc = 0
+    pivot_block = B
+
+    while nc < n:
+        # Rank of the next block (rows nc: of the transformed input/coupling)
+        Qb, Rb, _ = la.qr(pivot_block, pivoting=True)
+        diag = np.abs(np.diag(Rb)) if Rb.size else np.zeros(0)
+        rank = int(np.sum(diag > tol))
+        if rank == 0:
+            break
+        blocks.append(rank)
+
+        # Similarity on the trailing block so the new directions come first
+        A[nc:, :] = Qb.T @ A[nc:, :]
+        A[:, nc:] = A[:, nc:] @ Qb
+        Z[:, nc:] = Z[:, nc:] @ Qb
+
+        if nc + rank >= n:
+            nc = n
+            break
+        pivot_block = A[nc + rank:, nc:nc + rank]
+        nc += rank
+
+    return nc, Z, blocks
+
+def controllable_dimension(A, B, tol=None):
+    return controllability_staircase(A, B, tol)[0]
+
+def is_controllable(A, B, tol=None):
+    return controllable_dimension(A, B, tol) == A.shape[0]
+
+def _distinct_eigenvalues(eigenvalues, tol):
+    # One representative per cluster of (numerically) repeated eigenvalues
+    distinct = []
+    for lam in eigenvalues:
+        if all(abs(lam - other) > tol for other in distinct):
+            distinct.append(lam)
+    return np.array(distinct)
+
+def pbh_test(A, B, tol=None, cluster_tol=1e-6):
+    """Popov-Belevitch-Hautus test; returns the uncontrollable eigenvalues of A.
+
+    rank [lambda I - A, B] is checked once per distinct eigenvalue, so
+    highly repeated spectra (integrator chains, formations of identical
+    drones) cost one SVD per cluster rather than one per eigenvalue.
+    """
+    A = _dense(A)
+    B = _dense(B)
+    n = A.shape[0]
+    if tol is None:
+        tol = _default_tol(A, B)
+
+    eigenvalues = la.eigvals(A)
+    scale = max(1.0, np.max(np.abs(eigenvalues)))
+    uncontrollable = []
+
+    M = np.empty((n, n + B.shape[1]), dtype=complex)
+    M[:, n:] = B
+    for lam in _distinct_eigenvalues(eigenvalues, cluster_tol * scale):
+        np.negative(A, out=M[:, :n])
+        M[np.arange(n), np.arange(n)] += lam
+        sigma = la.svdvals(M)
+        if sigma[-1] <= tol * max(1.0, abs(lam)):
+            uncontrollable.append(lam)
+
+    return np.array(uncontrollable)
+
+def _matrix_key(*matrices):
+    h = hashlib.sha256()
+    for M in matrices:
+        M = np.ascontiguousarray(_dense(M))
+        h.update(str(M.shape).encode())
+        h.update(M.tobytes())
+    return h.hexdigest()
+
+def _closed_loop_operator(A, B, K):
+    # x -> (A - B K) x without forming the dense closed-loop matrix
+    import scipy.sparse.linalg as spla
+    n = A.shape[0]
+    return spla.LinearOperator((n, n), matvec=lambda x: A @ x - B @ (K @ x), dtype=float)
+
+def closed_loop_eigenvalues(A, B, K, k=6):
+    """Closed-loop spectrum of A - B K.
+
+    Models up to DENSE_EIG_LIMIT states (or dense inputs) get every
+    eigenvalue; larger sparse models get the k right-most ones from ARPACK,
+    which is all stability and decay-rate checks need.
+    """
+    n = A.shape[0]
+    if not _issparse(A) or n <= DENSE_EIG_LIMIT:
+        return la.eigvals(_dense(A) - _dense(B) @ np.asarray(K))
+
+    import scipy.sparse.linalg as spla
+    try:
+        return spla.eigs(_closed_loop_operator(A, B, np.asarray(K)), k=min(k, n - 2),
+                         which='LR', return_eigenvectors=False)
+    except spla.ArpackNoConvergence:
+        logger.warning("ARPACK did not converge; falling back to dense eigenvalues")
+        return la.eigvals(_dense(A) - _dense(B) @ np.asarray(K))
+
+class ClosedLoopAnalyzer:
+    """Closed-loop eigen-analysis cached on the content of (A, B, K)."""
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def analyze(self, A, B, K):
+        key = _matrix_key(A, B, K)
+        with self._lock:
+            analysis = self._entries.get(key)
+            if analysis is not None:
+                self._entries.move_to_end(key)
+                return analysis
+
+        eigenvalues = closed_loop_eigenvalues(A, B, K)
+        magnitude = np.abs(eigenvalues)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            damping = np.where(magnitude > 0, -eigenvalues.real / magnitude, 1.0)
+
+        spectral_abscissa = float(np.max(eigenvalues.real))
+        analysis = ClosedLoopAnalysis(
+            eigenvalues=eigenvalues,
+            spectral_abscissa=spectral_abscissa,
+            damping=damping,
+            natural_frequency=magnitude,
+            stable=spectral_abscissa < 0
+        )
+
+        with self._lock:
+            self._entries[key] = analysis
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return analysis
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+closed_loop_analyzer = ClosedLoopAnalyzer()
+
+def analyze_closed_loop(A, B, K):
+    return closed_loop_analyzer.analyze(A, B, K)
+
+def _loop_responses(A, B, K, frequencies):
+    # L(jw) = K (jwI - A)^-1 B for every frequency, shape (F, m, m)
+    n = A.shape[0]
+    K = np.asarray(K)
+    m = K.shape[0]
+    L = np.empty((len(frequencies), m, m), dtype=complex)
+
+    if _issparse(A):
+        import scipy.sparse as sp
+        import scipy.sparse.linalg as spla
+        A = sp.csc_matrix(A, dtype=complex)
+        B = _dense(B)
+        identity = sp.identity(n, dtype=complex, format='csc')
+        for i, w in enumerate(frequencies):
+            X = spla.splu(1j * w * identity - A).solve(B.astype(complex))
+            L[i] = K @ X
+        return L
+
+    # Hessenberg reduction once, then an O(n^2) banded solve per frequency
+    H, Qh = la.hessenberg(_dense(A), calc_q=True)
+    Bh = Qh.T @ _dense(B)
+    Kh = K @ Qh
+    banded = np.zeros((n + 1, n), dtype=complex)
+    for offset in range(-1, n):
+        # Row (n - 1 - offset) of the banded store holds diagonal `offset`
+        diagonal = np.diagonal(H, offset)
+        if offset >= 0:
+            banded[n - 1 - offset, offset:] = -diagonal
+        else:
+            banded[n, :n - 1] = -diagonal
+    main_row = n - 1
+    base = banded[main_row].copy()
+    for i, w in enumerate(frequencies):
+        banded[main_row] = base + 1j * w
+        X = la.solve_banded((1, n - 1), banded, Bh, check_finite=False)
+        L[i] = Kh @ X
+    return L
+
+def stability_margins(A, B, K, frequencies=None):
+    """Closed-loop decay rate and MIMO disk margins of the state-feedback loop.
+
+    The return difference I + K (jwI - A)^-1 B is evaluated on a frequency
+    grid; its smallest singular value alpha guarantees simultaneous gain
+    margins [1/(1+alpha), 1/(1-alpha)] and phase margin 2 asin(alpha/2) in all
+    input channels. Dense models are reduced to Hessenberg form once so every
+    frequency costs O(n^2); sparse models use a sparse LU per frequency.
+    """
+    if frequencies is None:
+        frequencies = DEFAULT_FREQUENCIES
+    frequencies = np.asarray(frequencies, dtype=float)
+
+    analysis = analyze_closed_loop(A, B, K)
+    L = _loop_responses(A, B, K, frequencies)
+    m = L.shape[1]
+    sigma = np.linalg.svd(np.eye(m) + L, compute_uv=False)[:, -1]
+
+    i = int(np.argmin(sigma))
+    alpha = float(sigma[i])
+    return {
+        'spectral_abscissa': analysis.spectral_abscissa,
+        'decay_rate': -analysis.spectral_abscissa,
+        'min_damping': float(np.min(analysis.damping)),
+        'stable': analysis.stable,
+        'return_difference_min': alpha,
+        'critical_frequency': float(frequencies[i]),
+        'gain_margin': (1.0 / (1.0 + alpha), 1.0 / (1.0 - alpha) if alpha < 1 else float('inf')),
+        'phase_margin_deg': float(np.rad2deg(2 * np.arcsin(min(alpha, 2.0) / 2)))
+    }
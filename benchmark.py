@@ -0,0 +1,291 @@
+import os
+import sys
+import json
+import subprocess
+import time
+import argparse
+import platform
+import statistics
+import logging
+import numpy as np
+import scipy
+from drone_model import get_state_space_matrices, nonlinear_dynamics, linearize_model, LINEARIZATION_METHODS
+from lqr_controller import design_lqr, is_controllable
+from analysis import stability_margins
+from simulation import run_simulation, simulate_with_disturbance
+from utils import compute_performance_metrics
+
+logger = logging.getLogger(__name__)
+
+# Benchmark harness for the model, controller, simulation and HTTP layers.
+#
+#   python benchmark.py --output bench.json
+#   python benchmark.py --compare bench.json --threshold 0.1
+#
+# Every benchmark reports a primary value and its unit; 'higher_is_better'
+# tells the comparison which direction counts as a regression.
+
+PARAMS = {
+    'Ixx': 0.0231,
+    'Iyy': 0.0281,
+    'Izz': 0.0356,
+    'mass': 1.1,
+    'g': 9.81
+}
+Q = np.diag([10, 10, 10, 1, 1, 1, 10, 10, 10, 1, 1, 1])
+R = np.diag([1, 1, 1, 1])
+INITIAL_STATE = np.array([1.0, -0.5, 0.8, 0, 0, 0, 0.2, -0.1, 0.3, 0, 0, 0])
+
+def measure(fn, repeat=5, number=1):
+    # Median and best seconds per call over `repeat` rounds of `number` calls
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return statistics.median(samples), min(samples)
+
+def _model():
+    A, B = get_state_space_matrices(PARAMS['Ixx'], PARAMS['Iyy'], PARAMS['Izz'],
+                                    PARAMS['mass'], PARAMS['g'])
+    K = design_lqr(A, B, Q, R)
+    return A, B, K
+
+def bench_dynamics(quick):
+    state = INITIAL_STATE.copy()
+    u = np.array([PARAMS['mass'] * PARAMS['g'], 0.01, -0.01, 0.0])
+    number = 2000 if quick else 20000
+    median, best = measure(lambda: nonlinear_dynamics(0.0, state, u, PARAMS), number=number)
+    results = {
+        'nonlinear_dynamics': {'value': 1.0 / median, 'unit': 'calls/s', 'higher_is_better': True}
+    }
+    
+    # Uncached linearization cost per method
+    for method in LINEARIZATION_METHODS:
+        median, _ = measure(lambda: linearize_model(state, u, PARAMS, method=method, cache=False),
+                            number=number // 10)
+        results[f'linearize_model[{method}]'] = {
+            'value': median * 1e6, 'unit': 'us', 'higher_is_better': False
+        }
+    return results
+
+def bench_controller(quick):
+    A, B = get_state_space_matrices(PARAMS['Ixx'], PARAMS['Iyy'], PARAMS['Izz'],
+                                    PARAMS['mass'], PARAMS['g'])
+    number = 20 if quick else 200
+    design, _ = measure(lambda: design_lqr(A, B, Q, R), number=number)
+    controllable, _ = measure(lambda: is_controllable(A, B), number=number)
+    K = design_lqr(A, B, Q, R)
+    margins, _ = measure(lambda: stability_margins(A, B, K), number=max(1, number // 10))
+    return {
+        'design_lqr': {'value': design * 1e3, 'unit': 'ms', 'higher_is_better': False},
+        'is_controllable': {'value': controllable * 1e3, 'unit': 'ms', 'higher_is_better': False},
+        'stability_margins': {'value': margins * 1e3, 'unit': 'ms', 'higher_is_better': False}
+    }
+
+def bench_simulation(quick):
+    A, B, K = _model()
+    cases = [(0.01, 2.0), (0.001, 1.0)] if quick else [(0.01, 15.0), (0.005, 15.0), (0.001, 10.0)]
+    results = {}
+
+    for dt, horizon in cases:
+        steps = len(np.arange(0, horizon, dt))
+        # Fixed-step RK4, as the service runs it
+        median, _ = measure(lambda: run_simulation(A, B, K, INITIAL_STATE, horizon, dt, integrator='rk4'),
+                            repeat=3)
+        results[f'run_simulation[dt={dt},T={horizon}]'] = {
+            'value': steps / median, 'unit': 'steps/s', 'higher_is_better': True
+        }
+
+        force = np.array([0.0, 0.05, 0.0, 0.0])
+        median, _ = measure(
+            lambda: simulate_with_disturbance(A, B, K, INITIAL_STATE, horizon, dt, horizon / 2, force,
+                                              integrator='rk4'),
+            repeat=3
+        )
+        results[f'simulate_with_disturbance[dt={dt},T={horizon}]'] = {
+            'value': steps / median, 'unit': 'steps/s', 'higher_is_better': True
+        }
+
+    return results
+
+def bench_metrics(quick):
+    # Synthetic large result; metrics cost depends only on the array sizes
+    rng = np.random.default_rng(0)
+    steps = 100000 if quick else 1000000
+    result = {
+        'time': np.arange(steps) * 1e-3,
+        'states': rng.standard_normal((steps, 12)),
+        'inputs': rng.standard_normal((steps, 4)),
+        'error': rng.standard_normal((steps, 12)) * np.exp(-np.arange(steps) / steps)[:, None]
+    }
+    median, _ = measure(lambda: compute_performance_metrics(result), repeat=3)
+    return {
+        f'compute_performance_metrics[n={steps}]': {
+            'value': median * 1e3, 'unit': 'ms', 'higher_is_better': False
+        }
+    }
+
+def _post_all(client, payloads):
+    # Latencies (sorted) and total seconds for one POST per payload
+    latencies = []
+    start = time.perf_counter()
+    for payload in payloads:
+        t0 = time.perf_counter()
+        response = client.post('/run_simulation', json=payload)
+        latencies.append(time.perf_counter() - t0)
+        if response.status_code != 200:
+            raise RuntimeError(f"/run_simulation returned {response.status_code}")
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return latencies, elapsed
+
+def _latency_results(prefix, latencies, elapsed):
+    return {
+        f'{prefix}_latency_p50': {'value': latencies[len(latencies) // 2] * 1e3, 'unit': 'ms',
+                                  'higher_is_better': False},
+        f'{prefix}_latency_p95': {'value': latencies[int(0.95 * (len(latencies) - 1))] * 1e3, 'unit': 'ms',
+                                  'higher_is_better': False},
+        f'{prefix}_throughput': {'value': len(latencies) / elapsed, 'unit': 'req/s', 'higher_is_better': True}
+    }
+
+def bench_http(quick):
+    try:
+        from main import app, response_cache
+    except Exception as e:
+        logger.warning(f"Skipping HTTP benchmarks: {e}")
+        return {'http': {'skipped': str(e)}}
+
+    client = app.test_client()
+    requests = 5 if quick else 30
+
+    def payload(i):
+        # A different initial state per request, so each one misses the response cache
+        initial_state = INITIAL_STATE.copy()
+        initial_state[0] += 1e-3 * i
+        return {'simulation_time': 2.0 if quick else 15.0, 'dt': 0.01,
+                'initial_state': initial_state.tolist()}
+
+    # Start from an empty response cache (a RESPONSE_CACHE_PATH store may hold
+    # earlier runs), then warm up imports and the gain cache
+    response_cache.clear()
+    client.post('/run_simulation', json=payload(-1))
+
+    # Full path: design lookup, simulation and encoding on every request
+    results = _latency_results('http', *_post_all(client, [payload(i) for i in range(requests)]))
+
+    # Cache-hit path: the same request repeated after it has been stored
+    client.post('/run_simulation', json=payload(0))
+    results.update(_latency_results('http_cached', *_post_all(client, [payload(0)] * requests)))
+    return results
+
+# Child process: cold import of the app, then the gunicorn warm-up hook
+STARTUP_SCRIPT = (
+    "import json, logging, time\n"
+    "logging.disable(logging.CRITICAL)\n"
+    "import main\n"
+    "print(json.dumps({'import': main.STARTUP_IMPORT_SECONDS, 'warmup': main.warm_up()}))\n"
+)
+
+def bench_startup(quick):
+    # Fresh interpreters, so module caches from this process don't hide import costs
+    samples = []
+    for _ in range(1 if quick else 3):
+        out = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], capture_output=True, text=True,
+                             check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {
+        'startup_import': {'value': statistics.median(s['import'] for s in samples) * 1e3,
+                           'unit': 'ms', 'higher_is_better': False},
+        'startup_warmup': {'value': statistics.median(s['warmup'] for s in samples) * 1e3,
+                           'unit': 'ms', 'higher_is_better': False}
+    }
+
+BENCHMARKS = {
+    'model': bench_dynamics,
+    'controller': bench_controller,
+    'simulation': bench_simulation,
+    'metrics': bench_metrics,
+    'http': bench_http,
+    'startup': bench_startup
+}
+
+def run_benchmarks(groups=None, quick=False):
+    results = {}
+    for name, bench in BENCHMARKS.items():
+        if groups and name not in groups:
+            continue
+        logger.info(f"Running {name} benchmarks")
+        results.update(bench(quick))
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'platform': platform.platform(),
+            'quick': quick
+        },
+        'results': results
+    }
+
+def compare(current, baseline, threshold=0.1):
+    # Relative change per benchmark; a regression is a change beyond `threshold`
+    # in the wrong direction
+    rows = []
+    for name, entry in current['results'].items():
+        base = baseline['results'].get(name)
+        if 'value' not in entry or not base or 'value' not in base:
+            continue
+        change = (entry['value'] - base['value']) / base['value']
+        worse = -change if entry['higher_is_better'] else change
+        rows.append({
+            'name': name,
+            'baseline': base['value'],
+            'current': entry['value'],
+            'unit': entry['unit'],
+            'change': change,
+            'regression': worse > threshold
+        })
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drone stabilizer benchmarks")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', help="baseline JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="relative slowdown flagged as a regression (default 0.1)")
+    parser.add_argument('--only', nargs='*', choices=sorted(BENCHMARKS),
+                        help="run only these benchmark groups")
+    parser.add_argument('--quick', action='store_true', help="smaller problem sizes")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    current = run_benchmarks(args.only, args.quick)
+
+    for name, entry in current['results'].items():
+        if 'value' in entry:
+            print(f"{name:55s} {entry['value']:14.2f} {entry['unit']}")
+        else:
+            print(f"{name:55s} skipped ({entry['skipped']})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(current, baseline, args.threshold)
+        print()
+        for row in rows:
+            flag = 'REGRESSION' if row['regression'] else ''
+            print(f"{row['name']:55s} {row['change'] * 100:+8.1f}% {flag}")
+        if any(row['regression'] for row in rows):
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
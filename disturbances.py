@@ -0,0 +1,217 @@
+import logging
+from collections import namedtuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Disturbance/event schedules for the simulation loops. Forces are 4-vectors in
+# input space ([T, tau_x, tau_y, tau_z]) added to the control input; parameter
+# changes (e.g. a payload drop) replace airframe parameters from their step on.
+# A schedule is compiled once against the time vector, so the loop only does
+# array lookups and one integer comparison per step.
+
+N_INPUTS = 4
+
+def _step_index(t, dt):
+    # Same rounding simulate_with_disturbance has always used
+    return int(t / dt)
+
+def _force_vector(force):
+    force = np.asarray(force, dtype=float)
+    if force.shape != (N_INPUTS,):
+        raise ValueError(f"Disturbance force must have {N_INPUTS} components, got {force.size}")
+    return force
+
+class Impulse:
+    """Force applied for the single step containing `time`."""
+
+    def __init__(self, time, force):
+        self.time = float(time)
+        self.force = _force_vector(force)
+
+    def add_forces(self, time, dt, out):
+        k = _step_index(self.time, dt)
+        if 0 <= k < len(time):
+            out[k] += self.force
+
+class StepForce:
+    """Constant force from `time` on, for `duration` seconds if given."""
+
+    def __init__(self, time, force, duration=None):
+        self.time = float(time)
+        self.force = _force_vector(force)
+        self.duration = None if duration is None else float(duration)
+
+    def add_forces(self, time, dt, out):
+        start = max(_step_index(self.time, dt), 0)
+        stop = len(time) if self.duration is None else _step_index(self.time + self.duration, dt)
+        out[start:stop] += self.force
+
+class RampForce:
+    """Force rising linearly from zero at `start` to `force` at `stop`, then held."""
+
+    def __init__(self, start, stop, force):
+        if stop <= start:
+            raise ValueError("Ramp stop must be after its start")
+        self.start = float(start)
+        self.stop = float(stop)
+        self.force = _force_vector(force)
+
+    def add_forces(self, time, dt, out):
+        weight = np.clip((time - self.start) / (self.stop - self.start), 0.0, 1.0)
+        out += weight[:, None] * self.force
+
+class Gust:
+    """1-cosine gust peaking at `force` halfway through `duration` seconds."""
+
+    def __init__(self, time, duration, force):
+        if duration <= 0:
+            raise ValueError("Gust duration must be positive")
+        self.time = float(time)
+        self.duration = float(duration)
+        self.force = _force_vector(force)
+
+    def add_forces(self, time, dt, out):
+        phase = (time - self.time) / self.duration
+        active = (phase >= 0.0) & (phase < 1.0)
+        weight = 0.5 * (1.0 - np.cos(2 * np.pi * phase[active]))
+        out[active] += weight[:, None] * self.force
+
+class ParameterChange:
+    """Airframe parameters replaced from `time` on, e.g. {'mass': 0.8} for a payload drop."""
+
+    def __init__(self, time, **params):
+        if not params:
+            raise ValueError("ParameterChange needs at least one parameter")
+        self.time = float(time)
+        self.params = {name: float(value) for name, value in params.items()}
+
+EVENT_TYPES = {
+    'impulse': Impulse,
+    'step': StepForce,
+    'ramp': RampForce,
+    'gust': Gust,
+    'parameter': ParameterChange
+}
+
+# Per-step lookups for one or more schedules. The force for step i is
+# force_table[force_index[i]] (row 0 is all zeros, so steps without forces need
+# no branch); change_steps are sorted and change_params[j] holds the complete
+# parameter set in effect from change_steps[j] on.
+CompiledSchedule = namedtuple(
+    'CompiledSchedule', ['force_index', 'force_table', 'change_steps', 'change_params']
+)
+
+class DisturbanceSchedule:
+    """Ordered collection of disturbance events for one simulation."""
+
+    def __init__(self, events=()):
+        self.events = list(events)
+        for event in self.events:
+            if not isinstance(event, tuple(EVENT_TYPES.values())):
+                raise ValueError(f"Unsupported disturbance event {event!r}")
+
+    @property
+    def forces(self):
+        return [event for event in self.events if not isinstance(event, ParameterChange)]
+
+    @property
+    def changes(self):
+        return sorted((event for event in self.events if isinstance(event, ParameterChange)),
+                      key=lambda event: event.time)
+
+    def force_history(self, time, dt):
+        # Dense (T, 4) force per step; the last sample is never integrated, so
+        # nothing is applied there
+        forces = np.zeros((len(time), N_INPUTS))
+        for event in self.forces:
+            event.add_forces(time, dt, forces)
+        if len(time):
+            forces[-1] = 0.0
+        return forces
+
+    def compile(self, time, dt, params):
+        return compile_schedules([self], time, dt, params, batch=False)
+
+def _change_points(schedule, num_steps, dt, params):
+    # (step, cumulative params) for each parameter change inside the run
+    points = []
+    current = dict(params)
+    for event in schedule.changes:
+        k = max(_step_index(event.time, dt), 0)
+        if k >= num_steps - 1:
+            continue
+        current = {**current, **event.params}
+        if points and points[-1][0] == k:
+            points[-1] = (k, current)
+        else:
+            points.append((k, current))
+    return points
+
+def compile_schedules(schedules, time, dt, params, batch=True):
+    """Compile N schedules (one per trajectory) into a CompiledSchedule.
+
+    Force rows are only stored for steps where some schedule applies a force,
+    so long runs with short events stay small. With batch=True the table is
+    (rows, N, 4) and parameter sets hold (N,) arrays; otherwise a single
+    schedule compiles to (rows, 4) and scalar parameters.
+    """
+    num_steps = len(time)
+    num = len(schedules)
+    params = {name: np.asarray(value, dtype=float) for name, value in params.items()}
+
+    # Forces: one dense history per schedule, keeping only the active rows
+    histories = [schedule.force_history(time, dt) for schedule in schedules]
+    active = np.zeros(num_steps, dtype=bool)
+    for forces in histories:
+        active |= np.any(forces != 0.0, axis=1)
+    rows = np.flatnonzero(active)
+
+    force_index = np.zeros(num_steps, dtype=np.intp)
+    force_index[rows] = np.arange(1, len(rows) + 1)
+    force_table = np.zeros((len(rows) + 1, num, N_INPUTS))
+    for j, forces in enumerate(histories):
+        force_table[1:, j] = forces[rows]
+
+    # Parameter changes: merge every schedule's change steps, and give each
+    # trajectory the values of its latest change at or before that step
+    points = [_change_points(schedule, num_steps, dt, params) for schedule in schedules]
+    change_steps = np.array(sorted({k for p in points for k, _ in p}), dtype=np.intp)
+    change_params = []
+    for step in change_steps:
+        merged = {name: np.broadcast_to(value, (num,)).copy() for name, value in params.items()}
+        for j, p in enumerate(points):
+            latest = [values for k, values in p if k <= step]
+            if latest:
+                for name, value in latest[-1].items():
+                    merged[name][j] = value
+        change_params.append(merged)
+
+    if not batch:
+        force_table = force_table[:, 0]
+        change_params = [{name: float(value[0]) for name, value in merged.items()}
+                         for merged in change_params]
+
+    logger.debug(f"Compiled {num} disturbance schedule(s): {len(rows)} forced steps, "
+                 f"{len(change_steps)} parameter changes")
+    return CompiledSchedule(force_index, force_table, change_steps, change_params)
+
+def build_schedule(spec):
+    """DisturbanceSchedule from a JSON list such as
+    [{"type": "impulse", "time": 5, "force": [0, 0.1, 0, 0]},
+     {"type": "parameter", "time": 8, "mass": 0.8}].
+    """
+    if isinstance(spec, DisturbanceSchedule):
+        return spec
+    events = []
+    for item in spec:
+        item = dict(item)
+        kind = item.pop('type', None)
+        if kind not in EVENT_TYPES:
+            raise ValueError(f"Unknown disturbance type '{kind}'. "
+                             f"Available: {', '.join(EVENT_TYPES)}")
+        try:
+            events.append(EVENT_TYPES[kind](**item))
+        except TypeError as e:
+            raise ValueError(f"Invalid '{kind}' disturbance: {e}")
+    return DisturbanceSchedule(events)
@@ -1,6 +1,10 @@
 import numpy as np
-from scipy.integrate import solve_ivp
+import math
+import hashlib
+import threading
+from collections import OrderedDict
 import logging
+from utils import euler_from_quaternion, quaternion_from_euler
 
 logger = logging.getLogger(__name__)
 
@@ -33,7 +37,10 @@ def get_state_space_matrices(Ixx, Iyy, Izz, mass, g):
     
     return A, B
 
-def nonlinear_dynamics(t, state, u, params):
+def nonlinear_dynamics(t, state, u, params, attitude='euler'):
+    # attitude='quaternion' takes the 13-state form of nonlinear_dynamics_quaternion
+    if attitude == 'quaternion':
+        return nonlinear_dynamics_quaternion(t, state, u, params)
     
     # Extract state variables
     x, y, z, u_vel, v_vel, w_vel, phi, theta, psi, p, q, r = state
@@ -77,3 +84,334 @@ def nonlinear_dynamics(t, state, u, params):
     dr = (Ixx - Iyy) * p * q / Izz + tau_z / Izz
     
     return np.array([dx, dy, dz, du, dv, dw, dphi, dtheta, dpsi, dp, dq, dr])
+
+def nonlinear_dynamics_quaternion(t, state, u, params):
+    # Same model with the attitude as a unit quaternion instead of Euler angles:
+    # state is [x, y, z, u, v, w, qw, qx, qy, qz, p, q, r]. There is no tan/sec
+    # of the pitch angle, so the derivative stays smooth through +-90 degrees.
+    x, y, z, u_vel, v_vel, w_vel, qw, qx, qy, qz, p, q, r = state
+    T, tau_x, tau_y, tau_z = u
+    
+    Ixx = params['Ixx']
+    Iyy = params['Iyy']
+    Izz = params['Izz']
+    mass = params['mass']
+    g = params['g']
+    
+    # Gravity direction in the body frame (third column of the inertial-to-body rotation)
+    gx = 2 * (qx * qz - qw * qy)
+    gy = 2 * (qy * qz + qw * qx)
+    gz = 1 - 2 * (qx * qx + qy * qy)
+    
+    # Derivatives for linear velocity
+    du = r * v_vel - q * w_vel - g * gx
+    dv = p * w_vel - r * u_vel - g * gy
+    dw = q * u_vel - p * v_vel - g * gz + T / mass
+    
+    # Quaternion kinematics: q' = 1/2 q * (0, p, q, r)
+    dqw = -0.5 * (qx * p + qy * q + qz * r)
+    dqx = 0.5 * (qw * p + qy * r - qz * q)
+    dqy = 0.5 * (qw * q + qz * p - qx * r)
+    dqz = 0.5 * (qw * r + qx * q - qy * p)
+    
+    # Derivatives for angular rates
+    dp = (Iyy - Izz) * q * r / Ixx + tau_x / Ixx
+    dq = (Izz - Ixx) * p * r / Iyy + tau_y / Iyy
+    dr = (Ixx - Iyy) * p * q / Izz + tau_z / Izz
+    
+    return np.array([u_vel, v_vel, w_vel, du, dv, dw, dqw, dqx, dqy, dqz, dp, dq, dr])
+
+def quaternion_state(state):
+    # 12-state Euler form -> 13-state quaternion form (any leading shape)
+    state = np.asarray(state, dtype=float)
+    out = np.empty(state.shape[:-1] + (13,))
+    out[..., 0:6] = state[..., 0:6]
+    out[..., 6:10] = quaternion_from_euler(state[..., 6], state[..., 7], state[..., 8])
+    out[..., 10:13] = state[..., 9:12]
+    return out
+
+def euler_state(state, out=None):
+    # 13-state quaternion form -> 12-state Euler form (any leading shape); the
+    # quaternion is normalized first
+    state = np.asarray(state, dtype=float)
+    if out is None:
+        out = np.empty(state.shape[:-1] + (12,))
+    quaternion = state[..., 6:10]
+    quaternion = quaternion / np.linalg.norm(quaternion, axis=-1, keepdims=True)
+    out[..., 0:6] = state[..., 0:6]
+    out[..., 6:9] = euler_from_quaternion(quaternion)
+    out[..., 9:12] = state[..., 10:13]
+    return out
+
+def make_dynamics_kernel(params):
+    # Unpack the parameters once so the returned kernel does no dict lookups
+    Ixx = float(params['Ixx'])
+    Iyy = float(params['Iyy'])
+    Izz = float(params['Izz'])
+    mass = float(params['mass'])
+    g = float(params['g'])
+    
+    # Precompute inertia couplings and reciprocals
+    c_p = (Iyy - Izz) / Ixx
+    c_q = (Izz - Ixx) / Iyy
+    c_r = (Ixx - Iyy) / Izz
+    inv_mass = 1.0 / mass
+    inv_Ixx = 1.0 / Ixx
+    inv_Iyy = 1.0 / Iyy
+    inv_Izz = 1.0 / Izz
+    
+    sin, cos = math.sin, math.cos
+    
+    def kernel(state, u, out):
+        # Same equations as nonlinear_dynamics, written into a preallocated buffer
+        x, y, z, u_vel, v_vel, w_vel, phi, theta, psi, p, q, r = state.tolist()
+        T, tau_x, tau_y, tau_z = u.tolist()
+        
+        sin_phi = sin(phi)
+        cos_phi = cos(phi)
+        sin_theta = sin(theta)
+        cos_theta = cos(theta)
+        tan_theta = sin_theta / cos_theta
+        
+        out[0] = u_vel
+        out[1] = v_vel
+        out[2] = w_vel
+        
+        out[3] = r * v_vel - q * w_vel + g * sin_theta
+        out[4] = p * w_vel - r * u_vel - g * cos_theta * sin_phi
+        out[5] = q * u_vel - p * v_vel - g * cos_theta * cos_phi + T * inv_mass
+        
+        out[6] = p + q * sin_phi * tan_theta + r * cos_phi * tan_theta
+        out[7] = q * cos_phi - r * sin_phi
+        out[8] = (q * sin_phi + r * cos_phi) / cos_theta
+        
+        out[9] = c_p * q * r + tau_x * inv_Ixx
+        out[10] = c_q * p * r + tau_y * inv_Iyy
+        out[11] = c_r * p * q + tau_z * inv_Izz
+        
+        return out
+    
+    return kernel
+
+def nonlinear_dynamics_batch(t, states, u, params, out=None):
+    # Batched form of nonlinear_dynamics: states is (N, 12) and u is (N, 4).
+    # Parameters may be scalars or (N,) arrays (one airframe per trajectory).
+    x, y, z, u_vel, v_vel, w_vel, phi, theta, psi, p, q, r = states.T
+    T, tau_x, tau_y, tau_z = u.T
+    
+    Ixx = params['Ixx']
+    Iyy = params['Iyy']
+    Izz = params['Izz']
+    mass = params['mass']
+    g = params['g']
+    
+    if out is None:
+        # Complex inputs (complex-step differentiation) give a complex result
+        out = np.empty(states.shape, dtype=np.result_type(states, u, float))
+    
+    # Trigonometric functions on (N,) arrays
+    sin_phi = np.sin(phi)
+    cos_phi = np.cos(phi)
+    sin_theta = np.sin(theta)
+    cos_theta = np.cos(theta)
+    tan_theta = np.tan(theta)
+    
+    # Derivatives for position
+    out[:, 0] = u_vel
+    out[:, 1] = v_vel
+    out[:, 2] = w_vel
+    
+    # Derivatives for linear velocity
+    out[:, 3] = r * v_vel - q * w_vel + g * sin_theta
+    out[:, 4] = p * w_vel - r * u_vel - g * cos_theta * sin_phi
+    out[:, 5] = q * u_vel - p * v_vel - g * cos_theta * cos_phi + T / mass
+    
+    # Derivatives for angles
+    out[:, 6] = p + q * sin_phi * tan_theta + r * cos_phi * tan_theta
+    out[:, 7] = q * cos_phi - r * sin_phi
+    out[:, 8] = q * sin_phi / cos_theta + r * cos_phi / cos_theta
+    
+    # Derivatives for angular rates
+    out[:, 9] = (Iyy - Izz) * q * r / Ixx + tau_x / Ixx
+    out[:, 10] = (Izz - Ixx) * p * r / Iyy + tau_y / Iyy
+    out[:, 11] = (Ixx - Iyy) * p * q / Izz + tau_z / Izz
+    
+    return out
+
+# Linearizations kept per (trim point, airframe, method)
+LINEARIZATION_CACHE_SIZE = 256
+LINEARIZATION_METHODS = ('central', 'complex', 'analytic')
+
+_linearizations = OrderedDict()
+_linearization_lock = threading.Lock()
+
+def _linearization_key(state0, u0, params, method, eps):
+    h = hashlib.sha256()
+    h.update(state0.tobytes())
+    h.update(u0.tobytes())
+    for name in ('Ixx', 'Iyy', 'Izz', 'mass', 'g'):
+        h.update(f"{name}={float(params[name])!r}".encode())
+    h.update(f"{method}:{eps!r}".encode())
+    return h.hexdigest()
+
+def _jacobian_central(state0, u0, params, eps):
+    # All 2 * (n + m) perturbed points go through one batched call
+    n = len(state0)
+    m = len(u0)
+    x0 = np.concatenate((state0, u0))
+    steps = eps * np.maximum(1.0, np.abs(x0))
+    perturbation = np.diag(steps)
+    
+    points = np.tile(x0, (2 * (n + m), 1))
+    points[:n + m] += perturbation
+    points[n + m:] -= perturbation
+    
+    f = nonlinear_dynamics_batch(0.0, points[:, :n], points[:, n:], params)
+    return ((f[:n + m] - f[n + m:]) / (2 * steps[:, None])).T
+
+def _jacobian_complex(state0, u0, params, eps):
+    # Complex step: Im f(x + ih e_j) / h has no subtractive cancellation, so the
+    # derivative is exact to machine precision with a tiny step (n + m points)
+    n = len(state0)
+    m = len(u0)
+    points = np.tile(np.concatenate((state0, u0)).astype(complex), (n + m, 1))
+    points[np.arange(n + m), np.arange(n + m)] += 1j * eps
+    
+    f = nonlinear_dynamics_batch(0.0, points[:, :n], points[:, n:], params)
+    return f.imag.T / eps
+
+def _jacobian_analytic(state0, u0, params):
+    # Closed-form partial derivatives of nonlinear_dynamics
+    _, _, _, u_vel, v_vel, w_vel, phi, theta, _, p, q, r = state0.tolist()
+    Ixx = float(params['Ixx'])
+    Iyy = float(params['Iyy'])
+    Izz = float(params['Izz'])
+    mass = float(params['mass'])
+    g = float(params['g'])
+    
+    sin_phi = math.sin(phi)
+    cos_phi = math.cos(phi)
+    sin_theta = math.sin(theta)
+    cos_theta = math.cos(theta)
+    tan_theta = sin_theta / cos_theta
+    sec2_theta = 1.0 / cos_theta**2
+    
+    # Body rates projected through the attitude kinematics
+    qr_sin = q * sin_phi + r * cos_phi
+    qr_cos = q * cos_phi - r * sin_phi
+    
+    c_p = (Iyy - Izz) / Ixx
+    c_q = (Izz - Ixx) / Iyy
+    c_r = (Ixx - Iyy) / Izz
+    
+    A = np.zeros((12, 12))
+    B = np.zeros((12, 4))
+    
+    # Position derivatives
+    A[0, 3] = A[1, 4] = A[2, 5] = 1.0
+    
+    # du = r v - q w + g sin(theta)
+    A[3, 4] = r
+    A[3, 5] = -q
+    A[3, 7] = g * cos_theta
+    A[3, 10] = -w_vel
+    A[3, 11] = v_vel
+    
+    # dv = p w - r u - g cos(theta) sin(phi)
+    A[4, 3] = -r
+    A[4, 5] = p
+    A[4, 6] = -g * cos_theta * cos_phi
+    A[4, 7] = g * sin_theta * sin_phi
+    A[4, 9] = w_vel
+    A[4, 11] = -u_vel
+    
+    # dw = q u - p v - g cos(theta) cos(phi) + T / m
+    A[5, 3] = q
+    A[5, 4] = -p
+    A[5, 6] = g * cos_theta * sin_phi
+    A[5, 7] = g * sin_theta * cos_phi
+    A[5, 9] = -v_vel
+    A[5, 10] = u_vel
+    B[5, 0] = 1.0 / mass
+    
+    # dphi = p + (q sin(phi) + r cos(phi)) tan(theta)
+    A[6, 6] = qr_cos * tan_theta
+    A[6, 7] = qr_sin * sec2_theta
+    A[6, 9] = 1.0
+    A[6, 10] = sin_phi * tan_theta
+    A[6, 11] = cos_phi * tan_theta
+    
+    # dtheta = q cos(phi) - r sin(phi)
+    A[7, 6] = -qr_sin
+    A[7, 10] = cos_phi
+    A[7, 11] = -sin_phi
+    
+    # dpsi = (q sin(phi) + r cos(phi)) / cos(theta)
+    A[8, 6] = qr_cos / cos_theta
+    A[8, 7] = qr_sin * tan_theta / cos_theta
+    A[8, 10] = sin_phi / cos_theta
+    A[8, 11] = cos_phi / cos_theta
+    
+    # Angular rates (gyroscopic coupling)
+    A[9, 10] = c_p * r
+    A[9, 11] = c_p * q
+    A[10, 9] = c_q * r
+    A[10, 11] = c_q * p
+    A[11, 9] = c_r * q
+    A[11, 10] = c_r * p
+    B[9, 1] = 1.0 / Ixx
+    B[10, 2] = 1.0 / Iyy
+    B[11, 3] = 1.0 / Izz
+    
+    return np.hstack((A, B))
+
+def linearize_model(state0, u0, params, method='central', eps=None, cache=True):
+    """A = df/dx and B = df/du of nonlinear_dynamics at a trim point (state0, u0).
+
+    method is 'central' (batched central differences, eps defaults to 1e-6
+    relative), 'complex' (complex-step, exact to machine precision, eps
+    defaults to 1e-20) or 'analytic' (closed-form Jacobian). Results are
+    cached per trim point, airframe and method and returned read-only.
+    """
+    if method not in LINEARIZATION_METHODS:
+        raise ValueError(f"Unknown linearization method '{method}'. "
+                         f"Available: {', '.join(LINEARIZATION_METHODS)}")
+    state0 = np.ascontiguousarray(state0, dtype=float)
+    u0 = np.ascontiguousarray(u0, dtype=float)
+    if state0.shape != (12,) or u0.shape != (4,):
+        raise ValueError("linearize_model expects a 12-state trim point and 4 inputs")
+    if eps is None:
+        eps = 1e-20 if method == 'complex' else 1e-6
+    
+    key = _linearization_key(state0, u0, params, method, eps) if cache else None
+    if cache:
+        with _linearization_lock:
+            AB = _linearizations.get(key)
+            if AB is not None:
+                _linearizations.move_to_end(key)
+                return AB
+    
+    if method == 'central':
+        J = _jacobian_central(state0, u0, params, eps)
+    elif method == 'complex':
+        J = _jacobian_complex(state0, u0, params, eps)
+    else:
+        J = _jacobian_analytic(state0, u0, params)
+    
+    A = np.ascontiguousarray(J[:, :12])
+    B = np.ascontiguousarray(J[:, 12:])
+    if not cache:
+        return A, B
+    
+    # Cached arrays are shared between callers, so hand them out read-only
+    A.flags.writeable = False
+    B.flags.writeable = False
+    with _linearization_lock:
+        _linearizations[key] = (A, B)
+        while len(_linearizations) > LINEARIZATION_CACHE_SIZE:
+            _linearizations.popitem(last=False)
+    return A, B
+
+def clear_linearization_cache():
+    with _linearization_lock:
+        _linearizations.clear()
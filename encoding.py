@@ -0,0 +1,94 @@
+import io
+import json
+import struct
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+JSON_MIMETYPE = 'application/json'
+BINARY_MIMETYPE = 'application/vnd.drone-sim.binary'
+NPZ_MIMETYPE = 'application/x-npz'
+
+RESULT_MIMETYPES = (JSON_MIMETYPE, BINARY_MIMETYPE, NPZ_MIMETYPE)
+
+# Binary layout: magic, uint16 version, uint16 reserved, uint32 header length,
+# UTF-8 JSON header, zero padding to 8 bytes, then the raw little-endian arrays
+# (each starting on an 8-byte boundary, offsets relative to the data section)
+BINARY_MAGIC = b'DSIM'
+BINARY_VERSION = 1
+_PREAMBLE = struct.Struct('<4sHHI')
+_ALIGN = 8
+
+def _pad(n):
+    return (-n) % _ALIGN
+
+def _wire_dtype(value, dtype):
+    # Index arrays stay integral; everything else uses the requested float type
+    if np.issubdtype(np.asarray(value).dtype, np.integer):
+        return np.dtype('<i4')
+    return dtype
+
+def encode_json_result(result):
+    # Nested lists for jsonify (the original response format)
+    return {
+        name: value.tolist() if isinstance(value, np.ndarray) else value
+        for name, value in result.items()
+    }
+
+def encode_binary_result(result, dtype=np.float32, meta=None):
+    dtype = np.dtype(dtype).newbyteorder('<')
+    arrays = []
+    entries = []
+    offset = 0
+
+    for name, value in result.items():
+        array_dtype = _wire_dtype(value, dtype)
+        array = np.ascontiguousarray(value, dtype=array_dtype)
+        entries.append({
+            'name': name,
+            'dtype': array_dtype.str,
+            'shape': list(array.shape),
+            'offset': offset
+        })
+        arrays.append(array)
+        offset += array.nbytes + _pad(array.nbytes)
+
+    header = json.dumps({'arrays': entries, 'meta': meta or {}}).encode('utf-8')
+    header += b' ' * _pad(_PREAMBLE.size + len(header))
+
+    buf = io.BytesIO()
+    buf.write(_PREAMBLE.pack(BINARY_MAGIC, BINARY_VERSION, 0, len(header)))
+    buf.write(header)
+    for array in arrays:
+        buf.write(array.tobytes())
+        buf.write(b'\0' * _pad(array.nbytes))
+
+    return buf.getvalue()
+
+def decode_binary_result(data):
+    magic, version, _, header_len = _PREAMBLE.unpack_from(data, 0)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError("Not a drone simulation binary result")
+
+    header = json.loads(bytes(data[_PREAMBLE.size:_PREAMBLE.size + header_len]))
+    data_start = _PREAMBLE.size + header_len
+
+    result = {}
+    for entry in header['arrays']:
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape']))
+        result[entry['name']] = np.frombuffer(
+            data, dtype=dtype, count=count, offset=data_start + entry['offset']
+        ).reshape(entry['shape'])
+
+    return result, header['meta']
+
+def encode_npz_result(result, dtype=np.float32):
+    buf = io.BytesIO()
+    dtype = np.dtype(dtype).newbyteorder('<')
+    np.savez(buf, **{
+        name: np.asarray(value, dtype=_wire_dtype(value, dtype))
+        for name, value in result.items()
+    })
+    return buf.getvalue()
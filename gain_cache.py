@@ -0,0 +1,152 @@
+import io
+import os
+import hashlib
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict, namedtuple
+import numpy as np
+from lqr_controller import solve_lqr, solve_dlqr
+
+logger = logging.getLogger(__name__)
+
+LQRGains = namedtuple('LQRGains', ['K', 'P', 'eigenvalues'])
+
+def lqr_cache_key(A, B, Q, R, dt=None):
+    # Content hash of the design inputs (shape, dtype and raw bytes of each matrix);
+    # discrete designs also hash their sample time
+    h = hashlib.sha256()
+    for M in (A, B, Q, R):
+        M = np.ascontiguousarray(M, dtype=float)
+        h.update(str(M.shape).encode())
+        h.update(M.tobytes())
+    if dt is not None:
+        h.update(f"dt={float(dt)!r}".encode())
+    return h.hexdigest()
+
+def _to_bytes(array):
+    buf = io.BytesIO()
+    np.save(buf, array, allow_pickle=False)
+    return buf.getvalue()
+
+def _from_bytes(data):
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+def _freeze(gains):
+    # Cached arrays are shared between callers, so hand them out read-only
+    for array in gains:
+        array.flags.writeable = False
+    return gains
+
+class SqliteGainStore:
+    """On-disk gain store shared between processes (e.g. gunicorn workers)."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS lqr_gains ("
+                "key TEXT PRIMARY KEY, K BLOB, P BLOB, eigenvalues BLOB)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT K, P, eigenvalues FROM lqr_gains WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return LQRGains(*(_from_bytes(blob) for blob in row))
+
+    def put(self, key, gains):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO lqr_gains (key, K, P, eigenvalues) VALUES (?, ?, ?, ?)",
+                (key, _to_bytes(gains.K), _to_bytes(gains.P), _to_bytes(gains.eigenvalues))
+            )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM lqr_gains")
+
+class LQRGainCache:
+    """Content-addressed cache of LQR designs with a bounded in-memory LRU.
+
+    Lookups go memory -> disk store (if configured) -> solve_lqr. Results are
+    returned as an LQRGains(K, P, eigenvalues) tuple of read-only arrays.
+    """
+
+    def __init__(self, max_entries=128, path=None):
+        self.max_entries = max_entries
+        self.store = SqliteGainStore(path) if path else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, A, B, Q, R, dt=None):
+        # dt selects the discrete-time design for the ZOH model at that sample time
+        key = lqr_cache_key(A, B, Q, R, dt)
+
+        with self._lock:
+            gains = self._entries.get(key)
+            if gains is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return gains
+
+        gains = None
+        if self.store is not None:
+            try:
+                gains = self.store.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"LQR gain store read failed: {e}")
+
+        if gains is not None:
+            with self._lock:
+                self.disk_hits += 1
+        else:
+            if dt is None:
+                gains = LQRGains(*solve_lqr(A, B, Q, R))
+            else:
+                gains = LQRGains(*solve_dlqr(A, B, Q, R, dt))
+            with self._lock:
+                self.misses += 1
+            if self.store is not None:
+                try:
+                    self.store.put(key, gains)
+                except sqlite3.Error as e:
+                    logger.warning(f"LQR gain store write failed: {e}")
+
+        gains = _freeze(gains)
+        with self._lock:
+            self._entries[key] = gains
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return gains
+
+    def clear(self, disk=False):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+        if disk and self.store is not None:
+            self.store.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'persistent': self.store is not None
+            }
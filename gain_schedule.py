@@ -0,0 +1,199 @@
+import os
+import math
+import hashlib
+import itertools
+import logging
+import numpy as np
+from drone_model import linearize_model
+from lqr_controller import solve_lqr
+
+logger = logging.getLogger(__name__)
+
+# Scheduling variables: state index for attitude/velocity, or an airframe parameter
+SCHEDULE_VARIABLES = {
+    'phi': 6,
+    'theta': 7,
+    'u': 3,
+    'v': 4,
+    'w': 5,
+    'mass': 'mass'
+}
+
+# Below this many operating points the table is designed in-process
+PARALLEL_MIN_POINTS = 64
+
+def trim_point(values, params):
+    # Operating point for one grid point: attitude/velocity from the grid and
+    # the thrust that holds altitude at that attitude
+    state0 = np.zeros(12)
+    plant = dict(params)
+    for name, value in values.items():
+        target = SCHEDULE_VARIABLES[name]
+        if isinstance(target, str):
+            plant[target] = value
+        else:
+            state0[target] = value
+
+    u0 = np.zeros(4)
+    u0[0] = plant['mass'] * plant['g'] / (math.cos(state0[6]) * math.cos(state0[7]))
+    return state0, u0, plant
+
+def _design_point(args):
+    values, params, Q, R = args
+    state0, u0, plant = trim_point(values, params)
+    A, B = linearize_model(state0, u0, plant, method='analytic')
+    K, _, _ = solve_lqr(A, B, Q, R)
+    return K
+
+def schedule_key(params, Q, R, axes):
+    h = hashlib.sha256()
+    for name in ('Ixx', 'Iyy', 'Izz', 'mass', 'g'):
+        h.update(f"{name}={float(params[name])!r}".encode())
+    for M in (Q, R):
+        M = np.ascontiguousarray(M, dtype=float)
+        h.update(str(M.shape).encode())
+        h.update(M.tobytes())
+    for name, values in axes.items():
+        h.update(name.encode())
+        h.update(np.ascontiguousarray(values, dtype=float).tobytes())
+    return h.hexdigest()
+
+class GainSchedule:
+    """LQR gains designed over a regular grid of operating points.
+
+    axes maps scheduling variables (see SCHEDULE_VARIABLES) to evenly spaced
+    values; table holds one (4, 12) gain per grid point. gain() interpolates
+    multilinearly between the 2^d surrounding points: each axis is located
+    arithmetically, so a lookup costs the same regardless of the grid size.
+    Values outside the grid are clamped to its edges.
+    """
+
+    def __init__(self, axes, table):
+        self.names = list(axes)
+        self.axes = [np.asarray(axes[name], dtype=float) for name in self.names]
+        self.table = np.asarray(table, dtype=float)
+        self.gain_shape = self.table.shape[len(self.axes):]
+
+        for name, values in zip(self.names, self.axes):
+            if name not in SCHEDULE_VARIABLES:
+                raise ValueError(f"Unknown scheduling variable '{name}'. "
+                                 f"Available: {', '.join(SCHEDULE_VARIABLES)}")
+            if len(values) > 2 and not np.allclose(np.diff(values), values[1] - values[0]):
+                raise ValueError(f"Schedule axis '{name}' must be evenly spaced")
+
+        # Flat (points, m * n) table and the corner offsets of one grid cell
+        sizes = [len(values) for values in self.axes]
+        self._flat = self.table.reshape(math.prod(sizes), -1)
+        self._strides = np.array([math.prod(sizes[i + 1:]) for i in range(len(sizes))])
+        self._single = np.array([size == 1 for size in sizes])
+        self._corners = np.array(list(itertools.product((0, 1), repeat=len(sizes))))
+        self._corner_offsets = self._corners @ np.where(self._single, 0, self._strides)
+        self._start = np.array([values[0] for values in self.axes])
+        self._step = np.array([values[1] - values[0] if len(values) > 1 else 1.0 for values in self.axes])
+        self._cells = np.array([max(len(values) - 2, 0) for values in self.axes])
+
+        # Corner gains of every cell, so a lookup is a view instead of a gather
+        cell_counts = [max(size - 1, 1) for size in sizes]
+        cell_origins = np.array(list(itertools.product(*(range(c) for c in cell_counts))))
+        self._cell_strides = [math.prod(cell_counts[i + 1:]) for i in range(len(sizes))]
+        self._cell_corners = self._flat[(cell_origins @ self._strides)[:, None] + self._corner_offsets]
+
+        # Plain-float copies for the per-step scalar path
+        self._start_list = self._start.tolist()
+        self._step_list = self._step.tolist()
+        self._cells_list = self._cells.tolist()
+        self._single_list = self._single.tolist()
+
+    @classmethod
+    def design(cls, params, Q, R, axes, executor=None, max_workers=None):
+        # Solve the LQR at every grid point (across processes for large grids)
+        names = list(axes)
+        grid = list(itertools.product(*(axes[name] for name in names)))
+        tasks = [(dict(zip(names, values)), params, Q, R) for values in grid]
+
+        if executor is None and len(tasks) >= PARALLEL_MIN_POINTS:
+            from sweep import get_executor
+            executor = get_executor(max_workers)
+
+        if executor is not None:
+            num_workers = getattr(executor, '_max_workers', None) or os.cpu_count() or 1
+            chunksize = max(1, len(tasks) // (4 * num_workers))
+            gains = list(executor.map(_design_point, tasks, chunksize=chunksize))
+        else:
+            gains = [_design_point(task) for task in tasks]
+
+        shape = tuple(len(axes[name]) for name in names)
+        table = np.stack(gains).reshape(shape + gains[0].shape)
+        logger.info(f"Designed gain schedule over {len(tasks)} operating points")
+        return cls(axes, table)
+
+    @classmethod
+    def load_or_design(cls, params, Q, R, axes, cache_dir=None, **kwargs):
+        # Reuse a table saved under cache_dir for the same airframe, weights and grid
+        path = None
+        if cache_dir:
+            path = os.path.join(cache_dir, f"schedule-{schedule_key(params, Q, R, axes)[:32]}.npz")
+            if os.path.exists(path):
+                try:
+                    return cls.load(path)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"Ignoring unreadable gain schedule {path}: {e}")
+
+        schedule = cls.design(params, Q, R, axes, **kwargs)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            schedule.save(path)
+        return schedule
+
+    def save(self, path):
+        arrays = {f"axis_{name}": values for name, values in zip(self.names, self.axes)}
+        # Write then rename, so concurrent workers never read a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, names=np.array(self.names), table=self.table, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            names = [str(name) for name in data['names']]
+            axes = {name: data[f"axis_{name}"] for name in names}
+            return cls(axes, data['table'])
+
+    def bind(self, params):
+        # Per-run lookup closure: parameter axes are fixed for the whole run
+        query = []
+        for name in self.names:
+            target = SCHEDULE_VARIABLES[name]
+            query.append(float(params[target]) if isinstance(target, str) else None)
+        state_axes = [(k, SCHEDULE_VARIABLES[name]) for k, name in enumerate(self.names)
+                      if query[k] is None]
+        out = np.empty(self.gain_shape)
+        flat_out = out.reshape(-1)
+
+        def gain(state):
+            for k, index in state_axes:
+                query[k] = state[index]
+            self._interpolate(query, flat_out)
+            return out
+
+        return gain
+
+    def _interpolate(self, query, out):
+        # Scalar cell search and corner weights (2^d of them, first axis most
+        # significant, matching the corner offsets), then one small dot
+        base = 0
+        weights = [1.0]
+        for value, start, step, cells, stride, single in zip(
+                query, self._start_list, self._step_list, self._cells_list,
+                self._cell_strides, self._single_list):
+            position = (value - start) / step
+            cell = min(max(math.floor(position), 0), cells)
+            fraction = 0.0 if single else min(max(position - cell, 0.0), 1.0)
+            base += cell * stride
+            weights = [w * f for w in weights for f in (1.0 - fraction, fraction)]
+
+        return np.dot(weights, self._cell_corners[base], out=out)
+
+    def gain(self, state, params):
+        return self.bind(params)(np.asarray(state, dtype=float)).copy()
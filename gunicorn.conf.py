@@ -0,0 +1,12 @@
+import os
+
+# Gunicorn loads this file from the working directory. Only hooks are set
+# here; bind address, worker count, etc. stay on the command line.
+
+def post_worker_init(worker):
+    # Runs in every new worker after the app is imported and before it accepts
+    # requests; set WORKER_WARMUP=0 to skip
+    if os.environ.get("WORKER_WARMUP", "1") == "0":
+        return
+    from main import warm_up
+    warm_up()
@@ -0,0 +1,147 @@
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_PREFIX = 'drone'
+
+# Stage timings of the request being handled in this context (None outside requests)
+_request_timings = ContextVar('request_timings', default=None)
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+class Registry:
+    """Process-wide histograms, counters and gauges, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._help = {}
+
+    def observe(self, name, labels, value, help_text=''):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+            self._help.setdefault(name, help_text)
+
+    def increment(self, name, amount=1, labels=None, help_text=''):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._help.setdefault(name, help_text)
+
+    def set_gauge(self, name, value, labels=None, help_text=''):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._gauges[key] = value
+            self._help.setdefault(name, help_text)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for kind, series in (('histogram', self._histograms),
+                                 ('counter', self._counters),
+                                 ('gauge', self._gauges)):
+                names = sorted({name for name, _ in series})
+                for name in names:
+                    full_name = f"{METRIC_PREFIX}_{name}"
+                    lines.append(f"# HELP {full_name} {self._help.get(name, '')}")
+                    lines.append(f"# TYPE {full_name} {kind}")
+                    for (series_name, labels), value in sorted(series.items()):
+                        if series_name != name:
+                            continue
+                        if kind == 'histogram':
+                            lines.extend(_render_histogram(full_name, labels, value))
+                        else:
+                            lines.append(f"{full_name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+def _render_histogram(name, labels, histogram):
+    for bound, total in histogram.cumulative():
+        yield f"{name}_bucket{_format_labels(labels, [('le', bound)])} {total}"
+    yield f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram.count}"
+    yield f"{name}_sum{_format_labels(labels)} {histogram.sum}"
+    yield f"{name}_count{_format_labels(labels)} {histogram.count}"
+
+registry = Registry()
+
+def record_stage(stage, seconds):
+    # Add to the current request's totals and to the process-wide histogram
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+    registry.observe('stage_seconds', {'stage': stage}, seconds,
+                     'Wall time per simulation pipeline stage')
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+def increment(name, amount=1, help_text=''):
+    registry.increment(name, amount, help_text=help_text)
+
+def start_request():
+    # Begin collecting stage timings for the current request context
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+def finish_request(endpoint, seconds):
+    timings = _request_timings.get()
+    _request_timings.set(None)
+    registry.observe('request_seconds', {'endpoint': endpoint}, seconds,
+                     'Wall time per HTTP request')
+    return timings or {}
+
+def server_timing_header(timings, total=None):
+    # Server-Timing: stage;dur=<milliseconds>, ...
+    entries = [f"{name};dur={seconds * 1e3:.3f}" for name, seconds in timings.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1e3:.3f}")
+    return ', '.join(entries)
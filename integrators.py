@@ -0,0 +1,267 @@
+import numpy as np
+import logging
+from drone_model import (
+    make_dynamics_kernel, nonlinear_dynamics, nonlinear_dynamics_batch, quaternion_state, euler_state
+)
+from lqr_controller import discretize_zoh
+
+logger = logging.getLogger(__name__)
+
+class Integrator:
+    """Base class for the per-tick state propagators used by the simulation loop.
+
+    `step` advances `state` by `dt` with the input `u` held constant and writes
+    the result into `out`. It returns False when the step could not be computed,
+    in which case the caller falls back to the linear model.
+    """
+    name = None
+
+    def __init__(self, params, A=None, B=None, n_states=12):
+        self.params = params
+        self.A = A
+        self.B = B
+        self.n_states = n_states
+
+    def step(self, t, state, u, dt, out):
+        raise NotImplementedError
+
+class RK4Integrator(Integrator):
+    """Classic fixed-step fourth-order Runge-Kutta on the nonlinear model."""
+    name = 'rk4'
+
+    def __init__(self, params, A=None, B=None, n_states=12):
+        super().__init__(params, A, B, n_states)
+        self.dynamics = make_dynamics_kernel(params)
+
+        # Preallocated stage buffers
+        self.k1 = np.zeros(n_states)
+        self.k2 = np.zeros(n_states)
+        self.k3 = np.zeros(n_states)
+        self.k4 = np.zeros(n_states)
+        self.tmp = np.zeros(n_states)
+
+    def step(self, t, state, u, dt, out):
+        f = self.dynamics
+        k1, k2, k3, k4, tmp = self.k1, self.k2, self.k3, self.k4, self.tmp
+        half_dt = 0.5 * dt
+
+        f(state, u, k1)
+
+        np.multiply(k1, half_dt, out=tmp)
+        tmp += state
+        f(tmp, u, k2)
+
+        np.multiply(k2, half_dt, out=tmp)
+        tmp += state
+        f(tmp, u, k3)
+
+        np.multiply(k3, dt, out=tmp)
+        tmp += state
+        f(tmp, u, k4)
+
+        # out = state + dt/6 * (k1 + 2*k2 + 2*k3 + k4)
+        k2 += k3
+        k2 *= 2.0
+        k2 += k1
+        k2 += k4
+        np.multiply(k2, dt / 6.0, out=out)
+        out += state
+
+        return np.isfinite(out).all()
+
+class SemiImplicitEulerIntegrator(Integrator):
+    """Symplectic Euler: rates are updated first, then positions and angles use the new rates."""
+    name = 'semi_implicit_euler'
+
+    def __init__(self, params, A=None, B=None, n_states=12):
+        super().__init__(params, A, B, n_states)
+        self.dynamics = make_dynamics_kernel(params)
+        self.deriv = np.zeros(n_states)
+
+    def step(self, t, state, u, dt, out):
+        f = self.dynamics
+        deriv = self.deriv
+
+        # Rate update (velocities 3:6, angular rates 9:12) from the current state
+        f(state, u, deriv)
+        deriv *= dt
+        np.add(state, deriv, out=out)
+        out[0:3] = state[0:3]
+        out[6:9] = state[6:9]
+
+        # Position and angle update (0:3, 6:9) evaluated with the updated rates
+        f(out, u, deriv)
+        deriv *= dt
+        out[0:3] += deriv[0:3]
+        out[6:9] += deriv[6:9]
+
+        return np.isfinite(out).all()
+
+class ZOHIntegrator(Integrator):
+    """Exact zero-order-hold propagation of the linearized model (A, B) about hover."""
+    name = 'zoh'
+
+    def __init__(self, params, A=None, B=None, n_states=12):
+        super().__init__(params, A, B, n_states)
+        if A is None or B is None:
+            raise ValueError("The ZOH integrator requires the A and B matrices")
+
+        # The linear model is written in deviations from the hover input
+        self.u_trim = np.zeros(B.shape[1])
+        self.u_trim[0] = params['mass'] * params['g']
+        self.du = np.zeros(B.shape[1])
+        self.tmp = np.zeros(n_states)
+        self._dt = None
+        self.Ad = None
+        self.Bd = None
+
+    def _discretize(self, dt):
+        self.Ad, self.Bd = discretize_zoh(self.A, self.B, dt)
+        self._dt = dt
+
+    def step(self, t, state, u, dt, out):
+        if dt != self._dt:
+            self._discretize(dt)
+
+        np.subtract(u, self.u_trim, out=self.du)
+        np.dot(self.Ad, state, out=out)
+        np.dot(self.Bd, self.du, out=self.tmp)
+        out += self.tmp
+
+        return True
+
+class SolveIvpIntegrator(Integrator):
+    """Adaptive RK45 through scipy's solve_ivp (reference path, one solver setup per step)."""
+    name = 'rk45'
+
+    def __init__(self, params, A=None, B=None, n_states=12):
+        super().__init__(params, A, B, n_states)
+        # scipy.integrate is only imported by the adaptive integrators
+        from scipy.integrate import solve_ivp
+        self.solve_ivp = solve_ivp
+
+    def step(self, t, state, u, dt, out):
+        sol = self.solve_ivp(
+            lambda t, x: nonlinear_dynamics(t, x, u, self.params),
+            [t, t + dt],
+            state,
+            method='RK45',
+            t_eval=[t + dt]
+        )
+
+        if not sol.success:
+            return False
+
+        out[:] = sol.y[:, 0]
+        return True
+
+class SolveIvpQuaternionIntegrator(SolveIvpIntegrator):
+    """Adaptive RK45 on the quaternion-attitude model.
+
+    The Euler state is converted to a quaternion for the step and back
+    afterwards, so the solver never sees the tan/sec(theta) terms that force
+    tiny steps near +-90 degrees pitch.
+    """
+    name = 'rk45_quaternion'
+
+    def step(self, t, state, u, dt, out):
+        sol = self.solve_ivp(
+            lambda t, x: nonlinear_dynamics(t, x, u, self.params, attitude='quaternion'),
+            [t, t + dt],
+            quaternion_state(state),
+            method='RK45',
+            t_eval=[t + dt]
+        )
+
+        if not sol.success:
+            return False
+
+        euler_state(sol.y[:, 0], out=out)
+        # Keep the angles continuous with the previous state instead of wrapped to (-pi, pi]
+        out[6:9] = state[6:9] + np.remainder(out[6:9] - state[6:9] + np.pi, 2 * np.pi) - np.pi
+        return np.isfinite(out).all()
+
+INTEGRATORS = {
+    cls.name: cls for cls in (
+        RK4Integrator,
+        SemiImplicitEulerIntegrator,
+        ZOHIntegrator,
+        SolveIvpIntegrator,
+        SolveIvpQuaternionIntegrator,
+    )
+}
+
+def get_integrator(name, params, A=None, B=None, n_states=12):
+    # Accept an already built integrator as well as a registry name
+    if isinstance(name, Integrator):
+        return name
+
+    if name not in INTEGRATORS:
+        raise ValueError(
+            f"Unknown integrator '{name}'. Available: {', '.join(sorted(INTEGRATORS))}"
+        )
+
+    return INTEGRATORS[name](params, A, B, n_states)
+
+class BatchRK4Integrator(Integrator):
+    """Fixed-step RK4 advancing N trajectories at once; state buffers are (N, 12).
+
+    `step` returns a boolean (N,) mask of the rows that stayed finite.
+    """
+    name = 'rk4'
+
+    def __init__(self, params, A=None, B=None, n_states=12, n_batch=1):
+        super().__init__(params, A, B, n_states)
+        shape = (n_batch, n_states)
+
+        # Preallocated stage buffers
+        self.k1 = np.zeros(shape)
+        self.k2 = np.zeros(shape)
+        self.k3 = np.zeros(shape)
+        self.k4 = np.zeros(shape)
+        self.tmp = np.zeros(shape)
+
+    def step(self, t, states, u, dt, out):
+        params = self.params
+        k1, k2, k3, k4, tmp = self.k1, self.k2, self.k3, self.k4, self.tmp
+        half_dt = 0.5 * dt
+
+        nonlinear_dynamics_batch(t, states, u, params, out=k1)
+
+        np.multiply(k1, half_dt, out=tmp)
+        tmp += states
+        nonlinear_dynamics_batch(t, tmp, u, params, out=k2)
+
+        np.multiply(k2, half_dt, out=tmp)
+        tmp += states
+        nonlinear_dynamics_batch(t, tmp, u, params, out=k3)
+
+        np.multiply(k3, dt, out=tmp)
+        tmp += states
+        nonlinear_dynamics_batch(t, tmp, u, params, out=k4)
+
+        k2 += k3
+        k2 *= 2.0
+        k2 += k1
+        k2 += k4
+        np.multiply(k2, dt / 6.0, out=out)
+        out += states
+
+        return np.isfinite(out).all(axis=1)
+
+BATCH_INTEGRATORS = {
+    cls.name: cls for cls in (
+        BatchRK4Integrator,
+    )
+}
+
+def get_batch_integrator(name, params, A=None, B=None, n_states=12, n_batch=1):
+    if isinstance(name, Integrator):
+        return name
+
+    if name not in BATCH_INTEGRATORS:
+        raise ValueError(
+            f"Unknown batch integrator '{name}'. Available: {', '.join(sorted(BATCH_INTEGRATORS))}"
+        )
+
+    return BATCH_INTEGRATORS[name](params, A, B, n_states, n_batch)
@@ -0,0 +1,154 @@
+import time
+import uuid
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    """Raised from a job's progress callback once cancellation was requested."""
+
+class QueueFull(Exception):
+    """Raised by submit when the backend is at its admission limit."""
+
+class Job:
+    def __init__(self, job_id, total_steps=None):
+        self.id = job_id
+        self.status = PENDING
+        self.steps_done = 0
+        self.total_steps = total_steps
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_requested = False
+
+    def report_progress(self, steps_done, total_steps):
+        # Progress callback handed to the work function; also the cancellation point
+        self.steps_done = steps_done
+        self.total_steps = total_steps
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def to_dict(self):
+        info = {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': {
+                'steps_done': self.steps_done,
+                'total_steps': self.total_steps
+            },
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished
+        }
+        if self.status == DONE:
+            info['result'] = self.result
+        elif self.status == FAILED:
+            info['error'] = self.error
+        return info
+
+class JobBackend:
+    """Interface for simulation job backends.
+
+    `submit(fn, *args, total_steps=None)` calls `fn(*args, progress=job.report_progress)`
+    and returns the job id; `get(job_id)` returns the status dict (or None) and
+    `cancel(job_id)` requests cancellation. A distributed backend (e.g. Redis)
+    provides the same three calls.
+    """
+
+    def submit(self, fn, *args, total_steps=None):
+        raise NotImplementedError
+
+    def get(self, job_id):
+        raise NotImplementedError
+
+    def cancel(self, job_id):
+        raise NotImplementedError
+
+class LocalJobBackend(JobBackend):
+    """In-process backend: a bounded thread pool with admission control.
+
+    At most `max_workers` jobs run at once and at most `max_pending` jobs may
+    be queued or running; beyond that `submit` raises QueueFull. The last
+    `max_finished` finished jobs are kept for polling.
+    """
+
+    def __init__(self, max_workers=2, max_pending=16, max_finished=256):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sim-job')
+        self._jobs = OrderedDict()
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, total_steps=None):
+        with self._lock:
+            if self._active >= self.max_pending:
+                raise QueueFull(f"{self._active} jobs already queued or running")
+            job = Job(uuid.uuid4().hex, total_steps)
+            self._jobs[job.id] = job
+            self._active += 1
+
+        self._executor.submit(self._run, job, fn, args)
+        logger.info(f"Job {job.id} submitted")
+        return job.id
+
+    def _run(self, job, fn, args):
+        try:
+            if job.cancel_requested:
+                raise JobCancelled()
+            job.status = RUNNING
+            job.started = time.time()
+            job.result = fn(*args, progress=job.report_progress)
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+            logger.info(f"Job {job.id} cancelled")
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                self._active -= 1
+                self._evict_finished()
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        job = self._jobs.get(job_id)
+        return None if job is None else job.to_dict()
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        if job.status not in FINISHED_STATES:
+            job.cancel_requested = True
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': self._active,
+                'max_pending': self.max_pending,
+                'max_workers': self.max_workers,
+                'tracked': len(self._jobs)
+            }
@@ -1,43 +1,85 @@
 import numpy as np
-import scipy.linalg as la
 import logging
 
+# scipy.linalg and the analysis module are imported on first design, so
+# importing this module (e.g. for lqr_control) stays cheap
+
 logger = logging.getLogger(__name__)
 
 def design_lqr(A, B, Q, R):
+    K, _, _ = solve_lqr(A, B, Q, R)
+    return K
+
+def solve_lqr(A, B, Q, R):
     # Check if the system is controllable
     if not is_controllable(A, B):
         logger.warning("System is not controllable!")
     
+    import scipy.linalg as la
+    
     # Solve the Riccati equation
     try:
         P = la.solve_continuous_are(A, B, Q, R)
         
-        # Calculate the LQR gain matrix
-        K = np.linalg.inv(R) @ B.T @ P
+        # Calculate the LQR gain matrix (R^-1 B^T P without forming the inverse)
+        K = np.linalg.solve(R, B.T @ P)
+        
+        # Closed-loop poles
+        eigenvalues = np.linalg.eigvals(A - B @ K)
         
         logger.info(f"LQR design successful. K shape: {K.shape}")
-        return K
+        return K, P, eigenvalues
     
     except Exception as e:
         logger.error(f"Error in LQR design: {e}")
         raise
 
-def is_controllable(A, B):
-    n = A.shape[0]  # System order
+def discretize_zoh(A, B, dt):
+    # Zero-order-hold discretization: exp([[A, B], [0, 0]] * dt) = [[Ad, Bd], [0, I]]
+    import scipy.linalg as la
+    n, m = B.shape
+    M = np.zeros((n + m, n + m))
+    M[:n, :n] = A
+    M[:n, n:] = B
+    E = la.expm(M * dt)
     
-    # Build the controllability matrix
-    C = B.copy()
-    A_power = np.eye(n)
+    return E[:n, :n].copy(), E[:n, n:].copy()
+
+def design_dlqr(A, B, Q, R, dt):
+    K, _, _ = solve_dlqr(A, B, Q, R, dt)
+    return K
+
+def solve_dlqr(A, B, Q, R, dt):
+    # Discrete-time LQR for the ZOH discretization of (A, B) at sample time dt
+    Ad, Bd = discretize_zoh(A, B, dt)
     
-    for i in range(1, n):
-        A_power = A_power @ A
-        C = np.hstack((C, A_power @ B))
+    if not is_controllable(Ad, Bd):
+        logger.warning("Discretized system is not controllable!")
     
-    # Check the rank of the controllability matrix
-    rank = np.linalg.matrix_rank(C)
+    import scipy.linalg as la
+    try:
+        P = la.solve_discrete_are(Ad, Bd, Q, R)
+        
+        # K = (R + Bd^T P Bd)^-1 Bd^T P Ad
+        BtP = Bd.T @ P
+        K = np.linalg.solve(R + BtP @ Bd, BtP @ Ad)
+        
+        # Closed-loop poles (inside the unit circle when stable)
+        eigenvalues = np.linalg.eigvals(Ad - Bd @ K)
+        
+        logger.info(f"Discrete LQR design successful. K shape: {K.shape}")
+        return K, P, eigenvalues
     
-    return rank == n
+    except Exception as e:
+        logger.error(f"Error in discrete LQR design: {e}")
+        raise
+
+def is_controllable(A, B):
+    # Orthogonal staircase reduction (see analysis.controllability_staircase):
+    # O(n^3) and numerically safer than the rank of [B, AB, ..., A^(n-1)B]
+    from analysis import controllable_dimension
+    n = A.shape[0]  # System order
+    return controllable_dimension(A, B) == n
 
 def lqr_control(state, reference, K):
     # Compute the error between current state and reference
@@ -47,3 +89,17 @@ def lqr_control(state, reference, K):
     u = -K @ error
     
     return u
+
+def lqr_control_batch(states, reference, K, out=None):
+    # Batched form of lqr_control: states is (N, n), reference is (n,) or (N, n)
+    # and K is either a shared (m, n) gain or one gain per trajectory (N, m, n)
+    error = states - reference
+    
+    if K.ndim == 2:
+        u = np.matmul(error, K.T, out=out)
+    else:
+        u = np.einsum('nij,nj->ni', K, error, out=out)
+    
+    np.negative(u, out=u)
+    
+    return u
@@ -1,10 +1,32 @@
 import os
+import time
+
+# Worker startup is measured from here (see STARTUP_IMPORT_SECONDS and warm_up)
+_import_started = time.perf_counter()
+
+import threading
 import logging
-from flask import Flask, render_template, jsonify, request
+from functools import partial
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
+import json
 import numpy as np
-from simulation import run_simulation
-from lqr_controller import design_lqr
+from simulation import run_simulation, run_simulation_stream, run_simulation_linear, run_simulation_lqi
+from riccati import design_lqi, integral_output_matrix, INTEGRAL_OUTPUTS
+from gain_cache import LQRGainCache
+from gain_schedule import GainSchedule, schedule_key
+from response_cache import ResponseCache, CachedResponse, response_cache_key
+from sweep import run_sweep
+from jobs import LocalJobBackend, QueueFull
+from encoding import (
+    JSON_MIMETYPE, BINARY_MIMETYPE, RESULT_MIMETYPES,
+    encode_json_result, encode_binary_result, encode_npz_result
+)
+from references import build_reference
+from disturbances import build_schedule
 from drone_model import linearize_model, get_state_space_matrices
+from utils import decimate_result, compute_performance_metrics
+import instrumentation
+from instrumentation import stage
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -13,6 +35,41 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key")
 
+# LQR designs are shared across requests; set LQR_CACHE_PATH to persist them on disk
+gain_cache = LQRGainCache(
+    max_entries=int(os.environ.get("LQR_CACHE_SIZE", 128)),
+    path=os.environ.get("LQR_CACHE_PATH")
+)
+
+# Encoded /run_simulation responses; RESPONSE_CACHE_PATH shares them between workers
+response_cache = ResponseCache(
+    max_bytes=int(os.environ.get("RESPONSE_CACHE_BYTES", 64 * 2**20)),
+    path=os.environ.get("RESPONSE_CACHE_PATH")
+)
+
+# Operating-point grid for mode='scheduled'; designed tables are kept per
+# airframe/weights and saved under GAIN_SCHEDULE_DIR when it is set
+SCHEDULE_AXES = {
+    'phi': np.linspace(-0.5, 0.5, 5),
+    'theta': np.linspace(-0.5, 0.5, 5)
+}
+gain_schedules = {}
+
+# One report figure per worker process, reused by /report under a lock
+report_renderer = None
+report_lock = threading.Lock()
+
+# Background simulation jobs with a bounded queue
+job_backend = LocalJobBackend(
+    max_workers=int(os.environ.get("JOB_WORKERS", 2)),
+    max_pending=int(os.environ.get("JOB_MAX_PENDING", 16))
+)
+
+# Integrator for the nonlinear simulations served here. The simulation
+# functions default to 'rk45' (solve_ivp per step); the service uses
+# fixed-step 'rk4', which stays within ~1e-6 of it at the default dt
+SIMULATION_INTEGRATOR = os.environ.get("SIMULATION_INTEGRATOR", "rk4")
+
 # Default drone parameters
 DEFAULT_PARAMS = {
     'Ixx': 0.0221, 
@@ -24,9 +81,254 @@ DEFAULT_PARAMS = {
     'dt': 0.01,
     'initial_state': np.zeros(12),
     'Q': np.diag([10, 10, 10, 1, 1, 1, 10, 10, 10, 1, 1, 1]),
-    'R': np.diag([1, 1, 1, 1])
+    'R': np.diag([1, 1, 1, 1]),
+    'Q_i': np.diag([1, 1, 1])  # Integral position-error weights (mode='lqi')
 }
 
+def merge_params(data):
+    """Merge request values over DEFAULT_PARAMS."""
+    params = DEFAULT_PARAMS.copy()
+    
+    # Update parameters if provided in request
+    for key in params:
+        if key in data:
+            if key == 'initial_state':
+                params[key] = np.array(data[key])
+            else:
+                params[key] = float(data[key]) if key != 'dt' else float(data[key])
+    
+    # Handle diagonal Q and R matrices if provided
+    if 'Q_diag' in data:
+        params['Q'] = np.diag(data['Q_diag'])
+    if 'R_diag' in data:
+        params['R'] = np.diag(data['R_diag'])
+    if 'Qi_diag' in data:
+        params['Q_i'] = np.diag(data['Qi_diag'])
+    
+    # Optional tracking reference spec, e.g. {"type": "circle", "radius": 1.0}
+    if data.get('reference'):
+        params['reference'] = data['reference']
+    
+    # Optional disturbance/event schedule, e.g. [{"type": "gust", "time": 5, ...}]
+    if data.get('disturbances'):
+        params['disturbances'] = data['disturbances']
+    
+    return params
+
+def get_gain_schedule(params):
+    """Gain schedule for the requested airframe and weights (designed once)."""
+    key = schedule_key(params, params['Q'], params['R'], SCHEDULE_AXES)
+    schedule = gain_schedules.get(key)
+    if schedule is None:
+        schedule = GainSchedule.load_or_design(
+            params, params['Q'], params['R'], SCHEDULE_AXES,
+            cache_dir=os.environ.get("GAIN_SCHEDULE_DIR")
+        )
+        # Keep a bounded number of tables in memory
+        if len(gain_schedules) >= 16:
+            gain_schedules.pop(next(iter(gain_schedules)))
+        gain_schedules[key] = schedule
+    return schedule
+
+# Values accepted for a request's 'mode' (see simulate)
+SIMULATION_MODES = ('nonlinear', 'linear', 'scheduled', 'lqi')
+
+def request_mode(data):
+    """The request's simulation mode, defaulting to 'nonlinear'."""
+    mode = data.get('mode', 'nonlinear')
+    if mode not in SIMULATION_MODES:
+        raise ValueError(f"Unknown simulation mode '{mode}'. Available: {', '.join(SIMULATION_MODES)}")
+    return mode
+
+def simulate(params, progress=None, mode='nonlinear'):
+    """Design the controller and run one simulation; returns the result arrays.
+
+    mode='linear' uses a discrete LQR and the precomputed closed-loop transition
+    matrix instead of integrating the nonlinear model (fast preview).
+    mode='scheduled' interpolates LQR gains designed over SCHEDULE_AXES
+    (roll/pitch operating points) instead of using the hover design.
+    mode='lqi' adds integral action on the position error (weights Q_i); its
+    K and 'states' carry the integral states after the 12 plant states.
+    """
+    # Tracking reference (hover when absent), evaluated once for the whole run
+    reference = build_reference(params['reference']) if params.get('reference') else None
+    
+    # Disturbance schedule, compiled by the simulation loop
+    disturbances = build_schedule(params['disturbances']) if params.get('disturbances') else None
+    if disturbances is not None and mode not in ('nonlinear', 'scheduled'):
+        raise ValueError(f"Disturbance schedules are not supported in mode '{mode}'")
+    
+    # Create state space model
+    with stage('state_space'):
+        A, B = get_state_space_matrices(
+            params['Ixx'], params['Iyy'], params['Izz'], 
+            params['mass'], params['g']
+        )
+    
+    if mode == 'linear':
+        # Discrete LQR (cached on A, B, Q, R, dt) and closed-loop propagation
+        with stage('design_lqr'):
+            K = gain_cache.get(A, B, params['Q'], params['R'], dt=params['dt']).K
+        with stage('simulation'):
+            result = run_simulation_linear(
+                A, B, K,
+                params['initial_state'],
+                params['simulation_time'],
+                params['dt'],
+                reference_state=reference
+            )
+    elif mode == 'nonlinear':
+        # Design LQR controller (cached on A, B, Q, R)
+        with stage('design_lqr'):
+            K = gain_cache.get(A, B, params['Q'], params['R']).K
+        
+        # Run simulation, splitting loop time into control and integration
+        loop_timings = {}
+        with stage('simulation'):
+            result = run_simulation(
+                A, B, K, 
+                params['initial_state'], 
+                params['simulation_time'], 
+                params['dt'],
+                reference_state=reference,
+                integrator=SIMULATION_INTEGRATOR,
+                progress=progress,
+                timings=loop_timings,
+                disturbances=disturbances
+            )
+        instrumentation.record_stage('control', loop_timings['control'])
+        instrumentation.record_stage('integrator', loop_timings['integrator'])
+        instrumentation.increment('integration_fallbacks_total', loop_timings['fallbacks'],
+                                  'Steps that fell back to the linear model')
+    elif mode == 'scheduled':
+        with stage('design_lqr'):
+            K = get_gain_schedule(params)
+        with stage('simulation'):
+            result = run_simulation(
+                A, B, K,
+                params['initial_state'],
+                params['simulation_time'],
+                params['dt'],
+                reference_state=reference,
+                integrator=SIMULATION_INTEGRATOR,
+                progress=progress,
+                disturbances=disturbances
+            )
+        # Report the gain at the first operating point
+        K = K.gain(params['initial_state'], params)
+    elif mode == 'lqi':
+        # Integral LQR on the augmented model (cached like the plain design)
+        C = integral_output_matrix(INTEGRAL_OUTPUTS, A.shape[0])
+        with stage('design_lqr'):
+            gains = design_lqi(A, B, C, params['Q'], params['R'], params['Q_i'], cache=gain_cache)
+        K = gains.K
+        with stage('simulation'):
+            result = run_simulation_lqi(
+                A, B, gains, C,
+                params['initial_state'],
+                params['simulation_time'],
+                params['dt'],
+                reference_state=reference,
+                integrator=SIMULATION_INTEGRATOR,
+                progress=progress
+            )
+    else:
+        raise ValueError(f"Unknown simulation mode '{mode}'")
+    
+    # Raw arrays; encoded per the client's Accept header by the caller
+    return {
+        'time': result['time'],
+        'states': result['states'],
+        'inputs': result['inputs'],
+        'reference': result['reference'],
+        'error': result['error'],
+        'K': K
+    }
+
+def simulate_json(params, progress=None, mode='nonlinear'):
+    """Run one simulation and return it as nested lists (the JSON format)."""
+    return encode_json_result(simulate(params, progress, mode=mode))
+
+def result_format():
+    """Negotiate the result mimetype (Accept) and wire dtype (?dtype=)."""
+    mimetype = request.accept_mimetypes.best_match(RESULT_MIMETYPES, default=JSON_MIMETYPE)
+    if mimetype == JSON_MIMETYPE:
+        return mimetype, None
+    
+    dtype = request.args.get('dtype', 'float32')
+    if dtype not in ('float32', 'float64'):
+        raise ValueError(f"Unsupported dtype '{dtype}'")
+    return mimetype, dtype
+
+def result_metrics(result):
+    """Performance metrics of a full-resolution result (JSON-safe, inf -> None)."""
+    return {
+        name: float(value) if np.isfinite(value) else None
+        for name, value in compute_performance_metrics(result).items()
+    }
+
+def result_response(result, mimetype=None, dtype=None, metrics=None):
+    """Encode a simulation result as JSON, raw binary or npz based on Accept.
+
+    metrics (see result_metrics) travel next to 'result' in the JSON body and
+    in the binary header; npz carries arrays only.
+    """
+    if mimetype is None:
+        mimetype, dtype = result_format()
+    
+    if mimetype == JSON_MIMETYPE:
+        with stage('encode'):
+            body = {
+                'success': True,
+                'result': encode_json_result(result)
+            }
+            if metrics is not None:
+                body['metrics'] = metrics
+            return jsonify(body)
+    
+    with stage('encode'):
+        if mimetype == BINARY_MIMETYPE:
+            meta = {'success': True}
+            if metrics is not None:
+                meta['metrics'] = metrics
+            body = encode_binary_result(result, dtype, meta=meta)
+        else:
+            body = encode_npz_result(result, dtype)
+    
+    response = app.response_class(body, mimetype=mimetype)
+    response.headers['Vary'] = 'Accept'
+    return response
+
+@app.before_request
+def start_request_timing():
+    request.environ['drone.start_time'] = time.perf_counter()
+    instrumentation.start_request()
+
+@app.after_request
+def add_server_timing(response):
+    start = request.environ.get('drone.start_time')
+    if start is None:
+        return response
+    total = time.perf_counter() - start
+    timings = instrumentation.finish_request(request.endpoint or 'unknown', total)
+    response.headers['Server-Timing'] = instrumentation.server_timing_header(timings, total)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Aggregated stage histograms and counters in Prometheus text format."""
+    registry = instrumentation.registry
+    for name, value in gain_cache.stats().items():
+        registry.set_gauge(f'lqr_cache_{name}', float(value), help_text='LQR gain cache statistics')
+    for name, value in response_cache.stats().items():
+        registry.set_gauge(f'response_cache_{name}', float(value), help_text='Response cache statistics')
+    for name, value in job_backend.stats().items():
+        registry.set_gauge(f'jobs_{name}', float(value), help_text='Simulation job backend statistics')
+    registry.set_gauge('startup_import_seconds', STARTUP_IMPORT_SECONDS,
+                       help_text='Seconds spent importing the app in this worker')
+    
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     """Render the main simulation page."""
@@ -38,60 +340,294 @@ def start_simulation():
     try:
         # Get parameters from request or use defaults
         data = request.json or {}
-        params = DEFAULT_PARAMS.copy()
+        params = merge_params(data)
+        mode = request_mode(data)
+        mimetype, dtype = result_format()
         
-        # Update parameters if provided in request
-        for key in params:
-            if key in data:
-                if key == 'initial_state':
-                    params[key] = np.array(data[key])
-                else:
-                    params[key] = float(data[key]) if key != 'dt' else float(data[key])
+        # Runs are deterministic, so the key of everything that shapes the body
+        # doubles as its ETag
+        key = response_cache_key(
+            params, mode=mode, integrator=SIMULATION_INTEGRATOR, max_points=data.get('max_points'),
+            lod_method=data.get('lod_method', 'lttb'), mimetype=mimetype, dtype=dtype
+        )
+        if request.if_none_match.contains(key):
+            response = app.response_class(status=304)
+            response.set_etag(key)
+            response.headers['Vary'] = 'Accept'
+            return response
         
-        # Handle diagonal Q and R matrices if provided
-        if 'Q_diag' in data:
-            params['Q'] = np.diag(data['Q_diag'])
-        if 'R_diag' in data:
-            params['R'] = np.diag(data['R_diag'])
+        with stage('response_cache'):
+            cached = response_cache.get(key)
         
-        # Create state space model
-        A, B = get_state_space_matrices(
-            params['Ixx'], params['Iyy'], params['Izz'], 
-            params['mass'], params['g']
-        )
+        if cached is None:
+            result = simulate(params, mode=mode)
+            
+            # Metrics come from the full-resolution run, before any decimation
+            with stage('metrics'):
+                metrics = result_metrics(result)
+            
+            # Optional level of detail for charting
+            if data.get('max_points'):
+                with stage('decimate'):
+                    result = decimate_result(result, int(data['max_points']), data.get('lod_method', 'lttb'))
+            
+            response = result_response(result, mimetype, dtype, metrics=metrics)
+            response_cache.put(key, CachedResponse(response.get_data(), response.mimetype, key))
+            response.headers['X-Cache'] = 'MISS'
+        else:
+            response = app.response_class(cached.body, mimetype=cached.mimetype)
+            response.headers['X-Cache'] = 'HIT'
         
-        # Design LQR controller
-        K = design_lqr(A, B, params['Q'], params['R'])
+        response.set_etag(key)
+        response.headers['Vary'] = 'Accept'
+        return response
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    except Exception as e:
+        logger.exception("Error in simulation")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/report', methods=['POST'])
+def report():
+    """Run one simulation and return its plot report (?format=png|svg|pdf)."""
+    global report_renderer
+    # matplotlib is only loaded by workers that serve reports
+    from reports import ReportRenderer, REPORT_FORMATS
+    try:
+        data = request.json or {}
+        params = merge_params(data)
+        fmt = request.args.get('format', data.get('format', 'png')).lower()
+        if fmt not in REPORT_FORMATS:
+            return jsonify({
+                'success': False,
+                'error': f"Unsupported report format '{fmt}'. Available: {', '.join(REPORT_FORMATS)}"
+            }), 400
         
-        # Run simulation
-        result = run_simulation(
-            A, B, K, 
-            params['initial_state'], 
-            params['simulation_time'], 
-            params['dt']
-        )
+        result = simulate(params, mode=request_mode(data))
+        with stage('report'), report_lock:
+            if report_renderer is None:
+                report_renderer = ReportRenderer()
+            body = report_renderer.render(result, format=fmt)
+        return app.response_class(body, mimetype=REPORT_FORMATS[fmt])
+    
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    except Exception as e:
+        logger.exception("Error in report")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/sweep', methods=['POST'])
+def start_sweep():
+    """Evaluate controller metrics over a grid of Q/R and airframe parameters."""
+    try:
+        data = request.json or {}
+        if not data.get('grid'):
+            return jsonify({
+                'success': False,
+                'error': "Missing 'grid' specification"
+            }), 400
         
-        # Format results for JSON response
-        formatted_result = {
-            'time': result['time'].tolist(),
-            'states': result['states'].tolist(),
-            'inputs': result['inputs'].tolist(),
-            'reference': result['reference'].tolist(),
-            'error': result['error'].tolist(),
-            'K': K.tolist()
-        }
+        # Non-grid keys override the defaults for every point
+        params = merge_params(data)
+        params['controller'] = data.get('controller', 'lqr')
+        table = run_sweep(params, data['grid'])
         
         return jsonify({
             'success': True,
-            'result': formatted_result
+            'result': table
         })
     
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
     except Exception as e:
-        logger.exception("Error in simulation")
+        logger.exception("Error in sweep")
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a simulation and return its job id without waiting for it."""
+    try:
+        data = request.json or {}
+        params = merge_params(data)
+        mode = request_mode(data)
+        total_steps = len(np.arange(0, params['simulation_time'], params['dt']))
+        job_id = job_backend.submit(partial(simulate_json, mode=mode), params, total_steps=total_steps)
+        
+        return jsonify({
+            'success': True,
+            'job_id': job_id
+        }), 202
+    
+    except QueueFull as e:
+        # Backpressure: tell the client to come back later instead of stalling
+        response = jsonify({
+            'success': False,
+            'error': str(e)
+        })
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    except Exception as e:
+        logger.exception("Error submitting job")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Report job progress, and the result once it has finished."""
+    job = job_backend.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Unknown job'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'job': job
+    })
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Request cancellation of a queued or running job."""
+    if not job_backend.cancel(job_id):
+        return jsonify({
+            'success': False,
+            'error': 'Unknown job'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'job': job_backend.get(job_id)
+    })
+
+def sse_event(event, payload):
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@app.route('/stream_simulation', methods=['GET', 'POST'])
+def stream_simulation():
+    """Stream simulation chunks as Server-Sent Events while the run advances."""
+    # EventSource can only GET, so parameters may also come as ?params=<json>
+    try:
+        if request.method == 'POST':
+            data = request.json or {}
+        else:
+            data = json.loads(request.args.get('params', '{}'))
+        
+        params = merge_params(data)
+        chunk_size = int(data.get('chunk_size', 250))
+        
+        # The stream runs the plain nonlinear loop; other options would be ignored
+        mode = request_mode(data)
+        if mode != 'nonlinear':
+            raise ValueError(f"Streaming supports mode 'nonlinear' only, not '{mode}'; use /run_simulation or /jobs")
+        if params.get('disturbances'):
+            raise ValueError("Streaming does not support disturbances; use /run_simulation or /jobs")
+    except Exception as e:
+        # Bad parameters are reported before any event is streamed
+        logger.warning(f"Invalid stream parameters: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    def generate():
+        try:
+            A, B = get_state_space_matrices(
+                params['Ixx'], params['Iyy'], params['Izz'],
+                params['mass'], params['g']
+            )
+            K = gain_cache.get(A, B, params['Q'], params['R']).K
+            num_steps = len(np.arange(0, params['simulation_time'], params['dt']))
+            
+            yield sse_event('meta', {
+                'K': K.tolist(),
+                'dt': params['dt'],
+                'total_steps': num_steps
+            })
+            
+            reference = build_reference(params['reference']) if params.get('reference') else None
+            for chunk in run_simulation_stream(
+                A, B, K,
+                params['initial_state'],
+                params['simulation_time'],
+                params['dt'],
+                reference_state=reference,
+                integrator=SIMULATION_INTEGRATOR,
+                chunk_size=chunk_size
+            ):
+                yield sse_event('chunk', encode_json_result(chunk))
+            
+            yield sse_event('end', {'success': True})
+        
+        except Exception as e:
+            logger.exception("Error in streamed simulation")
+            yield sse_event('error', {'success': False, 'error': str(e)})
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def warm_up():
+    """Design the default LQR and run short simulations before serving traffic.
+
+    Called by gunicorn's post_worker_init hook (gunicorn.conf.py), so the
+    first request of a new worker does not pay for scipy imports, the
+    default Riccati solve or first-call overheads. Returns the seconds taken.
+    """
+    start = time.perf_counter()
+    params = DEFAULT_PARAMS
+    A, B = get_state_space_matrices(
+        params['Ixx'], params['Iyy'], params['Izz'],
+        params['mass'], params['g']
+    )
+    
+    # Default continuous and discrete designs land in the gain cache
+    K = gain_cache.get(A, B, params['Q'], params['R']).K
+    K_d = gain_cache.get(A, B, params['Q'], params['R'], dt=params['dt']).K
+    
+    # A few steps of the nonlinear and linear paths plus the JSON encoder
+    initial_state = np.zeros(12)
+    initial_state[0:3] = 0.1
+    result = run_simulation(A, B, K, initial_state, 10 * params['dt'], params['dt'],
+                            integrator=SIMULATION_INTEGRATOR)
+    run_simulation_linear(A, B, K_d, initial_state, 10 * params['dt'], params['dt'])
+    encode_json_result({name: result[name] for name in ('time', 'states', 'inputs', 'reference', 'error')})
+    
+    seconds = time.perf_counter() - start
+    instrumentation.registry.set_gauge('startup_warmup_seconds', seconds,
+                                       help_text='Seconds spent warming caches before serving')
+    logger.info(f"Worker warmed up in {seconds:.3f}s (imports took {STARTUP_IMPORT_SECONDS:.3f}s)")
+    return seconds
+
+# Seconds spent importing this module and everything it pulls in
+STARTUP_IMPORT_SECONDS = time.perf_counter() - _import_started
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,214 @@
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Named groups of state columns that can be recorded
+STATE_CHANNELS = {
+    'position': (0, 1, 2),
+    'velocity': (3, 4, 5),
+    'attitude': (6, 7, 8),
+    'rates': (9, 10, 11)
+}
+
+class RecordingSpec:
+    """What a simulation keeps in its history.
+
+    states: 'all', None (no state history) or a list of channel names from
+        STATE_CHANNELS and/or state indices.
+    inputs: whether to keep the control input history.
+    stride: keep every stride-th sample (the last sample is always kept).
+    store: optional trajectory_store.MemmapTrajectoryStore; histories are then
+        written to memory-mapped files instead of RAM (one store per run).
+
+    'reference' and 'error' are never stored; SimulationResult derives them
+    from the recorded states when they are accessed.
+    """
+
+    def __init__(self, states='all', inputs=True, stride=1, store=None):
+        if stride < 1:
+            raise ValueError("stride must be at least 1")
+        if states is not None and not isinstance(states, str) and len(states) == 0:
+            raise ValueError("Empty state selection; use states=None to record no states")
+        self.states = states
+        self.inputs = inputs
+        self.stride = int(stride)
+        self.store = store
+
+    @classmethod
+    def none(cls):
+        # Metrics-only runs: nothing but the final state is kept
+        return cls(states=None, inputs=False)
+
+    def state_indices(self, n_states):
+        if self.states is None:
+            return None
+        if self.states == 'all':
+            return slice(None)
+
+        indices = []
+        for channel in self.states:
+            if isinstance(channel, str):
+                if channel not in STATE_CHANNELS:
+                    raise ValueError(f"Unknown state channel '{channel}'")
+                indices.extend(STATE_CHANNELS[channel])
+            else:
+                indices.append(int(channel))
+        indices = sorted(set(indices))
+
+        # Contiguous selections become slices so recording a row never copies twice
+        if indices == list(range(indices[0], indices[-1] + 1)):
+            return slice(indices[0], indices[-1] + 1)
+        return np.array(indices)
+
+DEFAULT_RECORDING = RecordingSpec()
+
+class Recorder:
+    """Preallocated history buffers for one run, filled according to a RecordingSpec."""
+
+    def __init__(self, spec, time, n_states, n_inputs=4, batch_shape=()):
+        self.spec = spec
+        self.stride = spec.stride
+        num_steps = len(time)
+
+        # Recorded sample numbers: every stride-th plus the final one
+        steps = np.arange(0, num_steps, self.stride)
+        if num_steps and steps[-1] != num_steps - 1:
+            steps = np.append(steps, num_steps - 1)
+        self.steps = steps
+        self.last_step = num_steps - 1
+        self.n_states = n_states
+        self.batch_shape = batch_shape
+
+        self.store = spec.store
+        if self.store is not None:
+            self.time = self.store.save('time', time[steps])
+        else:
+            self.time = time[steps]
+
+        self.state_idx = spec.state_indices(n_states)
+        if self.state_idx is None:
+            self.states = None
+        else:
+            width = len(np.arange(n_states)[self.state_idx])
+            self.states = self._allocate('states', (len(steps),) + batch_shape + (width,))
+
+        self.inputs = self._allocate('inputs', (len(steps),) + batch_shape + (n_inputs,)) if spec.inputs else None
+
+    def _allocate(self, name, shape):
+        if self.store is not None:
+            return self.store.allocate(name, shape)
+        return np.zeros(shape)
+
+    def record(self, i, state, u):
+        if i % self.stride:
+            if i != self.last_step:
+                return
+            row = len(self.steps) - 1
+        else:
+            row = i // self.stride
+
+        if self.states is not None:
+            self.states[row] = state[..., self.state_idx]
+        if self.inputs is not None:
+            self.inputs[row] = u
+
+    def result(self, reference_state, final_state):
+        # reference_state is constant, or one row per simulated step (trajectory
+        # tracking), in which case only the recorded rows are kept
+        reference_state = np.asarray(reference_state, dtype=float)
+        time_varying = reference_state.ndim == len(self.batch_shape) + 2
+        if time_varying:
+            reference_state = reference_state[self.steps]
+
+        arrays = {'time': self.time}
+        if self.states is not None:
+            arrays['states'] = self.states
+        if self.inputs is not None:
+            arrays['inputs'] = self.inputs
+
+        if self.store is not None:
+            state_indices = None
+            if self.state_idx is not None:
+                state_indices = np.arange(self.n_states)[self.state_idx]
+            if time_varying:
+                # Trajectories go next to the histories, not into the JSON metadata
+                reference_state = self.store.save('reference', reference_state)
+                self.store.finalize(reference_state=None, final_state=final_state,
+                                    state_indices=state_indices)
+            else:
+                self.store.finalize(reference_state=reference_state, final_state=final_state,
+                                    state_indices=state_indices)
+
+        return SimulationResult(arrays, reference_state, final_state, recording=self.spec,
+                                state_indices=self.state_idx, time_varying=time_varying)
+
+class SimulationResult(dict):
+    """Simulation result dict whose 'reference' and 'error' entries are derived lazily.
+
+    Stored keys are 'time' plus 'states'/'inputs' when recorded. Accessing
+    'reference' gives a read-only broadcast of the constant reference (or the
+    recorded rows of a tracked trajectory) and 'error' is computed from the
+    recorded states on first use.
+
+    The stored arrays may be np.memmap views (see trajectory_store); use
+    error_chunk() to get error rows without materializing the whole history.
+    """
+
+    DERIVED = ('reference', 'error')
+
+    def __init__(self, arrays, reference_state, final_state, recording=None, state_indices=slice(None),
+                 time_varying=False):
+        super().__init__(arrays)
+        self.recording = recording
+        self.state_indices = state_indices
+        self.final_state = final_state
+        self.time_varying = time_varying
+        if not isinstance(reference_state, np.memmap):
+            reference_state = np.asarray(reference_state, dtype=float)
+        self._reference_state = reference_state
+
+    @property
+    def full_state(self):
+        # Whether 'states' (and so 'error') has every state column; subset
+        # recordings keep only the columns in state_indices
+        states = dict.get(self, 'states')
+        return states is not None and states.shape[-1] == self._reference_state.shape[-1]
+
+    @property
+    def out_of_core(self):
+        return isinstance(dict.get(self, 'states'), np.memmap)
+
+    def error_chunk(self, start, stop):
+        # Error rows [start, stop) only; uses the cached history if it exists
+        if dict.__contains__(self, 'error'):
+            return dict.__getitem__(self, 'error')[start:stop]
+        states = dict.__getitem__(self, 'states')[start:stop]
+        reference = self._reference_state[start:stop] if self.time_varying else self._reference_state
+        return states - reference[..., self.state_indices]
+
+    def __missing__(self, key):
+        if key not in self.DERIVED or 'states' not in self:
+            raise KeyError(key)
+
+        states = dict.__getitem__(self, 'states')
+        reference = np.broadcast_to(self._reference_state[..., self.state_indices], states.shape)
+
+        if key == 'reference':
+            return reference
+
+        # Cache the error history once it has been materialized
+        error = states - reference
+        self['error'] = error
+        return error
+
+    def __contains__(self, key):
+        if key in self.DERIVED:
+            return dict.__contains__(self, 'states')
+        return dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
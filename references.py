@@ -0,0 +1,288 @@
+import io
+import math
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Reference generators for trajectory tracking. Each one evaluates the full
+# (T, 12) reference for a time vector in one vectorized call (evaluate) or
+# chunk by chunk (chunks), so simulation loops only index precomputed rows.
+# Generated references set position (0:3), optionally velocity (3:6), and yaw (8).
+
+N_STATES = 12
+
+class ReferenceGenerator:
+    def __init__(self, yaw=0.0, track_velocity=True):
+        self.yaw = float(yaw)
+        self.track_velocity = track_velocity
+
+    def position_velocity(self, time):
+        # (T, 3) positions and (T, 3) velocities for a time vector
+        raise NotImplementedError
+
+    def evaluate(self, time, out=None):
+        time = np.asarray(time, dtype=float)
+        if out is None:
+            out = np.zeros((len(time), N_STATES))
+        position, velocity = self.position_velocity(time)
+        out[:, 0:3] = position
+        if self.track_velocity:
+            out[:, 3:6] = velocity
+        out[:, 8] = self.yaw
+        return out
+
+    def chunks(self, time, chunk_size=500):
+        # Lazy evaluation for streaming: yields (start, rows) without building the full array
+        for start in range(0, len(time), chunk_size):
+            yield start, self.evaluate(time[start:start + chunk_size])
+
+class CircleReference(ReferenceGenerator):
+    """Horizontal circle of `radius` around `center`, one lap per `period` seconds."""
+
+    def __init__(self, radius=1.0, period=10.0, center=(0.0, 0.0, 0.0), **kwargs):
+        super().__init__(**kwargs)
+        if period <= 0:
+            raise ValueError("period must be positive")
+        self.radius = float(radius)
+        self.omega = 2 * math.pi / float(period)
+        self.center = np.asarray(center, dtype=float)
+
+    def position_velocity(self, time):
+        angle = self.omega * time
+        c, s = np.cos(angle), np.sin(angle)
+        position = np.empty((len(time), 3))
+        position[:, 0] = self.center[0] + self.radius * c
+        position[:, 1] = self.center[1] + self.radius * s
+        position[:, 2] = self.center[2]
+        velocity = np.zeros((len(time), 3))
+        velocity[:, 0] = -self.radius * self.omega * s
+        velocity[:, 1] = self.radius * self.omega * c
+        return position, velocity
+
+class LemniscateReference(ReferenceGenerator):
+    """Figure-eight (lemniscate of Gerono) of half-width `size` around `center`."""
+
+    def __init__(self, size=1.0, period=12.0, center=(0.0, 0.0, 0.0), **kwargs):
+        super().__init__(**kwargs)
+        if period <= 0:
+            raise ValueError("period must be positive")
+        self.size = float(size)
+        self.omega = 2 * math.pi / float(period)
+        self.center = np.asarray(center, dtype=float)
+
+    def position_velocity(self, time):
+        angle = self.omega * time
+        position = np.empty((len(time), 3))
+        position[:, 0] = self.center[0] + self.size * np.sin(angle)
+        position[:, 1] = self.center[1] + 0.5 * self.size * np.sin(2 * angle)
+        position[:, 2] = self.center[2]
+        velocity = np.zeros((len(time), 3))
+        velocity[:, 0] = self.size * self.omega * np.cos(angle)
+        velocity[:, 1] = self.size * self.omega * np.cos(2 * angle)
+        return position, velocity
+
+def _check_waypoints(times, points):
+    times = np.asarray(times, dtype=float)
+    points = np.asarray(points, dtype=float)
+    if points.ndim != 2 or points.shape[1] != 3:
+        raise ValueError("Waypoints must be a list of [x, y, z] points")
+    if len(times) != len(points) or len(times) < 2:
+        raise ValueError("Need at least two waypoints and one time per waypoint")
+    if np.any(np.diff(times) <= 0):
+        raise ValueError("Waypoint times must be strictly increasing")
+    return times, points
+
+class WaypointSplineReference(ReferenceGenerator):
+    """Clamped cubic spline through waypoints; holds the last waypoint afterwards."""
+
+    def __init__(self, times, points, **kwargs):
+        super().__init__(**kwargs)
+        self.times, self.points = _check_waypoints(times, points)
+        from scipy.interpolate import CubicSpline
+        self.spline = CubicSpline(self.times, self.points, axis=0, bc_type='clamped')
+        self.derivative = self.spline.derivative()
+
+    def position_velocity(self, time):
+        clamped = np.clip(time, self.times[0], self.times[-1])
+        velocity = self.derivative(clamped)
+        velocity[(time < self.times[0]) | (time > self.times[-1])] = 0.0
+        return self.spline(clamped), velocity
+
+class MinimumSnapReference(ReferenceGenerator):
+    """Minimum-snap trajectory through waypoints, at rest at both ends.
+
+    The minimum-snap solution with fixed waypoint times is the C6 spline of
+    degree 7, so the coefficients come from one square linear system (8 per
+    segment) shared by all three axes instead of an iterative QP.
+    """
+
+    ORDER = 8  # coefficients per segment (degree 7)
+
+    def __init__(self, times, points, **kwargs):
+        super().__init__(**kwargs)
+        self.times, self.points = _check_waypoints(times, points)
+        self.durations = np.diff(self.times)
+        self.coefficients = self._solve()
+
+    @staticmethod
+    def _derivative_row(d, s, order):
+        # d-th derivative of [1, s, s^2, ...] w.r.t. s
+        row = np.zeros(order)
+        for k in range(d, order):
+            row[k] = math.factorial(k) / math.factorial(k - d) * s ** (k - d)
+        return row
+
+    def _solve(self):
+        order = self.ORDER
+        segments = len(self.durations)
+        h = self.durations
+        size = order * segments
+        M = np.zeros((size, size))
+        rhs = np.zeros((size, 3))
+        row = 0
+
+        # Segments use local time s in [0, 1]; d/dt = (1/h) d/ds
+        for j in range(segments):
+            cols = slice(j * order, (j + 1) * order)
+            M[row, cols] = self._derivative_row(0, 0.0, order)
+            rhs[row] = self.points[j]
+            row += 1
+            M[row, cols] = self._derivative_row(0, 1.0, order)
+            rhs[row] = self.points[j + 1]
+            row += 1
+
+        # At rest (zero velocity, acceleration and jerk) at both ends
+        last = slice((segments - 1) * order, segments * order)
+        for d in range(1, 4):
+            M[row, 0:order] = self._derivative_row(d, 0.0, order)
+            row += 1
+            M[row, last] = self._derivative_row(d, 1.0, order)
+            row += 1
+
+        # Continuity of derivatives 1..6 at interior waypoints
+        for j in range(1, segments):
+            for d in range(1, order - 1):
+                M[row, (j - 1) * order:j * order] = self._derivative_row(d, 1.0, order) / h[j - 1] ** d
+                M[row, j * order:(j + 1) * order] = -self._derivative_row(d, 0.0, order) / h[j] ** d
+                row += 1
+
+        return np.linalg.solve(M, rhs).reshape(segments, order, 3)
+
+    def position_velocity(self, time):
+        segment = np.clip(np.searchsorted(self.times, time, side='right') - 1, 0, len(self.durations) - 1)
+        h = self.durations[segment]
+        s = np.clip((time - self.times[segment]) / h, 0.0, 1.0)[:, None]
+        coefficients = self.coefficients[segment]
+
+        # Horner's rule over all samples at once
+        position = coefficients[:, -1]
+        velocity = (self.ORDER - 1) * coefficients[:, -1]
+        for k in range(self.ORDER - 2, -1, -1):
+            position = position * s + coefficients[:, k]
+            if k > 0:
+                velocity = velocity * s + k * coefficients[:, k]
+        velocity = velocity / h[:, None]
+
+        velocity[(time < self.times[0]) | (time > self.times[-1])] = 0.0
+        return position, velocity
+
+class SampledPathReference(ReferenceGenerator):
+    """Piecewise-linear path through timed samples (e.g. an uploaded CSV)."""
+
+    def __init__(self, times, points, **kwargs):
+        super().__init__(**kwargs)
+        self.times, self.points = _check_waypoints(times, points)
+        self.slopes = np.diff(self.points, axis=0) / np.diff(self.times)[:, None]
+
+    def position_velocity(self, time):
+        position = np.column_stack([np.interp(time, self.times, self.points[:, k]) for k in range(3)])
+        segment = np.clip(np.searchsorted(self.times, time, side='right') - 1, 0, len(self.slopes) - 1)
+        velocity = self.slopes[segment]
+        velocity[(time < self.times[0]) | (time >= self.times[-1])] = 0.0
+        return position, velocity
+
+def load_csv_path(source, **kwargs):
+    # CSV with columns t, x, y, z (header optional); source is CSV text or a file object
+    text = source.read() if hasattr(source, 'read') else source
+    if isinstance(text, bytes):
+        text = text.decode()
+    lines = [line for line in text.strip().splitlines() if line.strip()]
+    if not lines:
+        raise ValueError("Empty CSV path")
+
+    columns = {'t': 0, 'x': 1, 'y': 2, 'z': 3}
+    first = [token.strip().lower() for token in lines[0].split(',')]
+    try:
+        [float(token) for token in first]
+    except ValueError:
+        # Header row: locate the columns by name
+        names = {'time': 't'}
+        first = [names.get(token, token) for token in first]
+        missing = [name for name in columns if name not in first]
+        if missing:
+            raise ValueError(f"CSV path is missing columns: {', '.join(missing)}")
+        columns = {name: first.index(name) for name in columns}
+        lines = lines[1:]
+
+    data = np.loadtxt(io.StringIO("\n".join(lines)), delimiter=',', ndmin=2)
+    return SampledPathReference(
+        data[:, columns['t']],
+        data[:, [columns['x'], columns['y'], columns['z']]],
+        **kwargs
+    )
+
+REFERENCE_TYPES = {
+    'circle': CircleReference,
+    'lemniscate': LemniscateReference,
+    'waypoints': WaypointSplineReference,
+    'min_snap': MinimumSnapReference,
+    'path': SampledPathReference
+}
+
+def build_reference(spec):
+    """Reference generator from a JSON spec such as {"type": "circle", "radius": 2}.
+
+    Waypoint types take "times" and "points"; "csv" takes the file text as
+    "data". "yaw" and "track_velocity" apply to every type. A spec of type
+    "constant" (with "state") returns the constant 12-vector itself.
+    """
+    spec = dict(spec)
+    kind = spec.pop('type', None)
+
+    if kind == 'constant':
+        return np.asarray(spec.get('state', np.zeros(N_STATES)), dtype=float)
+    if kind == 'csv' and 'data' not in spec:
+        raise ValueError("csv reference requires 'data'")
+    if kind not in REFERENCE_TYPES and kind != 'csv':
+        raise ValueError(f"Unknown reference type '{kind}'. "
+                         f"Available: constant, csv, {', '.join(REFERENCE_TYPES)}")
+    try:
+        if kind == 'csv':
+            return load_csv_path(spec.pop('data'), **spec)
+        return REFERENCE_TYPES[kind](**spec)
+    except TypeError as e:
+        raise ValueError(f"Invalid '{kind}' reference: {e}")
+
+def resolve_reference(reference, time, n_states):
+    # Constant (n,) vector or precomputed (T, n) rows for the whole time vector
+    if reference is None:
+        return np.zeros(n_states)
+    if isinstance(reference, ReferenceGenerator):
+        if n_states != N_STATES:
+            raise ValueError(f"Reference generators produce {N_STATES}-state references")
+        return reference.evaluate(time)
+
+    reference = np.asarray(reference, dtype=float)
+    if reference.ndim == 2 and reference.shape != (len(time), n_states):
+        raise ValueError(f"Reference array must be {len(time)}x{n_states}, got "
+                         f"{reference.shape[0]}x{reference.shape[1]}")
+    return reference
+
+def reference_chunk(reference, time, start, stop):
+    # Rows [start, stop) of a reference without evaluating the rest; a constant
+    # reference is returned unchanged
+    if isinstance(reference, ReferenceGenerator):
+        return reference.evaluate(time[start:stop])
+    reference = np.asarray(reference, dtype=float)
+    return reference[start:stop] if reference.ndim == 2 else reference
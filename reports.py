@@ -0,0 +1,209 @@
+import io
+import os
+import threading
+import logging
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from visualization import PLOT_MAX_POINTS, _plot_indices
+
+logger = logging.getLogger(__name__)
+
+# Headless simulation reports with the plot_trajectory layout. The figure,
+# axes and lines are built once per renderer; each report only replaces the
+# line data, rescales the axes and saves, so batches of reports cost little
+# more than the drawing itself and memory stays flat.
+
+REPORT_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+    'pdf': 'application/pdf'
+}
+
+# (subplot, title, y label, [(column, style, label, source, scale)]) per panel;
+# source is 'states', 'inputs', 'reference' or 'error', scale converts rad -> deg
+DEG = 180.0 / np.pi
+REPORT_PANELS = [
+    (1, 'Position', 'Position (m)', [
+        (0, 'b-', 'x', 'states', 1.0), (1, 'g-', 'y', 'states', 1.0), (2, 'r-', 'z', 'states', 1.0),
+        (0, 'b--', None, 'reference', 1.0), (1, 'g--', None, 'reference', 1.0), (2, 'r--', None, 'reference', 1.0)
+    ]),
+    (2, 'Linear Velocity', 'Velocity (m/s)', [
+        (3, 'b-', 'u', 'states', 1.0), (4, 'g-', 'v', 'states', 1.0), (5, 'r-', 'w', 'states', 1.0)
+    ]),
+    (3, 'Orientation', 'Angle (deg)', [
+        (6, 'b-', 'φ (roll)', 'states', DEG), (7, 'g-', 'θ (pitch)', 'states', DEG), (8, 'r-', 'ψ (yaw)', 'states', DEG),
+        (6, 'b--', None, 'reference', DEG), (7, 'g--', None, 'reference', DEG), (8, 'r--', None, 'reference', DEG)
+    ]),
+    (4, 'Angular Velocity', 'Angular Velocity (deg/s)', [
+        (9, 'b-', 'p', 'states', DEG), (10, 'g-', 'q', 'states', DEG), (11, 'r-', 'r', 'states', DEG)
+    ]),
+    (5, 'Thrust', 'Force (N)', [
+        (0, 'b-', 'Thrust', 'inputs', 1.0)
+    ]),
+    (6, 'Moments', 'Moment (N·m)', [
+        (1, 'b-', 'τx', 'inputs', 1.0), (2, 'g-', 'τy', 'inputs', 1.0), (3, 'r-', 'τz', 'inputs', 1.0)
+    ]),
+    (8, 'Position Error', 'Error (m)', [
+        (0, 'b-', 'x error', 'error', 1.0), (1, 'g-', 'y error', 'error', 1.0), (2, 'r-', 'z error', 'error', 1.0)
+    ]),
+    (9, 'Orientation Error', 'Error (deg)', [
+        (6, 'b-', 'φ error', 'error', DEG), (7, 'g-', 'θ error', 'error', DEG), (8, 'r-', 'ψ error', 'error', DEG)
+    ])
+]
+
+class ReportRenderer:
+    """Reusable 3x3 report figure on an Agg canvas (no pyplot, no GUI backend).
+
+    Not thread-safe: share one renderer per thread or guard it with a lock.
+    Use as a context manager, or call close(), to release the figure.
+    """
+
+    def __init__(self, figsize=(15, 10), dpi=100):
+        self.dpi = dpi
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.fig)
+        self.panels = []
+
+        for position, title, ylabel, series in REPORT_PANELS:
+            ax = self.fig.add_subplot(3, 3, position)
+            lines = []
+            for column, style, label, source, scale in series:
+                alpha = 0.5 if source == 'reference' else 1.0
+                line, = ax.plot([], [], style, label=label, alpha=alpha)
+                lines.append((line, column, source, scale))
+            ax.set_title(title)
+            ax.set_xlabel('Time (s)')
+            ax.set_ylabel(ylabel)
+            ax.legend()
+            ax.grid(True)
+            self.panels.append((ax, lines))
+
+        # 3D trajectory
+        self.ax3d = self.fig.add_subplot(3, 3, 7, projection='3d')
+        self.trajectory, = self.ax3d.plot([], [], [], 'b-')
+        self.ax3d.set_title('3D Trajectory')
+        self.ax3d.set_xlabel('X (m)')
+        self.ax3d.set_ylabel('Y (m)')
+        self.ax3d.set_zlabel('Z (m)')
+        self.ax3d.grid(True)
+
+        self.fig.tight_layout()
+
+    def update(self, result, max_points=PLOT_MAX_POINTS):
+        # Swap in one result's histories; rows are thinned before 'reference'
+        # and 'error' are read, as in plot_result
+        time = np.asarray(result['time'])
+        idx = _plot_indices(len(time), max_points)
+        if idx is None:
+            idx = slice(None)
+
+        data = {'states': np.asarray(result['states'][idx]), 'inputs': np.asarray(result['inputs'][idx])}
+        reference = result.get('reference')
+        data['reference'] = np.asarray(reference[idx]) if reference is not None else None
+        if data['reference'] is not None:
+            data['reference'] = np.broadcast_to(data['reference'], data['states'].shape)
+            data['error'] = data['states'] - data['reference']
+        else:
+            data['error'] = None
+        time = time[idx]
+
+        for ax, lines in self.panels:
+            for line, column, source, scale in lines:
+                values = data[source]
+                if values is None:
+                    line.set_data([], [])
+                else:
+                    line.set_data(time, values[:, column] * scale)
+            ax.relim()
+            ax.autoscale_view()
+
+        states = data['states']
+        self.trajectory.set_data_3d(states[:, 0], states[:, 1], states[:, 2])
+        for axis, setter in ((0, self.ax3d.set_xlim), (1, self.ax3d.set_ylim), (2, self.ax3d.set_zlim)):
+            low, high = float(np.min(states[:, axis])), float(np.max(states[:, axis]))
+            margin = 0.05 * (high - low) or 0.5
+            setter(low - margin, high + margin)
+
+    def render(self, result, path=None, format='png', max_points=PLOT_MAX_POINTS):
+        """Write one report to path (format from its extension) or return its bytes."""
+        if path is not None:
+            format = os.path.splitext(path)[1].lstrip('.').lower() or format
+        if format not in REPORT_FORMATS:
+            raise ValueError(f"Unsupported report format '{format}'. Available: {', '.join(REPORT_FORMATS)}")
+
+        self.update(result, max_points)
+        if path is not None:
+            self.fig.savefig(path, format=format, dpi=self.dpi)
+            return path
+        buf = io.BytesIO()
+        self.fig.savefig(buf, format=format, dpi=self.dpi)
+        return buf.getvalue()
+
+    def close(self):
+        self.fig.clear()
+        self.panels = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# One renderer per worker process, reused for every report it renders
+_worker_renderer = None
+_worker_lock = threading.Lock()
+
+def _load_source(source):
+    # A trajectory_store directory or an in-memory result mapping
+    if isinstance(source, (str, os.PathLike)):
+        from trajectory_store import open_trajectory
+        return open_trajectory(source)
+    return source
+
+def _render_report_safe(args):
+    global _worker_renderer
+    source, path, max_points = args
+    try:
+        with _worker_lock:
+            if _worker_renderer is None:
+                _worker_renderer = ReportRenderer()
+            _worker_renderer.render(_load_source(source), path, max_points=max_points)
+        return path, None
+    except Exception as e:
+        return path, str(e)
+
+def render_reports(sources, output_dir, format='png', executor=None, max_workers=None,
+                   max_points=PLOT_MAX_POINTS):
+    """Render one report per source into output_dir, across processes.
+
+    Sources are result mappings or trajectory_store directories (the file is
+    named after the directory, otherwise report_00000.<format>, ...). Returns
+    (paths, errors) with errors mapping source index -> message.
+    """
+    if format not in REPORT_FORMATS:
+        raise ValueError(f"Unsupported report format '{format}'. Available: {', '.join(REPORT_FORMATS)}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    tasks = []
+    for i, source in enumerate(sources):
+        if isinstance(source, (str, os.PathLike)):
+            name = os.path.basename(os.path.normpath(source))
+        else:
+            name = f"report_{i:05d}"
+        tasks.append((source, os.path.join(output_dir, f"{name}.{format}"), max_points))
+
+    if executor is None:
+        from sweep import get_executor
+        executor = get_executor(max_workers)
+    num_workers = getattr(executor, '_max_workers', None) or os.cpu_count() or 1
+    chunksize = max(1, len(tasks) // (4 * num_workers))
+
+    logger.info(f"Rendering {len(tasks)} reports to {output_dir}")
+    paths = []
+    errors = {}
+    for i, (path, error) in enumerate(executor.map(_render_report_safe, tasks, chunksize=chunksize)):
+        paths.append(path)
+        if error is not None:
+            errors[i] = error
+    return paths, errors
@@ -0,0 +1,202 @@
+import os
+import time
+import json
+import hashlib
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict, namedtuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CachedResponse = namedtuple('CachedResponse', ['body', 'mimetype', 'etag'])
+
+# Salted into every key; bump it when a change alters response bodies, so a
+# persistent RESPONSE_CACHE_PATH store does not serve bodies from before it
+CACHE_VERSION = 2
+
+def _canonical(value):
+    # Nested JSON values with every number as a float
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+def response_cache_key(params, **options):
+    # Canonical hash of the merged params plus whatever else shapes the encoded
+    # body (mode, integrator, decimation, mimetype, dtype) and CACHE_VERSION. Keys are sorted and numbers are
+    # hashed as floats, so 15 and 15.0 or reordered JSON give the same key.
+    h = hashlib.sha256(f"v{CACHE_VERSION}\0".encode())
+    for name, value in sorted(params.items()) + sorted(('@' + k, v) for k, v in options.items()):
+        h.update(name.encode())
+        if isinstance(value, dict) or (
+                isinstance(value, (list, tuple)) and any(isinstance(v, dict) for v in value)):
+            # Specs (references, disturbance schedules) hash as canonical JSON
+            h.update(json.dumps(_canonical(value), sort_keys=True, default=str).encode())
+        elif isinstance(value, np.ndarray) or isinstance(value, (list, tuple)):
+            array = np.ascontiguousarray(value, dtype=float)
+            h.update(str(array.shape).encode())
+            h.update(array.tobytes())
+        elif isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+            h.update(repr(float(value)).encode())
+        else:
+            h.update(repr(value).encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+class MemoryResponseStore:
+    """In-process LRU of encoded responses, bounded by total body bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old.body)
+            self._entries[key] = entry
+            self._size += len(entry.body)
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size}
+
+class SqliteResponseStore:
+    """Response store in a sqlite file, shared between gunicorn workers.
+
+    Least recently used bodies are deleted once the total exceeds max_bytes.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, body BLOB, mimetype TEXT, etag TEXT, "
+                "size INTEGER, accessed REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT body, mimetype, etag FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+        return CachedResponse(bytes(row[0]), row[1], row[2])
+
+    def put(self, key, entry):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, body, mimetype, etag, size, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, entry.body, entry.mimetype, entry.etag, len(entry.body), time.time())
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        with self._connect() as conn:
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {'entries': entries, 'bytes': size}
+
+class ResponseCache:
+    """Encoded /run_simulation bodies keyed by response_cache_key.
+
+    The backend is any object with get/put/clear/stats (MemoryResponseStore by
+    default, SqliteResponseStore when a path is given). Backend errors are
+    logged and treated as misses so the cache never fails a request.
+    """
+
+    def __init__(self, max_bytes=64 * 2**20, path=None, backend=None):
+        if backend is None:
+            backend = SqliteResponseStore(path, max_bytes) if path else MemoryResponseStore(max_bytes)
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            entry = self.backend.get(key)
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache read failed: {e}")
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        # Bodies larger than the whole cache would only evict everything else
+        if len(entry.body) > self.max_bytes:
+            return
+        try:
+            self.backend.put(key, entry)
+        except sqlite3.Error as e:
+            logger.warning(f"Response cache write failed: {e}")
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        stats = self.backend.stats()
+        with self._lock:
+            stats.update({
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'persistent': not isinstance(self.backend, MemoryResponseStore)
+            })
+        return stats
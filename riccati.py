@@ -1,110 +1,109 @@
 import numpy as np
-from scipy.linalg import solve_continuous_are, eigvals
-
-# === 1. Parámetros físicos ===
-print("\n=== 1. Parámetros físicos ===")
-m = 1.1
-W = 0.63
-L = 0.63
-H = 0.1
-
-Ix = m * ((W**2 + H**2) / 12)
-Iy = m * ((L**2 + H**2) / 12)
-Iz = m * ((L**2 + W**2) / 12)
-
-print(f"Momentos de inercia:")
-print(f"Ix = {Ix:.4f} kg·m²")
-print(f"Iy = {Iy:.4f} kg·m²")
-print(f"Iz = {Iz:.4f} kg·m²")
-
-# === 2. Matriz A ===
-print("\n=== 2. Matriz A (9x9) ===")
-A = np.array([
-    [0, 0, 0, 1, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 1, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 1, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 0, 0, 0, 0, 0, 0, 0],
-    [1, 0, 0, 0, 0, 0, 0, 0, 0],
-    [0, 1, 0, 0, 0, 0, 0, 0, 0],
-    [0, 0, 1, 0, 0, 0, 0, 0, 0]
-])
-print("Matriz A (dinámica del sistema):")
-print(np.round(A, 4))
-
-# === 3. Matriz B ===
-print("\n=== 3. Matriz B (9x3) ===")
-B = np.array([
-    [0, 0, 0],
-    [0, 0, 0],
-    [0, 0, 0],
-    [1/Ix, 0, 0],
-    [0, 1/Iy, 0],
-    [0, 0, 1/Iz],
-    [0, 0, 0],
-    [0, 0, 0],
-    [0, 0, 0]
-])
-print("Matriz B (entradas de control):")
-print(np.round(B, 4))
-
-# === 4. Matrices de peso Q y R ===
-print("\n=== 4. Matrices de peso Q y R ===")
-Q = np.diag([0.02, 0.01, 0.1, 0.12, 0.05, 0.1, 10, 10, 10])
-R = np.diag([1, 1, 0.1])
-
-print("Matriz Q (9x9):")
-print(np.round(Q, 4))
-print("\nMatriz R (3x3):")
-print(np.round(R, 4))
-
-# === 5. Solución de la ecuación algebraica de Riccati ===
-print("\n=== 5. Solución de la ecuación de Riccati ===")
-P = solve_continuous_are(A, B, Q, R)
-print("Matriz P (9x9) solución de Riccati:")
-print(np.round(P, 4))
-
-# === 6. Cálculo de la matriz de ganancia K ===
-print("\n=== 6. Cálculo de la matriz de ganancia K ===")
-K_total = np.linalg.inv(R) @ B.T @ P
-print("Matriz de ganancia total K_total (3x9):")
-print(np.round(K_total, 4))
-
-# === 7. Separación en K_c y K_i ===
-print("\n=== 7. Separación en K_c y K_i ===")
-K_c = K_total[:, :6]  # Primeras 6 columnas
-K_i = K_total[:, 6:]  # Últimas 3 columnas
-
-print("\nMatriz K_c (3x6) - ganancias para estados principales:")
-print(np.round(K_c, 4))
-print("\nMatriz K_i (3x3) - ganancias para estados integrales:")
-print(np.round(K_i, 4))
-
-# === 8. Verificación de estabilidad ===
-print("\n=== 8. Verificación de estabilidad ===")
-A_cl = A - B @ K_total
-eigs = eigvals(A_cl)
-print("Autovalores del sistema en lazo cerrado:")
-print(np.round(eigs, 4))
-print("\nPartes reales de los autovalores:")
-print(np.round(np.real(eigs), 4))
-
-if np.all(np.real(eigs) < 0):
-    print("\n✅ Sistema cerrado ESTABLE (todas las partes reales son negativas)")
-else:
-    print("\n❌ Sistema cerrado INESTABLE (hay partes reales positivas)")
-
-# === 9. Descomposición adicional para entender K ===
-print("\n=== 9. Descomposición adicional de K ===")
-print("\nComponente R⁻¹Bᵀ:")
-R_inv_BT = np.linalg.inv(R) @ B.T
-print(np.round(R_inv_BT, 4))
-
-print("\nComponente BᵀP:")
-BT_P = B.T @ P
-print(np.round(BT_P, 4))
-
-print("\nVerificación: K_total = R⁻¹ @ (Bᵀ @ P)")
-verification = np.linalg.inv(R) @ (B.T @ P)
-print("¿Son iguales K_total y la verificación?", np.allclose(K_total, verification))
\ No newline at end of file
+from collections import namedtuple
+from lqr_controller import solve_lqr
+
+# Integral-action LQR (LQI): the plant is augmented with integrator states
+# z' = C x and a single LQR is designed for the augmented model. The gain
+# splits into K_c (plant states) and K_i (integral states), u = -K_c x - K_i z.
+
+LQIGains = namedtuple('LQIGains', ['K_c', 'K_i', 'K', 'P', 'eigenvalues'])
+
+# Drone states whose error is integrated by default (x, y, z position)
+INTEGRAL_OUTPUTS = (0, 1, 2)
+
+def integral_output_matrix(indices, n_states):
+    # Selection matrix C picking the integrated states
+    C = np.zeros((len(indices), n_states))
+    C[np.arange(len(indices)), list(indices)] = 1.0
+    return C
+
+def augment_integral(A, B, C):
+    # [x' ; z'] = [[A, 0], [C, 0]] [x ; z] + [[B], [0]] u
+    n = A.shape[0]
+    p = C.shape[0]
+    m = B.shape[1]
+
+    A_aug = np.zeros((n + p, n + p))
+    A_aug[:n, :n] = A
+    A_aug[n:, :n] = C
+
+    B_aug = np.zeros((n + p, m))
+    B_aug[:n] = B
+    return A_aug, B_aug
+
+def design_lqi(A, B, C, Q, R, Q_i=None, cache=None):
+    """Design an integral LQR for (A, B) with integrator states z' = C x.
+
+    Q is either the full (n+p) x (n+p) augmented weight, or the n x n plant
+    weight with Q_i (p x p) weighting the integral states. With an
+    LQRGainCache as `cache` the augmented design is cached like any other.
+    Returns LQIGains(K_c, K_i, K, P, eigenvalues).
+    """
+    n = A.shape[0]
+    p = C.shape[0]
+    A_aug, B_aug = augment_integral(A, B, C)
+
+    Q = np.asarray(Q, dtype=float)
+    if Q.shape == (n, n):
+        if Q_i is None:
+            raise ValueError("Q_i is required when Q only weights the plant states")
+        Q_aug = np.zeros((n + p, n + p))
+        Q_aug[:n, :n] = Q
+        Q_aug[n:, n:] = Q_i
+    elif Q.shape == (n + p, n + p):
+        Q_aug = Q
+    else:
+        raise ValueError(f"Q must be {n}x{n} or {n + p}x{n + p}, got {Q.shape[0]}x{Q.shape[1]}")
+
+    if cache is not None:
+        K, P, eigenvalues = cache.get(A_aug, B_aug, Q_aug, R)
+    else:
+        K, P, eigenvalues = solve_lqr(A_aug, B_aug, Q_aug, R)
+
+    return LQIGains(K_c=K[:, :n], K_i=K[:, n:], K=K, P=P, eigenvalues=eigenvalues)
+
+def main():
+    # Worked example: 3-axis attitude model (angles and rates) with integral
+    # action on the three angles
+    m = 1.1
+    W = 0.63
+    L = 0.63
+    H = 0.1
+
+    Ix = m * ((W**2 + H**2) / 12)
+    Iy = m * ((L**2 + H**2) / 12)
+    Iz = m * ((L**2 + W**2) / 12)
+
+    print("\n=== 1. Parámetros físicos ===")
+    print(f"Ix = {Ix:.4f} kg·m²")
+    print(f"Iy = {Iy:.4f} kg·m²")
+    print(f"Iz = {Iz:.4f} kg·m²")
+
+    A = np.zeros((6, 6))
+    A[0:3, 3:6] = np.eye(3)
+    B = np.zeros((6, 3))
+    B[3:6] = np.diag([1 / Ix, 1 / Iy, 1 / Iz])
+    C = integral_output_matrix((0, 1, 2), 6)
+
+    Q = np.diag([0.02, 0.01, 0.1, 0.12, 0.05, 0.1, 10, 10, 10])
+    R = np.diag([1, 1, 0.1])
+
+    gains = design_lqi(A, B, C, Q, R)
+
+    print("\n=== 2. Solución de la ecuación de Riccati ===")
+    print(np.round(gains.P, 4))
+
+    print("\n=== 3. Matriz K_c (3x6) - ganancias para estados principales ===")
+    print(np.round(gains.K_c, 4))
+    print("\n=== 4. Matriz K_i (3x3) - ganancias para estados integrales ===")
+    print(np.round(gains.K_i, 4))
+
+    print("\n=== 5. Autovalores del sistema en lazo cerrado ===")
+    print(np.round(gains.eigenvalues, 4))
+    if np.all(np.real(gains.eigenvalues) < 0):
+        print("\n✅ Sistema cerrado ESTABLE (todas las partes reales son negativas)")
+    else:
+        print("\n❌ Sistema cerrado INESTABLE (hay partes reales positivas)")
+
+if __name__ == '__main__':
+    main()
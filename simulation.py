@@ -1,182 +1,371 @@
 import numpy as np
-from scipy.integrate import solve_ivp
 import logging
-from drone_model import nonlinear_dynamics
-from lqr_controller import lqr_control
+from time import perf_counter
+from integrators import get_integrator, get_batch_integrator
+from lqr_controller import lqr_control, lqr_control_batch, discretize_zoh
+from recording import Recorder, DEFAULT_RECORDING
+from references import resolve_reference, reference_chunk
+from gain_schedule import GainSchedule
+from disturbances import DisturbanceSchedule, Impulse, build_schedule, compile_schedules
 
 logger = logging.getLogger(__name__)
 
-def run_simulation(A, B, K, initial_state, simulation_time, dt, reference_state=None):
-    # Default reference is zero (hover)
-    if reference_state is None:
-        reference_state = np.zeros_like(initial_state)
+# Parameters for nonlinear simulation
+SIMULATION_PARAMS = {
+    'Ixx': 0.0231,
+    'Iyy': 0.0281,
+    'Izz': 0.0356,
+    'mass': 1.1,
+    'g': 9.81
+}
+
+# Airframe simulate_with_disturbance has always simulated
+DISTURBANCE_PARAMS = {
+    'Ixx': 0.0221,
+    'Iyy': 0.0221,
+    'Izz': 0.0366,
+    'mass': 1.0,
+    'g': 9.81
+}
+
+# Steps between calls to a simulation's progress callback
+PROGRESS_INTERVAL = 100
+
+def run_simulation(A, B, K, initial_state, simulation_time, dt, reference_state=None,
+                   integrator='rk45', params=None, progress=None, timings=None, metrics=None,
+                   recording=None, disturbances=None):
+    # integrator defaults to 'rk45' (solve_ivp per step, the reference
+    # trajectory); 'rk4' and 'zoh' are the fixed-step fast paths.
+    # If a timings dict is given, the loop adds 'control' and 'integrator' seconds
+    # and a 'fallbacks' count to it. A PerformanceMetricsAccumulator passed as
+    # metrics is updated every step. recording (a RecordingSpec) selects which
+    # histories are kept; 'reference' and 'error' are derived on access.
+    # reference_state is a constant state, a (num_steps, n) array or a
+    # references.ReferenceGenerator, evaluated once for the whole time vector.
+    # K may be a gain_schedule.GainSchedule, interpolated at every step.
+    # disturbances (a disturbances.DisturbanceSchedule or its JSON spec) is
+    # compiled up front: scheduled forces are added to the saturated input and
+    # parameter changes rebuild the integrator at their step. The controller's
+    # hover thrust stays at the nominal params.
+    initial_state = np.asarray(initial_state, dtype=float)
+    n_states = len(initial_state)
     
     # Time vector
     time = np.arange(0, simulation_time, dt)
     num_steps = len(time)
     
-    # Initialize arrays for storing results
-    states = np.zeros((num_steps, len(initial_state)))
-    inputs = np.zeros((num_steps, 4))  # [T, tau_x, tau_y, tau_z]
-    reference = np.zeros((num_steps, len(initial_state)))
-    error = np.zeros((num_steps, len(initial_state)))
+    # Default reference is zero (hover); trajectories are precomputed row by row
+    reference_state = resolve_reference(reference_state, time, n_states)
+    tracking = reference_state.ndim == 2
     
-    # Set initial state
-    states[0] = initial_state
+    # History buffers per the recording spec, plus the working buffers
+    recorder = Recorder(recording or DEFAULT_RECORDING, time, n_states)
+    state = initial_state.copy()
+    next_state = np.empty(n_states)
+    error = np.empty(n_states)
+    u = np.empty(4)  # [T, tau_x, tau_y, tau_z]
     
     # Parameters for nonlinear simulation
-    params = {
-        'Ixx': 0.0231,
-        'Iyy': 0.0281,
-        'Izz': 0.0356,
-        'mass': 1.1,
-        'g': 9.81
-    }
+    if params is None:
+        params = SIMULATION_PARAMS
     
     # Equilibrium hover thrust
     hover_thrust = params['mass'] * params['g']
     
-    # Simulation loop
-    for i in range(num_steps - 1):
-        # Current state and time
+    # Build the stepper once; it unpacks params and owns its work buffers
+    stepper = get_integrator(integrator, params, A, B, n_states)
+    
+    # Scheduled gains: constant-time table lookup per step
+    scheduled = isinstance(K, GainSchedule)
+    if scheduled:
+        gain = K.bind(params)
+    
+    # Disturbance schedule as per-step lookups and sorted change steps
+    disturbed = disturbances is not None
+    next_change = -1
+    if disturbed:
+        compiled = build_schedule(disturbances).compile(time, dt, params)
+        force_index, force_table = compiled.force_index, compiled.force_table
+        change_steps = compiled.change_steps.tolist()
+        change_params = compiled.change_params
+        if change_steps and not isinstance(integrator, str):
+            raise ValueError("Parameter changes need an integrator name, not an instance")
+        change = 0
+        next_change = change_steps[0] if change_steps else -1
+    
+    timed = timings is not None
+    control_time = integrator_time = 0.0
+    fallbacks = 0
+    
+    # Simulation loop (the last sample only computes its control input)
+    for i in range(num_steps):
+        # Report progress (the callback may raise to abort the run)
+        if progress is not None and i % PROGRESS_INTERVAL == 0:
+            progress(i, num_steps)
+        
+        # Current time
         t = time[i]
-        state = states[i]
         
-        # Update reference if needed (e.g., for tracking a trajectory)
-        reference[i] = reference_state
+        if timed:
+            t0 = perf_counter()
         
-        # Compute control input using LQR
-        lqr_input = lqr_control(state, reference[i], K)
+        # Compute error and the LQR input (u = -K @ error) in place
+        np.subtract(state, reference_state[i] if tracking else reference_state, out=error)
+        np.dot(gain(state) if scheduled else K, error, out=u)
+        np.negative(u, out=u)
         
         # Add hover thrust to the Z force (first input)
-        u = np.copy(lqr_input)
         u[0] += hover_thrust
         
         # Ensure physical limits (simple saturation)
         u[0] = max(0, u[0])  # Thrust can't be negative
         
-        # Store control input
-        inputs[i] = u
+        # External forces act on top of the saturated control input
+        if disturbed:
+            u += force_table[force_index[i]]
+        
+        recorder.record(i, state, u)
+        if metrics is not None:
+            metrics.update(t, error, u)
         
-        # Compute error
-        error[i] = state - reference[i]
+        if i == num_steps - 1:
+            break
         
-        # Integrate dynamics over one time step using linear model
-        # state_next = state + dt * (A @ state + B @ u)
+        # Airframe change (e.g. payload drop) from this step on
+        if i == next_change:
+            stepper = get_integrator(integrator, change_params[change], A, B, n_states)
+            change += 1
+            next_change = change_steps[change] if change < len(change_steps) else -1
         
-        # For more accurate simulation, use nonlinear dynamics
-        sol = solve_ivp(
-            lambda t, x: nonlinear_dynamics(t, x, u, params),
-            [t, t + dt],
-            state,
-            method='RK45',
-            t_eval=[t + dt]
-        )
+        if timed:
+            t1 = perf_counter()
+            control_time += t1 - t0
         
-        if sol.success:
-            states[i + 1] = sol.y[:, 0]
-        else:
+        # Integrate dynamics over one time step
+        if not stepper.step(t, state, u, dt, next_state):
             logger.warning(f"Integration failed at time {t}")
+            fallbacks += 1
             # Fall back to linear approximation
-            states[i + 1] = state + dt * (A @ state + B @ u)
+            next_state[:] = state + dt * (A @ state + B @ u)
+        state, next_state = next_state, state
+        
+        if timed:
+            integrator_time += perf_counter() - t1
     
-    # Compute control input for the last time step
-    reference[-1] = reference_state
-    lqr_input = lqr_control(states[-1], reference[-1], K)
-    u = np.copy(lqr_input)
-    u[0] += hover_thrust
-    u[0] = max(0, u[0])
-    inputs[-1] = u
-    error[-1] = states[-1] - reference[-1]
+    if timed:
+        timings['control'] = timings.get('control', 0.0) + control_time
+        timings['integrator'] = timings.get('integrator', 0.0) + integrator_time
+        timings['fallbacks'] = timings.get('fallbacks', 0) + fallbacks
     
-    # Compile results
-    result = {
-        'time': time,
-        'states': states,
-        'inputs': inputs,
-        'reference': reference,
-        'error': error
-    }
+    if progress is not None:
+        progress(num_steps, num_steps)
     
-    return result
+    # Compile results
+    return recorder.result(reference_state, state)
 
-def simulate_with_disturbance(A, B, K, initial_state, simulation_time, dt, 
-                            disturbance_time, disturbance_force):
+def run_simulation_lqi(A, B, gains, C, initial_state, simulation_time, dt, reference_state=None,
+                       integrator='rk45', params=None, progress=None, metrics=None, recording=None):
+    # Integral-action form of run_simulation. gains is a riccati.LQIGains for the
+    # plant augmented with z' = C (x - r); the integrator states live in the
+    # same state buffers as the plant (columns n: of 'states'), the plant part
+    # is stepped by the chosen integrator and z by the trapezoidal rule.
+    initial_state = np.asarray(initial_state, dtype=float)
+    n_states = len(initial_state)
+    n_integral = C.shape[0]
+    n_total = n_states + n_integral
+    
     # Time vector
     time = np.arange(0, simulation_time, dt)
     num_steps = len(time)
     
-    # Initialize arrays
-    states = np.zeros((num_steps, len(initial_state)))
-    inputs = np.zeros((num_steps, 4))
-    reference = np.zeros((num_steps, len(initial_state)))
-    error = np.zeros((num_steps, len(initial_state)))
+    # Default reference is zero (hover); integral states are regulated to zero
+    reference_state = resolve_reference(reference_state, time, n_states)
+    tracking = reference_state.ndim == 2
+    reference = np.zeros(reference_state.shape[:-1] + (n_total,))
+    reference[..., :n_states] = reference_state
     
-    # Set initial state
-    states[0] = initial_state
+    # Per-step reference term of the trapezoidal integral update
+    C_reference = reference_state @ C.T
+    if tracking:
+        integral_offset = 0.5 * dt * (C_reference[:-1] + C_reference[1:])
+    else:
+        integral_offset = dt * C_reference
     
-    # Parameters for nonlinear simulation
-    params = {
-        'Ixx': 0.0221,
-        'Iyy': 0.0221,
-        'Izz': 0.0366,
-        'mass': 1.0,
-        'g': 9.81
-    }
+    # History buffers per the recording spec, plus the augmented working buffers
+    recorder = Recorder(recording or DEFAULT_RECORDING, time, n_total)
+    state = np.zeros(n_total)
+    state[:n_states] = initial_state
+    next_state = np.empty(n_total)
+    error = np.empty(n_total)
+    u = np.empty(4)  # [T, tau_x, tau_y, tau_z]
+    K = gains.K
     
-    # Equilibrium hover thrust
+    if params is None:
+        params = SIMULATION_PARAMS
     hover_thrust = params['mass'] * params['g']
     
-    # Disturbance index
-    dist_idx = int(disturbance_time / dt)
+    stepper = get_integrator(integrator, params, A, B, n_states)
     
-    # Simulation loop
-    for i in range(num_steps - 1):
-        # Current state and time
-        t = time[i]
-        state = states[i]
+    for i in range(num_steps):
+        if progress is not None and i % PROGRESS_INTERVAL == 0:
+            progress(i, num_steps)
         
-        # Update reference (zero for hover)
-        reference[i] = np.zeros_like(state)
+        t = time[i]
         
-        # Compute control input
-        lqr_input = lqr_control(state, reference[i], K)
-        u = np.copy(lqr_input)
+        # u = -K_c (x - r) - K_i z in one product over the augmented error
+        np.subtract(state, reference[i] if tracking else reference, out=error)
+        np.dot(K, error, out=u)
+        np.negative(u, out=u)
         u[0] += hover_thrust
+        u[0] = max(0, u[0])
         
-        # Apply disturbance if at the right time
-        if i == dist_idx:
-            u += disturbance_force
-            logger.info(f"Applying disturbance at t = {t}")
-        
-        # Store control input
-        inputs[i] = u
-        
-        # Compute error
-        error[i] = state - reference[i]
-        
-        # Integrate dynamics
-        sol = solve_ivp(
-            lambda t, x: nonlinear_dynamics(t, x, u, params),
-            [t, t + dt],
-            state,
-            method='RK45',
-            t_eval=[t + dt]
-        )
-        
-        if sol.success:
-            states[i + 1] = sol.y[:, 0]
-        else:
+        recorder.record(i, state, u)
+        if metrics is not None:
+            metrics.update(t, error[:n_states], u)
+        
+        if i == num_steps - 1:
+            break
+        
+        # Plant step on the leading part of the buffers
+        x, x_next = state[:n_states], next_state[:n_states]
+        if not stepper.step(t, x, u, dt, x_next):
             logger.warning(f"Integration failed at time {t}")
-            states[i + 1] = state + dt * (A @ state + B @ u)
+            x_next[:] = x + dt * (A @ x + B @ u)
+        
+        # Integrator states: trapezoidal rule over the tracked outputs
+        next_state[n_states:] = (state[n_states:] + 0.5 * dt * (C @ (x + x_next))
+                                 - (integral_offset[i] if tracking else integral_offset))
+        state, next_state = next_state, state
+    
+    if progress is not None:
+        progress(num_steps, num_steps)
+    
+    return recorder.result(reference, state)
+
+def run_simulation_stream(A, B, K, initial_state, simulation_time, dt, reference_state=None,
+                          integrator='rk45', params=None, chunk_size=500):
+    # Generator form of run_simulation: yields dicts with 'start' (index of the
+    # first sample) and chunk_size rows of 'time', 'states', 'inputs' and 'error'.
+    # Only one chunk is held at a time, so memory does not grow with the horizon;
+    # a ReferenceGenerator reference is evaluated chunk by chunk as well.
+    initial_state = np.asarray(initial_state, dtype=float)
+    n_states = len(initial_state)
     
-    # Compute values for the last time step
-    reference[-1] = np.zeros_like(states[-1])
-    lqr_input = lqr_control(states[-1], reference[-1], K)
-    u = np.copy(lqr_input)
-    u[0] += hover_thrust
-    inputs[-1] = u
-    error[-1] = states[-1] - reference[-1]
+    # Default reference is zero (hover)
+    if reference_state is None:
+        reference_state = np.zeros(n_states)
+    
+    # Time vector
+    time = np.arange(0, simulation_time, dt)
+    num_steps = len(time)
+    
+    if params is None:
+        params = SIMULATION_PARAMS
+    hover_thrust = params['mass'] * params['g']
+    
+    stepper = get_integrator(integrator, params, A, B, n_states)
+    state = initial_state.copy()
+    
+    for start in range(0, num_steps, chunk_size):
+        stop = min(start + chunk_size, num_steps)
+        rows = stop - start
+        
+        # Fresh chunk buffers; the consumer owns the yielded arrays
+        states = np.empty((rows, n_states))
+        inputs = np.empty((rows, 4))
+        error = np.empty((rows, n_states))
+        reference = reference_chunk(reference_state, time, start, stop)
+        tracking = reference.ndim == 2
+        
+        for j in range(rows):
+            i = start + j
+            states[j] = state
+            
+            # Compute error and the LQR input in place
+            np.subtract(state, reference[j] if tracking else reference, out=error[j])
+            u = inputs[j]
+            np.dot(K, error[j], out=u)
+            np.negative(u, out=u)
+            u[0] += hover_thrust
+            u[0] = max(0, u[0])  # Thrust can't be negative
+            
+            # No integration after the last sample
+            if i == num_steps - 1:
+                break
+            
+            if not stepper.step(time[i], states[j], u, dt, state):
+                logger.warning(f"Integration failed at time {time[i]}")
+                state = states[j] + dt * (A @ states[j] + B @ u)
+        
+        yield {
+            'start': start,
+            'time': time[start:stop],
+            'states': states,
+            'inputs': inputs,
+            'error': error
+        }
+
+def run_simulation_linear(A, B, K, initial_state, simulation_time, dt, reference_state=None,
+                          params=None, method='powers', block_size=128):
+    # Linear fast path: ZOH-discretize (A, B) once and propagate the closed loop
+    # e[k+1] = Phi e[k] + c with Phi = Ad - Bd K, c = (Ad - I) ref, e = x - ref.
+    # Thrust saturation is not modelled. method='recursion' does one matmul per
+    # step; method='powers' applies precomputed Phi^1..Phi^block_size to whole blocks.
+    initial_state = np.asarray(initial_state, dtype=float)
+    n_states = len(initial_state)
+    
+    # Time vector
+    time = np.arange(0, simulation_time, dt)
+    num_steps = len(time)
+    
+    # Default reference is zero (hover); the closed-loop offset needs it constant
+    reference_state = resolve_reference(reference_state, time, n_states)
+    if reference_state.ndim != 1:
+        raise ValueError("run_simulation_linear only supports a constant reference")
+    
+    if params is None:
+        params = SIMULATION_PARAMS
+    u_trim = np.zeros(B.shape[1])
+    u_trim[0] = params['mass'] * params['g']
+    
+    # Closed-loop transition matrix, augmented with a constant 1 for the offset
+    Ad, Bd = discretize_zoh(A, B, dt)
+    Phi = np.eye(n_states + 1)
+    Phi[:n_states, :n_states] = Ad - Bd @ K
+    Phi[:n_states, n_states] = (Ad - np.eye(n_states)) @ reference_state
+    
+    error_aug = np.empty((num_steps, n_states + 1))
+    error_aug[0, :n_states] = initial_state - reference_state
+    error_aug[0, n_states] = 1.0
+    
+    if method == 'recursion':
+        for i in range(num_steps - 1):
+            np.dot(Phi, error_aug[i], out=error_aug[i + 1])
+    elif method == 'powers':
+        # powers[k] = Phi^(k+1), stacked as one (block_size * (n+1), n+1) matrix
+        n_aug = n_states + 1
+        block_size = max(1, min(block_size, num_steps - 1))
+        powers = np.empty((block_size, n_aug, n_aug))
+        powers[0] = Phi
+        for k in range(1, block_size):
+            powers[k] = powers[k - 1] @ Phi
+        powers = powers.reshape(-1, n_aug)
+        
+        for start in range(0, num_steps - 1, block_size):
+            stop = min(start + block_size, num_steps - 1)
+            rows = (stop - start) * n_aug
+            
+            # Flush decayed components so long horizons don't run on subnormal floats
+            e0 = error_aug[start]
+            e0[np.abs(e0) < 1e-200] = 0.0
+            error_aug[start + 1:stop + 1] = (powers[:rows] @ error_aug[start]).reshape(-1, n_aug)
+    else:
+        raise ValueError(f"Unknown linear propagation method '{method}'")
+    
+    error = error_aug[:, :n_states]
+    states = error + reference_state
+    inputs = u_trim - error @ K.T
+    reference = np.broadcast_to(reference_state, (num_steps, n_states)).copy()
     
     # Compile results
     result = {
@@ -184,7 +373,126 @@ def simulate_with_disturbance(A, B, K, initial_state, simulation_time, dt,
         'states': states,
         'inputs': inputs,
         'reference': reference,
-        'error': error
+        'error': np.ascontiguousarray(error)
     }
     
     return result
+
+def run_simulation_batch(A, B, K, initial_states, simulation_time, dt, reference_state=None,
+                         params=None, integrator='rk4', progress=None, metrics=None,
+                         recording=None, disturbances=None):
+    # Advance N trajectories together. initial_states is (N, 12); K is a shared
+    # (4, 12) gain or one gain per trajectory (N, 4, 12); params values may be
+    # scalars or (N,) arrays. Histories are stored time-major: (num_steps, N, ...).
+    # A PerformanceMetricsAccumulator passed as metrics gets (N,) metric arrays;
+    # recording (a RecordingSpec) selects which histories are kept.
+    # disturbances is one schedule shared by all trajectories or a list of N
+    # (e.g. a disturbance-rejection test matrix), compiled as in run_simulation.
+    initial_states = np.atleast_2d(np.asarray(initial_states, dtype=float))
+    num_drones, n_states = initial_states.shape
+    K = np.asarray(K, dtype=float)
+    
+    if K.ndim == 3 and K.shape[0] != num_drones:
+        raise ValueError(f"Expected {num_drones} gain matrices, got {K.shape[0]}")
+    
+    # Default reference is zero (hover)
+    if reference_state is None:
+        reference_state = np.zeros(n_states)
+    reference_state = np.broadcast_to(np.asarray(reference_state, dtype=float),
+                                      (num_drones, n_states))
+    
+    # Time vector
+    time = np.arange(0, simulation_time, dt)
+    num_steps = len(time)
+    
+    # History buffers per the recording spec, plus the working buffers
+    recorder = Recorder(recording or DEFAULT_RECORDING, time, n_states, batch_shape=(num_drones,))
+    state = initial_states.copy()
+    next_state = np.empty_like(state)
+    error = np.empty_like(state)
+    u = np.empty((num_drones, 4))
+    
+    if params is None:
+        params = SIMULATION_PARAMS
+    params = {key: np.asarray(value, dtype=float) for key, value in params.items()}
+    
+    # Equilibrium hover thrust (scalar or one per drone)
+    hover_thrust = params['mass'] * params['g']
+    
+    stepper = get_batch_integrator(integrator, params, A, B, n_states, num_drones)
+    
+    # Disturbance schedules as per-step (N, 4) force rows and sorted change steps
+    disturbed = disturbances is not None
+    next_change = -1
+    if disturbed:
+        if (isinstance(disturbances, DisturbanceSchedule) or not disturbances
+                or isinstance(disturbances[0], dict)):
+            disturbances = [disturbances] * num_drones
+        if len(disturbances) != num_drones:
+            raise ValueError(f"Expected {num_drones} disturbance schedules, got {len(disturbances)}")
+        compiled = compile_schedules([build_schedule(d) for d in disturbances], time, dt, params)
+        force_index, force_table = compiled.force_index, compiled.force_table
+        change_steps = compiled.change_steps.tolist()
+        change_params = compiled.change_params
+        if change_steps and not isinstance(integrator, str):
+            raise ValueError("Parameter changes need an integrator name, not an instance")
+        change = 0
+        next_change = change_steps[0] if change_steps else -1
+    
+    # Simulation loop (the last sample only computes its control input)
+    for i in range(num_steps):
+        if progress is not None and i % PROGRESS_INTERVAL == 0:
+            progress(i, num_steps)
+        
+        t = time[i]
+        
+        # Compute error and control inputs for all drones
+        np.subtract(state, reference_state, out=error)
+        lqr_control_batch(state, reference_state, K, out=u)
+        u[:, 0] += hover_thrust
+        np.maximum(u[:, 0], 0, out=u[:, 0])  # Thrust can't be negative
+        
+        if disturbed:
+            u += force_table[force_index[i]]
+        
+        recorder.record(i, state, u)
+        if metrics is not None:
+            metrics.update(t, error, u)
+        
+        if i == num_steps - 1:
+            break
+        
+        if i == next_change:
+            stepper = get_batch_integrator(integrator, change_params[change], A, B,
+                                           n_states, num_drones)
+            change += 1
+            next_change = change_steps[change] if change < len(change_steps) else -1
+        
+        # Integrate all trajectories over one time step
+        ok = stepper.step(t, state, u, dt, next_state)
+        if not ok.all():
+            failed = ~ok
+            logger.warning(f"Integration failed at time {t} for {np.count_nonzero(failed)} trajectories")
+            # Fall back to linear approximation for the failed rows
+            next_state[failed] = state[failed] + dt * (state[failed] @ A.T + u[failed] @ B.T)
+        state, next_state = next_state, state
+    
+    if progress is not None:
+        progress(num_steps, num_steps)
+    
+    # Compile results
+    return recorder.result(reference_state, state)
+
+def simulate_with_disturbance(A, B, K, initial_state, simulation_time, dt, 
+                            disturbance_time, disturbance_force, integrator='rk45',
+                            recording=None):
+    # Single impulse on the DISTURBANCE_PARAMS airframe; run_simulation with a
+    # disturbances schedule covers multiple and non-impulse events
+    schedule = DisturbanceSchedule([Impulse(disturbance_time, disturbance_force)])
+    return run_simulation(
+        A, B, K, initial_state, simulation_time, dt,
+        integrator=integrator,
+        params=DISTURBANCE_PARAMS,
+        recording=recording,
+        disturbances=schedule
+    )
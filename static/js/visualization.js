@@ -8,6 +8,12 @@ let trajectory3DChart = null;
 // Simulation data
 let simulationData = null;
 
+// Binary result encoding offered by the server (see encoding.py)
+const BINARY_MIMETYPE = 'application/vnd.drone-sim.binary';
+
+// Maximum samples per series requested from the server for charting
+const MAX_CHART_POINTS = 2000;
+
 // Initialize the page
 document.addEventListener('DOMContentLoaded', function() {
     // Set up form submission
@@ -17,10 +23,41 @@ document.addEventListener('DOMContentLoaded', function() {
         runSimulation();
     });
     
+    // Keep the uploaded reference path as text; it is sent with each run
+    document.getElementById('referenceFile').addEventListener('change', function(event) {
+        const file = event.target.files[0];
+        if (!file) {
+            uploadedPathCsv = null;
+            return;
+        }
+        file.text().then(text => {
+            uploadedPathCsv = text;
+            document.getElementById('referenceType').value = 'csv';
+        });
+    });
+    
     // Initialize empty charts
     initializeCharts();
 });
 
+// Text of the last uploaded CSV reference path
+let uploadedPathCsv = null;
+
+// Reference spec for the selected trajectory (null means hover at the origin)
+function referenceSpec() {
+    const type = document.getElementById('referenceType').value;
+    if (type === 'circle') {
+        return {type: 'circle', radius: 1.0, period: 10.0};
+    }
+    if (type === 'lemniscate') {
+        return {type: 'lemniscate', size: 1.0, period: 12.0};
+    }
+    if (type === 'csv' && uploadedPathCsv) {
+        return {type: 'csv', data: uploadedPathCsv};
+    }
+    return null;
+}
+
 // Function to initialize empty charts
 function initializeCharts() {
     // Position chart
@@ -363,18 +400,36 @@ function runSimulation() {
             parseFloat(document.getElementById('r_taux').value || 1),
             parseFloat(document.getElementById('r_tauy').value || 1),
             parseFloat(document.getElementById('r_tauz').value || 1)
-        ]
+        ],
+        // Tracking reference, precomputed on the server for the whole run
+        reference: referenceSpec(),
+        // Integral action on the position error (LQI) when enabled
+        mode: document.getElementById('useIntegral').checked ? 'lqi' : 'nonlinear',
+        Qi_diag: [
+            parseFloat(document.getElementById('qi_x').value || 1),
+            parseFloat(document.getElementById('qi_y').value || 1),
+            parseFloat(document.getElementById('qi_z').value || 1)
+        ],
+        // Server-side level of detail: enough points for the charts, no more
+        max_points: MAX_CHART_POINTS
     };
     
-    // Send request to the server
+    // Send request to the server (binary result preferred, JSON as fallback)
     fetch('/run_simulation', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
+            'Accept': BINARY_MIMETYPE + ', application/json;q=0.9',
         },
         body: JSON.stringify(params),
     })
-    .then(response => response.json())
+    .then(response => {
+        const contentType = response.headers.get('Content-Type') || '';
+        if (contentType.startsWith(BINARY_MIMETYPE)) {
+            return response.arrayBuffer().then(decodeBinaryResult);
+        }
+        return response.json();
+    })
     .then(data => {
         if (data.success) {
             // Save simulation data
@@ -383,8 +438,8 @@ function runSimulation() {
             // Update charts
             updateCharts(simulationData);
             
-            // Display performance metrics
-            displayMetrics(simulationData);
+            // Display performance metrics (computed by the server on the full-resolution run)
+            displayMetrics(simulationData, data.metrics);
             
             // Update info
             document.getElementById('simulationInfo').innerText = 'Simulation completed successfully';
@@ -399,10 +454,48 @@ function runSimulation() {
     });
 }
 
+// Decode the binary result format produced by encoding.encode_binary_result:
+// 'DSIM', uint16 version, uint16 reserved, uint32 header length, JSON header,
+// then 8-byte aligned little-endian arrays. 2-D arrays become arrays of row
+// views so the rest of the code can index them like nested lists.
+function decodeBinaryResult(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(
+        view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3)
+    );
+    if (magic !== 'DSIM') {
+        throw new Error('Invalid binary simulation result');
+    }
+    
+    const headerLength = view.getUint32(8, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 12, headerLength)));
+    const dataStart = 12 + headerLength;
+    
+    const result = {};
+    for (const entry of header.arrays) {
+        const ArrayType = { '<f8': Float64Array, '<f4': Float32Array, '<i4': Int32Array }[entry.dtype];
+        const count = entry.shape.reduce((a, b) => a * b, 1);
+        const data = new ArrayType(buffer, dataStart + entry.offset, count);
+        
+        if (entry.shape.length === 2) {
+            const cols = entry.shape[1];
+            const rows = new Array(entry.shape[0]);
+            for (let i = 0; i < rows.length; i++) {
+                rows[i] = data.subarray(i * cols, (i + 1) * cols);
+            }
+            result[entry.name] = rows;
+        } else {
+            result[entry.name] = data;
+        }
+    }
+    
+    return Object.assign({}, header.meta, { result: result });
+}
+
 // Function to update all charts with simulation data
 function updateCharts(data) {
-    // Extract data
-    const time = data.time;
+    // Extract data (typed arrays from the binary format become plain labels)
+    const time = Array.from(data.time);
     const states = data.states;
     const inputs = data.inputs;
     const error = data.error;
@@ -472,44 +565,54 @@ function updateCharts(data) {
 }
 
 // Function to display performance metrics
-function displayMetrics(data) {
-    // Extract data
-    const time = data.time;
-    const states = data.states;
-    const error = data.error;
+function displayMetrics(data, metrics) {
     const K = data.K;
-    
-    // Calculate position error norm
-    const positionErrorNorm = [];
-    for (let i = 0; i < error.length; i++) {
-        const posErr = Math.sqrt(
-            error[i][0]**2 + 
-            error[i][1]**2 + 
-            error[i][2]**2
-        );
-        positionErrorNorm.push(posErr);
-    }
-    
-    // Settling time (time to reach within 2% of final value)
-    const maxError = Math.max(...positionErrorNorm);
-    const threshold = 0.02 * maxError;
     let settlingTime = "N/A";
+    let maxPositionError;
+    let rmsePosition;
     
-    for (let i = 0; i < positionErrorNorm.length; i++) {
-        if (positionErrorNorm[i] <= threshold) {
-            settlingTime = time[i].toFixed(2);
-            break;
+    if (metrics) {
+        // Server metrics: the charted samples may be decimated, these are not
+        if (metrics.settling_time !== null) {
+            settlingTime = metrics.settling_time.toFixed(2);
+        }
+        maxPositionError = metrics.max_position_error.toFixed(4);
+        rmsePosition = metrics.rmse_position.toFixed(4);
+    } else {
+        // Fallback on the received samples, weighted by their time intervals
+        // so unevenly spaced (decimated) samples do not bias the RMSE
+        const time = data.time;
+        const error = data.error;
+        const positionErrorNorm = [];
+        for (let i = 0; i < error.length; i++) {
+            positionErrorNorm.push(Math.sqrt(
+                error[i][0]**2 + 
+                error[i][1]**2 + 
+                error[i][2]**2
+            ));
+        }
+        
+        // Settling time (time to reach within 2% of the maximum error)
+        const maxError = Math.max(...positionErrorNorm);
+        const threshold = 0.02 * maxError;
+        for (let i = 0; i < positionErrorNorm.length; i++) {
+            if (positionErrorNorm[i] < threshold) {
+                settlingTime = time[i].toFixed(2);
+                break;
+            }
+        }
+        maxPositionError = maxError.toFixed(4);
+        
+        // Trapezoidal mean of the squared error over the run
+        let integral = 0;
+        for (let i = 1; i < positionErrorNorm.length; i++) {
+            integral += 0.5 * (positionErrorNorm[i - 1]**2 + positionErrorNorm[i]**2) * (time[i] - time[i - 1]);
         }
+        const duration = time[time.length - 1] - time[0];
+        const meanSquare = duration > 0 ? integral / duration : positionErrorNorm[0]**2;
+        rmsePosition = Math.sqrt(meanSquare).toFixed(4);
     }
     
-    // Maximum position error
-    const maxPositionError = maxError.toFixed(4);
-    
-    // RMS error
-    const rmsePosition = Math.sqrt(
-        positionErrorNorm.reduce((sum, error) => sum + error * error, 0) / positionErrorNorm.length
-    ).toFixed(4);
-    
     // Create metrics HTML
     const metricsHTML = `
         <table class="table table-sm">
@@ -0,0 +1,233 @@
+import os
+import re
+import math
+import itertools
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from drone_model import get_state_space_matrices
+from gain_cache import LQRGainCache
+from simulation import run_simulation, run_simulation_lqi
+from riccati import design_lqi, integral_output_matrix, INTEGRAL_OUTPUTS
+from utils import PerformanceMetricsAccumulator
+from recording import RecordingSpec
+from references import build_reference
+from disturbances import build_schedule
+
+logger = logging.getLogger(__name__)
+
+# Values of the base params' 'controller'
+SWEEP_CONTROLLERS = ('lqr', 'lqi')
+
+# Parameters that can be swept; Q_diag/R_diag/Qi_diag entries are addressed as "Q_diag[i]".
+# Qi_diag (integral weights) applies when the base params select controller='lqi'.
+SWEEPABLE_PARAMS = ('Ixx', 'Iyy', 'Izz', 'mass', 'Q_diag', 'R_diag', 'Qi_diag')
+
+METRIC_COLUMNS = (
+    'settling_time',
+    'max_position_error',
+    'rmse_position',
+    'iae_position',
+    'max_control_effort',
+    'control_energy',
+    'rmse_orientation',
+    'max_orientation_error'
+)
+
+MAX_GRID_POINTS = int(os.environ.get("SWEEP_MAX_POINTS", 10000))
+
+_KEY_PATTERN = re.compile(r'^(\w+?)(?:\[(\d+)\])?$')
+
+# Each worker process keeps its own gain cache across grid points
+_worker_gain_cache = None
+
+# Process pools shared by sweeps, gain schedules, reports and animation
+# exports, one per requested size
+_executors = {}
+_executors_lock = threading.Lock()
+
+def _parse_key(key):
+    match = _KEY_PATTERN.match(key)
+    if match is None or match.group(1) not in SWEEPABLE_PARAMS:
+        raise ValueError(f"Cannot sweep '{key}'. Sweepable: {', '.join(SWEEPABLE_PARAMS)}")
+    # A bare "Q_diag"/"R_diag" key sweeps whole diagonals, e.g. [[1, 1, 1, 1], [2, 2, 2, 2]]
+    name, index = match.group(1), match.group(2)
+    return name, None if index is None else int(index)
+
+def _expand_values(spec):
+    # Either an explicit list of values or {"start", "stop", "num", "scale"}
+    if isinstance(spec, dict):
+        start = float(spec['start'])
+        stop = float(spec['stop'])
+        num = int(spec.get('num', 5))
+        if spec.get('scale', 'linear') == 'log':
+            return np.geomspace(start, stop, num).tolist()
+        return np.linspace(start, stop, num).tolist()
+    if isinstance(spec, (list, tuple)):
+        return list(spec)
+    return [spec]
+
+def build_sweep_grid(grid_spec, max_points=None):
+    # Cartesian product of the per-parameter value lists
+    if max_points is None:
+        max_points = MAX_GRID_POINTS
+
+    keys = list(grid_spec)
+    for key in keys:
+        _parse_key(key)
+    values = [_expand_values(grid_spec[key]) for key in keys]
+
+    num_points = math.prod(len(v) for v in values)
+    if num_points > max_points:
+        raise ValueError(f"Sweep grid has {num_points} points (limit {max_points})")
+
+    return keys, [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+def _apply_point(base_params, point):
+    params = dict(base_params)
+    diagonals = {'Q_diag': 'Q', 'R_diag': 'R', 'Qi_diag': 'Q_i'}
+    values = {name: np.diag(params[matrix]).astype(float)
+              for name, matrix in diagonals.items() if matrix in params}
+
+    for key, value in point.items():
+        name, index = _parse_key(key)
+        if name in diagonals:
+            if name not in values:
+                raise ValueError(f"Cannot sweep '{key}' without a base '{diagonals[name]}'")
+            if index is None:
+                values[name] = np.asarray(value, dtype=float)
+            else:
+                values[name][index] = value
+        else:
+            params[name] = float(value)
+
+    for name, diagonal in values.items():
+        params[diagonals[name]] = np.diag(diagonal)
+    return params
+
+def _finite_or_none(value):
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+def evaluate_point(base_params, point):
+    # LQR (or LQI) design + simulation with online performance metrics for one grid point
+    global _worker_gain_cache
+    if _worker_gain_cache is None:
+        _worker_gain_cache = LQRGainCache()
+
+    params = _apply_point(base_params, point)
+
+    A, B = get_state_space_matrices(
+        params['Ixx'], params['Iyy'], params['Izz'],
+        params['mass'], params['g']
+    )
+
+    # The plant uses the swept airframe as well as the controller design
+    plant = {key: params[key] for key in ('Ixx', 'Iyy', 'Izz', 'mass', 'g')}
+    accumulator = PerformanceMetricsAccumulator()
+    reference = build_reference(params['reference']) if params.get('reference') else None
+    disturbances = build_schedule(params['disturbances']) if params.get('disturbances') else None
+
+    if params.get('controller', 'lqr') == 'lqi':
+        if disturbances is not None:
+            raise ValueError("Disturbance schedules are not supported with the LQI controller")
+        C = integral_output_matrix(INTEGRAL_OUTPUTS, A.shape[0])
+        gains = design_lqi(A, B, C, params['Q'], params['R'], params['Q_i'], cache=_worker_gain_cache)
+        run_simulation_lqi(
+            A, B, gains, C,
+            params['initial_state'],
+            params['simulation_time'],
+            params['dt'],
+            reference_state=reference,
+            integrator='rk4',
+            params=plant,
+            metrics=accumulator,
+            recording=RecordingSpec.none()
+        )
+    else:
+        K = _worker_gain_cache.get(A, B, params['Q'], params['R']).K
+        run_simulation(
+            A, B, K,
+            params['initial_state'],
+            params['simulation_time'],
+            params['dt'],
+            reference_state=reference,
+            integrator='rk4',
+            params=plant,
+            metrics=accumulator,
+            recording=RecordingSpec.none(),
+            disturbances=disturbances
+        )
+
+    metrics = accumulator.result()
+    return [_finite_or_none(metrics[name]) for name in METRIC_COLUMNS]
+
+def _evaluate_point_safe(args):
+    base_params, point = args
+    try:
+        return evaluate_point(base_params, point), None
+    except Exception as e:
+        return [None] * len(METRIC_COLUMNS), str(e)
+
+def _pool_context():
+    # Workers start from a clean interpreter (forkserver where available,
+    # else spawn) instead of forking a threaded web worker
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+def get_executor(max_workers=None):
+    """Process-global pool with max_workers processes (None: one per CPU).
+
+    Pools are created on first use, so importing this module stays cheap, and
+    kept for the life of the process, one per distinct size; every caller
+    asking for the same size shares the same pool. Workers are not forked, so
+    scripts that use it need the usual `if __name__ == '__main__':` guard.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = int(max_workers)
+    if max_workers < 1:
+        raise ValueError("max_workers must be at least 1")
+
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=_pool_context())
+            _executors[max_workers] = executor
+        return executor
+
+def run_sweep(base_params, grid_spec, executor=None, max_workers=None, max_points=None):
+    controller = base_params.get('controller', 'lqr')
+    if controller not in SWEEP_CONTROLLERS:
+        raise ValueError(f"Unknown controller '{controller}'. Available: {', '.join(SWEEP_CONTROLLERS)}")
+    if controller == 'lqi' and base_params.get('disturbances'):
+        raise ValueError("Disturbance schedules are not supported with the LQI controller")
+    keys, points = build_sweep_grid(grid_spec, max_points)
+    if executor is None:
+        executor = get_executor(max_workers)
+
+    num_workers = getattr(executor, '_max_workers', None) or os.cpu_count() or 1
+    chunksize = max(1, len(points) // (4 * num_workers))
+
+    logger.info(f"Running sweep over {len(points)} grid points")
+
+    rows = []
+    errors = {}
+    results = executor.map(
+        _evaluate_point_safe,
+        ((base_params, point) for point in points),
+        chunksize=chunksize
+    )
+    for i, (point, (metrics, error)) in enumerate(zip(points, results)):
+        rows.append([point[key] for key in keys] + metrics)
+        if error is not None:
+            errors[i] = error
+
+    # Compact table: one row per grid point, parameters first then metrics
+    return {
+        'columns': keys + list(METRIC_COLUMNS),
+        'rows': rows,
+        'errors': errors
+    }
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from analysis import controllability_staircase, controllable_dimension, is_controllable, pbh_test
+from drone_model import get_state_space_matrices
+
+def _system_with_rank(rng, n, m, r):
+    # Controllable subspace of dimension r (generically), hidden by a random
+    # orthogonal change of basis
+    A = rng.normal(size=(n, n))
+    A[r:, :r] = 0.0
+    B = np.zeros((n, m))
+    B[:r] = rng.normal(size=(r, m))
+    T, _ = np.linalg.qr(rng.normal(size=(n, n)))
+    return T @ A @ T.T, T @ B
+
+@pytest.mark.parametrize('seed', range(5))
+def test_staircase_matches_known_rank_and_pbh(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(100):
+        n = int(rng.integers(2, 20))
+        m = int(rng.integers(1, 4))
+        r = int(rng.integers(0, n + 1))
+        A, B = _system_with_rank(rng, n, m, r)
+
+        nc, Z, blocks = controllability_staircase(A, B)
+        assert nc == r
+        assert sum(blocks) == r
+        assert n - len(pbh_test(A, B)) == r
+        np.testing.assert_allclose(Z.T @ Z, np.eye(n), atol=1e-10)
+
+def test_staircase_uncontrollable_modes_decouple():
+    rng = np.random.default_rng(42)
+    A, B = _system_with_rank(rng, 14, 1, 2)
+    nc, Z, _ = controllability_staircase(A, B)
+    assert nc == 2
+    assert not is_controllable(A, B)
+    H = Z.T @ A @ Z
+    assert np.max(np.abs(H[nc:, :nc])) < 1e-10
+    assert np.max(np.abs((Z.T @ B)[nc:])) < 1e-10
+
+def test_scaled_system_keeps_its_rank():
+    rng = np.random.default_rng(7)
+    A, B = _system_with_rank(rng, 10, 2, 6)
+    for scale in (1e-6, 1.0, 1e6):
+        assert controllable_dimension(scale * A, scale * B) == 6
+
+def test_drone_linearization_is_controllable():
+    A, B = get_state_space_matrices(0.0142, 0.0142, 0.0284, 1.0, 9.81)[:2]
+    assert is_controllable(A, B)
+    assert len(pbh_test(A, B)) == 0
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+from scipy.integrate import solve_ivp
+from disturbances import DisturbanceSchedule, Gust, Impulse, ParameterChange, StepForce
+from drone_model import get_state_space_matrices, nonlinear_dynamics
+from lqr_controller import design_lqr, lqr_control
+from simulation import (
+    DISTURBANCE_PARAMS, SIMULATION_PARAMS, run_simulation, run_simulation_batch, simulate_with_disturbance
+)
+
+INITIAL_STATE = np.array([0.3, -0.2, 0.1, 0, 0, 0, 0.05, -0.05, 0.1, 0, 0, 0])
+DT = 0.01
+
+@pytest.fixture(scope='module')
+def model():
+    params = DISTURBANCE_PARAMS
+    A, B = get_state_space_matrices(params['Ixx'], params['Iyy'], params['Izz'],
+                                    params['mass'], params['g'])
+    K = design_lqr(A, B, np.diag([10, 10, 10, 1, 1, 1, 10, 10, 10, 1, 1, 1]), np.eye(4))
+    return A, B, K
+
+def _baseline_simulate_with_disturbance(K, initial_state, simulation_time, dt,
+                                        disturbance_time, disturbance_force):
+    # The impulse loop simulate_with_disturbance had before the schedules
+    params = DISTURBANCE_PARAMS
+    hover_thrust = params['mass'] * params['g']
+    time = np.arange(0, simulation_time, dt)
+    states = np.zeros((len(time), len(initial_state)))
+    inputs = np.zeros((len(time), 4))
+    states[0] = initial_state
+    dist_idx = int(disturbance_time / dt)
+
+    for i in range(len(time) - 1):
+        t = time[i]
+        state = states[i]
+        u = np.copy(lqr_control(state, np.zeros_like(state), K))
+        u[0] += hover_thrust
+        if i == dist_idx:
+            u += disturbance_force
+        inputs[i] = u
+        sol = solve_ivp(lambda t, x: nonlinear_dynamics(t, x, u, params), [t, t + dt], state,
+                        method='RK45', t_eval=[t + dt])
+        states[i + 1] = sol.y[:, 0]
+
+    u = np.copy(lqr_control(states[-1], np.zeros_like(states[-1]), K))
+    u[0] += hover_thrust
+    inputs[-1] = u
+    return states, inputs
+
+def _control_inputs(K, states, params):
+    # Saturated LQR input about hover for recorded (T, 12) states
+    u = -states @ K.T
+    u[:, 0] = np.maximum(u[:, 0] + params['mass'] * params['g'], 0.0)
+    return u
+
+def test_impulse_wrapper_matches_pre_schedule_output(model):
+    A, B, K = model
+    force = np.array([0.0, 0.2, -0.1, 0.05])
+    result = simulate_with_disturbance(A, B, K, INITIAL_STATE, 1.5, DT, 0.5, force)
+    states, inputs = _baseline_simulate_with_disturbance(K, INITIAL_STATE, 1.5, DT, 0.5, force)
+    np.testing.assert_array_equal(result['states'], states)
+    np.testing.assert_array_equal(result['inputs'], inputs)
+
+def test_step_force_is_added_over_its_window(model):
+    A, B, K = model
+    force = np.array([0.5, 0.0, 0.01, 0.0])
+    schedule = DisturbanceSchedule([StepForce(0.2, force, duration=0.3)])
+    result = run_simulation(A, B, K, INITIAL_STATE, 1.0, DT, integrator='rk4',
+                            params=DISTURBANCE_PARAMS, disturbances=schedule)
+
+    applied = result['inputs'] - _control_inputs(K, result['states'], DISTURBANCE_PARAMS)
+    expected = np.zeros_like(applied)
+    expected[20:50] = force
+    np.testing.assert_allclose(applied, expected, atol=1e-12)
+
+def test_gust_follows_one_minus_cosine(model):
+    A, B, K = model
+    force = np.array([0.0, 0.0, 0.0, 0.02])
+    schedule = DisturbanceSchedule([Gust(0.2, 0.4, force)])
+    result = run_simulation(A, B, K, INITIAL_STATE, 1.0, DT, integrator='rk4',
+                            params=DISTURBANCE_PARAMS, disturbances=schedule)
+
+    applied = result['inputs'] - _control_inputs(K, result['states'], DISTURBANCE_PARAMS)
+    phase = (result['time'] - 0.2) / 0.4
+    weight = np.where((phase >= 0) & (phase < 1), 0.5 * (1 - np.cos(2 * np.pi * phase)), 0.0)
+    weight[-1] = 0.0
+    np.testing.assert_allclose(applied, weight[:, None] * force, atol=1e-12)
+    assert applied[40, 3] == pytest.approx(force[3])
+
+def test_parameter_change_rebuilds_the_integrator(model):
+    A, B, K = model
+    # An inertia change leaves the nominal hover thrust alone, so the run after
+    # the change is a fresh run on the changed airframe from the same state
+    changed = {**SIMULATION_PARAMS, 'Ixx': 0.05}
+    schedule = DisturbanceSchedule([ParameterChange(0.5, Ixx=0.05)])
+    result = run_simulation(A, B, K, INITIAL_STATE, 1.0, DT, integrator='rk4', disturbances=schedule)
+    nominal = run_simulation(A, B, K, INITIAL_STATE, 1.0, DT, integrator='rk4')
+    after = run_simulation(A, B, K, result['states'][50], 0.5, DT, integrator='rk4', params=changed)
+
+    np.testing.assert_array_equal(result['states'][:51], nominal['states'][:51])
+    np.testing.assert_array_equal(result['states'][50:], after['states'])
+    assert not np.allclose(result['states'][-1], nominal['states'][-1])
+
+def test_batch_schedules_are_per_trajectory(model):
+    A, B, K = model
+    schedules = [
+        DisturbanceSchedule([Impulse(0.3, [0.0, 0.2, 0.0, 0.0])]),
+        DisturbanceSchedule([StepForce(0.1, [0.3, 0.0, 0.0, 0.0])]),
+        DisturbanceSchedule([ParameterChange(0.4, mass=1.3)])
+    ]
+    initial_states = np.tile(INITIAL_STATE, (len(schedules), 1))
+    batch = run_simulation_batch(A, B, K, initial_states, 1.0, DT, disturbances=schedules)
+
+    for j, schedule in enumerate(schedules):
+        single = run_simulation(A, B, K, INITIAL_STATE, 1.0, DT, integrator='rk4', disturbances=schedule)
+        np.testing.assert_allclose(batch['states'][:, j], single['states'], rtol=1e-10, atol=1e-12)
+        np.testing.assert_allclose(batch['inputs'][:, j], single['inputs'], rtol=1e-10, atol=1e-12)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from drone_model import (
+    LINEARIZATION_METHODS, clear_linearization_cache, get_state_space_matrices, linearize_model
+)
+
+PARAMS = {'Ixx': 0.0221, 'Iyy': 0.0281, 'Izz': 0.0366, 'mass': 1.1, 'g': 9.81}
+
+def _random_trim(rng):
+    state = rng.uniform(-1.0, 1.0, 12)
+    state[6:8] = rng.uniform(-0.6, 0.6, 2)  # keep pitch away from +-90 degrees
+    u = np.array([PARAMS['mass'] * PARAMS['g'], 0.0, 0.0, 0.0]) + rng.uniform(-0.1, 0.1, 4)
+    return state, u
+
+@pytest.mark.parametrize('method', LINEARIZATION_METHODS)
+def test_hover_linearization_matches_state_space_model(method):
+    A_ref, B_ref = get_state_space_matrices(PARAMS['Ixx'], PARAMS['Iyy'], PARAMS['Izz'],
+                                            PARAMS['mass'], PARAMS['g'])
+    u0 = np.array([PARAMS['mass'] * PARAMS['g'], 0.0, 0.0, 0.0])
+    A, B = linearize_model(np.zeros(12), u0, PARAMS, method=method, cache=False)
+    np.testing.assert_allclose(A, A_ref, atol=1e-6)
+    np.testing.assert_allclose(B, B_ref, atol=1e-6)
+
+def test_methods_agree_at_random_states():
+    rng = np.random.default_rng(3)
+    for _ in range(20):
+        state, u = _random_trim(rng)
+        A_c, B_c = linearize_model(state, u, PARAMS, method='complex', cache=False)
+        A_a, B_a = linearize_model(state, u, PARAMS, method='analytic', cache=False)
+        A_d, B_d = linearize_model(state, u, PARAMS, method='central', cache=False)
+
+        # Complex step and the closed form are both exact up to roundoff
+        np.testing.assert_allclose(A_a, A_c, rtol=1e-10, atol=1e-10)
+        np.testing.assert_allclose(B_a, B_c, rtol=1e-10, atol=1e-10)
+        np.testing.assert_allclose(A_d, A_c, rtol=1e-5, atol=1e-5)
+        np.testing.assert_allclose(B_d, B_c, rtol=1e-5, atol=1e-5)
+
+def test_cache_hit_returns_shared_read_only_arrays():
+    clear_linearization_cache()
+    state, u = _random_trim(np.random.default_rng(5))
+    first = linearize_model(state, u, PARAMS, method='analytic')
+    second = linearize_model(state.copy(), u.copy(), PARAMS, method='analytic')
+
+    for cached, again in zip(first, second):
+        assert cached is again
+        assert not again.flags.writeable
+        with pytest.raises(ValueError):
+            again[0, 0] = 1.0
+
+    # Uncached results are private to the caller
+    A, _ = linearize_model(state, u, PARAMS, method='analytic', cache=False)
+    assert A.flags.writeable
+
+def test_cache_key_includes_airframe():
+    clear_linearization_cache()
+    state, u = _random_trim(np.random.default_rng(6))
+    A1, _ = linearize_model(state, u, PARAMS, method='analytic')
+    A2, _ = linearize_model(state, u, {**PARAMS, 'Ixx': 0.03}, method='analytic')
+    assert A1 is not A2
+    assert not np.array_equal(A1, A2)
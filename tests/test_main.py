@@ -0,0 +1,104 @@
+import time
+import pytest
+import main
+
+@pytest.fixture
+def client():
+    main.response_cache.clear()
+    return main.app.test_client()
+
+def _wait_for_job(client, job_id, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/jobs/{job_id}').get_json()['job']
+        if job['status'] in ('done', 'failed', 'cancelled'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+def test_job_runs_requested_mode(client):
+    payload = {'simulation_time': 0.5, 'initial_state': [0.5] + [0.0] * 11}
+    direct = client.post('/run_simulation', json={**payload, 'mode': 'lqi'}).get_json()['result']
+
+    response = client.post('/jobs', json={**payload, 'mode': 'lqi'})
+    assert response.status_code == 202
+    job = _wait_for_job(client, response.get_json()['job_id'])
+
+    assert job['status'] == 'done'
+    assert job['result']['K'] == direct['K']
+    assert job['result']['states'] == direct['states']
+
+def test_job_rejects_unknown_mode(client):
+    response = client.post('/jobs', json={'simulation_time': 0.5, 'mode': 'bogus'})
+    assert response.status_code == 400
+    assert 'bogus' in response.get_json()['error']
+
+@pytest.mark.parametrize('query', ['{not json', '{"dt": "fast"}', '{"chunk_size": "big"}'])
+def test_stream_rejects_bad_params(client, query):
+    response = client.get('/stream_simulation', query_string={'params': query})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+def test_stream_sends_chunks(client):
+    response = client.get('/stream_simulation', query_string={'params': '{"simulation_time": 0.5}'})
+    body = response.get_data(as_text=True)
+    assert response.mimetype == 'text/event-stream'
+    assert 'event: meta' in body and 'event: chunk' in body and 'event: end' in body
+
+@pytest.mark.parametrize('endpoint', ['/run_simulation', '/report'])
+def test_unknown_mode_is_a_bad_request(client, endpoint):
+    response = client.post(endpoint, json={'simulation_time': 0.5, 'mode': 'bogus'})
+    assert response.status_code == 400
+    assert 'bogus' in response.get_json()['error']
+
+@pytest.mark.parametrize('query', [
+    '{"mode": "lqi"}',
+    '{"mode": "bogus"}',
+    '{"disturbances": [{"type": "impulse", "time": 0.1, "force": [0, 0.1, 0, 0]}]}'
+])
+def test_stream_rejects_unsupported_options(client, query):
+    response = client.get('/stream_simulation', query_string={'params': query})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+def test_csv_reference_without_data_is_a_bad_request(client):
+    response = client.post('/run_simulation', json={'simulation_time': 0.5, 'reference': {'type': 'csv'}})
+    assert response.status_code == 400
+    assert "requires 'data'" in response.get_json()['error']
+
+def test_metrics_come_from_the_full_resolution_run(client):
+    import numpy as np
+    from encoding import decode_binary_result
+    from utils import compute_performance_metrics
+    payload = {'simulation_time': 2.0, 'dt': 0.001, 'initial_state': [0.5] + [0.0] * 11}
+    full = main.simulate(main.merge_params(payload))
+    expected = compute_performance_metrics(full)
+
+    for accept in ('application/json', main.BINARY_MIMETYPE):
+        response = client.post('/run_simulation', json={**payload, 'max_points': 200},
+                               headers={'Accept': accept})
+        if accept == 'application/json':
+            body = response.get_json()
+            metrics, samples = body['metrics'], len(body['result']['time'])
+        else:
+            result, meta = decode_binary_result(response.get_data())
+            metrics, samples = meta['metrics'], len(result['time'])
+        assert samples == 200
+        assert metrics['rmse_position'] == pytest.approx(expected['rmse_position'])
+        assert metrics['max_position_error'] == pytest.approx(expected['max_position_error'])
+
+@pytest.mark.parametrize('fmt, mimetype, signature', [
+    ('png', 'image/png', b'\x89PNG'),
+    ('svg', 'image/svg+xml', b'<svg'),
+    ('pdf', 'application/pdf', b'%PDF')
+])
+def test_report_endpoint_formats(client, fmt, mimetype, signature):
+    response = client.post(f'/report?format={fmt}', json={'simulation_time': 0.5})
+    assert response.status_code == 200
+    assert response.mimetype == mimetype
+    assert signature in response.get_data()[:512]
+
+def test_report_endpoint_rejects_unknown_format(client):
+    response = client.post('/report?format=bmp', json={'simulation_time': 0.5})
+    assert response.status_code == 400
+    assert "Unsupported report format 'bmp'" in response.get_json()['error']
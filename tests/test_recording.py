@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from drone_model import get_state_space_matrices
+from lqr_controller import design_lqr
+from recording import RecordingSpec
+from simulation import SIMULATION_PARAMS, run_simulation
+from trajectory_store import MemmapTrajectoryStore
+from utils import compute_performance_metrics, decimate_result
+
+INITIAL_STATE = np.array([1.0, -0.5, 0.8, 0, 0, 0, 0.2, -0.1, 0.3, 0, 0, 0])
+
+@pytest.fixture(scope='module')
+def model():
+    params = SIMULATION_PARAMS
+    A, B = get_state_space_matrices(params['Ixx'], params['Iyy'], params['Izz'],
+                                    params['mass'], params['g'])
+    K = design_lqr(A, B, np.eye(12), np.eye(4))
+    return A, B, K
+
+def _run(model, recording):
+    A, B, K = model
+    return run_simulation(A, B, K, INITIAL_STATE, 1.0, 0.01, integrator='rk4', recording=recording)
+
+def test_subset_recording_keeps_selected_columns(model):
+    full = _run(model, RecordingSpec())
+    subset = _run(model, RecordingSpec(states=['position', 'rates']))
+
+    columns = [0, 1, 2, 9, 10, 11]
+    assert full.full_state and not subset.full_state
+    np.testing.assert_array_equal(subset['states'], full['states'][:, columns])
+    np.testing.assert_array_equal(subset['error'], full['error'][:, columns])
+
+def test_subset_recording_rejected_by_metrics_and_decimation(model):
+    subset = _run(model, RecordingSpec(states=['position', 'attitude']))
+    with pytest.raises(ValueError, match="full state history"):
+        compute_performance_metrics(subset)
+    with pytest.raises(ValueError, match="full state history"):
+        decimate_result(subset, 10)
+
+def test_subset_recording_rejected_out_of_core(model, tmp_path):
+    store = MemmapTrajectoryStore(str(tmp_path / 'run'))
+    subset = _run(model, RecordingSpec(states=['position'], store=store))
+    assert subset.out_of_core
+    with pytest.raises(ValueError, match="full state history"):
+        compute_performance_metrics(subset)
+
+def test_full_recording_metrics_unchanged(model):
+    full = _run(model, RecordingSpec())
+    metrics = compute_performance_metrics(full)
+    assert metrics['max_position_error'] == pytest.approx(np.linalg.norm(INITIAL_STATE[0:3]))
+    assert len(decimate_result(full, 10)['time']) == 10
+
+def test_empty_state_selection_is_rejected():
+    with pytest.raises(ValueError, match="states=None"):
+        RecordingSpec(states=[])
+    assert RecordingSpec(states=None).state_indices(12) is None
+
+def test_decimate_keeps_derived_series(model):
+    full = _run(model, RecordingSpec())
+    decimated = decimate_result(full, 10)
+    indices = decimated['indices']
+    for name in ('states', 'inputs', 'reference', 'error'):
+        np.testing.assert_array_equal(decimated[name], full[name][indices])
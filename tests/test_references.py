@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+from references import SampledPathReference, build_reference
+
+def test_csv_reference_requires_data():
+    with pytest.raises(ValueError, match="csv reference requires 'data'"):
+        build_reference({'type': 'csv'})
+
+def test_csv_reference_rejects_unknown_options():
+    with pytest.raises(ValueError, match="Invalid 'csv' reference"):
+        build_reference({'type': 'csv', 'data': "0,0,0,0\n1,1,0,0", 'speed': 2})
+
+def test_csv_reference_from_text():
+    reference = build_reference({'type': 'csv', 'data': "t,x,y,z\n0,0,0,0\n1,1,2,3"})
+    assert isinstance(reference, SampledPathReference)
+    np.testing.assert_allclose(reference.evaluate(np.array([1.0]))[0, 0:3], [1, 2, 3])
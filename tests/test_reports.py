@@ -0,0 +1,41 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from reports import REPORT_FORMATS, ReportRenderer, render_reports
+
+SIGNATURES = {'png': b'\x89PNG', 'svg': b'<svg', 'pdf': b'%PDF'}
+
+def _result(steps=200, offset=0.0):
+    time = np.linspace(0, 2.0, steps)
+    states = np.zeros((steps, 12))
+    states[:, 0] = offset + np.exp(-time)
+    states[:, 6] = 0.1 * np.sin(time)
+    return {'time': time, 'states': states, 'inputs': np.ones((steps, 4)), 'reference': np.zeros(12)}
+
+def test_renderer_is_reused_across_formats():
+    with ReportRenderer(figsize=(6, 4), dpi=50) as renderer:
+        figure = renderer.fig
+        for fmt in REPORT_FORMATS:
+            for offset in (0.0, 1.0):
+                body = renderer.render(_result(offset=offset), format=fmt)
+                assert SIGNATURES[fmt] in body[:512]
+        assert renderer.fig is figure
+
+def test_renderer_rejects_unknown_format():
+    with ReportRenderer(figsize=(6, 4), dpi=50) as renderer:
+        with pytest.raises(ValueError, match="Unsupported report format 'bmp'"):
+            renderer.render(_result(), format='bmp')
+
+def test_render_reports_reports_failures_per_source(tmp_path):
+    sources = [_result(), {'time': np.linspace(0, 1, 10)}, _result(offset=2.0)]
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        paths, errors = render_reports(sources, str(tmp_path), format='png', executor=executor)
+
+    assert [os.path.basename(path) for path in paths] == [
+        'report_00000.png', 'report_00001.png', 'report_00002.png'
+    ]
+    assert list(errors) == [1]
+    assert 'states' in errors[1]
+    assert os.path.getsize(paths[0]) > 0 and os.path.getsize(paths[2]) > 0
+    assert not os.path.exists(paths[1])
@@ -0,0 +1,18 @@
+import numpy as np
+import response_cache
+from response_cache import response_cache_key
+
+PARAMS = {'dt': 0.01, 'simulation_time': 15, 'initial_state': np.zeros(12)}
+
+def test_key_ignores_number_type_and_order():
+    reordered = {'initial_state': [0] * 12, 'simulation_time': 15.0, 'dt': 0.01}
+    assert response_cache_key(PARAMS, mode='nonlinear') == response_cache_key(reordered, mode='nonlinear')
+
+def test_key_depends_on_integrator():
+    assert (response_cache_key(PARAMS, mode='nonlinear', integrator='rk4')
+            != response_cache_key(PARAMS, mode='nonlinear', integrator='rk45'))
+
+def test_key_depends_on_cache_version(monkeypatch):
+    before = response_cache_key(PARAMS, mode='nonlinear')
+    monkeypatch.setattr(response_cache, 'CACHE_VERSION', response_cache.CACHE_VERSION + 1)
+    assert response_cache_key(PARAMS, mode='nonlinear') != before
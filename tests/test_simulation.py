@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from scipy.integrate import solve_ivp
+from drone_model import get_state_space_matrices, nonlinear_dynamics
+from lqr_controller import design_lqr, lqr_control
+from simulation import SIMULATION_PARAMS, run_simulation
+
+INITIAL_STATE = np.array([1.0, -0.5, 0.8, 0, 0, 0, 0.2, -0.1, 0.3, 0, 0, 0])
+SIMULATION_TIME = 3.0
+DT = 0.01
+
+# (initial state scale, largest deviation from RK45) for the fast paths at the
+# default dt. RK4 is ~4e-7 away; ZOH propagates the hover linearization, so it
+# is only checked close to hover, where it is ~2e-3 away
+TOLERANCES = {'rk4': (1.0, 1e-6), 'zoh': (0.1, 5e-3)}
+
+def _baseline_run_simulation(A, B, K, initial_state, simulation_time, dt):
+    # The solve_ivp loop run_simulation had before the integrator layer
+    params = SIMULATION_PARAMS
+    hover_thrust = params['mass'] * params['g']
+    time = np.arange(0, simulation_time, dt)
+    states = np.zeros((len(time), len(initial_state)))
+    inputs = np.zeros((len(time), 4))
+    reference = np.zeros(len(initial_state))
+    states[0] = initial_state
+
+    for i in range(len(time) - 1):
+        t = time[i]
+        state = states[i]
+        u = np.copy(lqr_control(state, reference, K))
+        u[0] += hover_thrust
+        u[0] = max(0, u[0])
+        inputs[i] = u
+        sol = solve_ivp(lambda t, x: nonlinear_dynamics(t, x, u, params), [t, t + dt], state,
+                        method='RK45', t_eval=[t + dt])
+        assert sol.success
+        states[i + 1] = sol.y[:, 0]
+
+    u = np.copy(lqr_control(states[-1], reference, K))
+    u[0] += hover_thrust
+    u[0] = max(0, u[0])
+    inputs[-1] = u
+    return time, states, inputs
+
+@pytest.fixture(scope='module')
+def model():
+    # Controller model of the simulated airframe, so ZOH sees the same plant
+    params = SIMULATION_PARAMS
+    A, B = get_state_space_matrices(params['Ixx'], params['Iyy'], params['Izz'],
+                                    params['mass'], params['g'])
+    K = design_lqr(A, B, np.diag([10, 10, 10, 1, 1, 1, 10, 10, 10, 1, 1, 1]), np.eye(4))
+    return A, B, K
+
+@pytest.fixture(scope='module')
+def rk45_result(model):
+    A, B, K = model
+    return run_simulation(A, B, K, INITIAL_STATE, SIMULATION_TIME, DT, integrator='rk45')
+
+def test_default_integrator_is_rk45(model, rk45_result):
+    A, B, K = model
+    result = run_simulation(A, B, K, INITIAL_STATE, SIMULATION_TIME, DT)
+    np.testing.assert_array_equal(result['states'], rk45_result['states'])
+
+def test_rk45_reproduces_baseline_trajectory(model, rk45_result):
+    A, B, K = model
+    time, states, inputs = _baseline_run_simulation(A, B, K, INITIAL_STATE, SIMULATION_TIME, DT)
+    np.testing.assert_array_equal(rk45_result['time'], time)
+    np.testing.assert_array_equal(rk45_result['states'], states)
+    np.testing.assert_array_equal(rk45_result['inputs'], inputs)
+    np.testing.assert_array_equal(rk45_result['error'], states)
+
+@pytest.mark.parametrize('integrator', sorted(TOLERANCES))
+def test_fixed_step_integrators_track_rk45(model, integrator):
+    A, B, K = model
+    scale, tolerance = TOLERANCES[integrator]
+    initial_state = scale * INITIAL_STATE
+    reference = run_simulation(A, B, K, initial_state, SIMULATION_TIME, DT, integrator='rk45')
+    result = run_simulation(A, B, K, initial_state, SIMULATION_TIME, DT, integrator=integrator)
+    assert np.max(np.abs(result['states'] - reference['states'])) < tolerance
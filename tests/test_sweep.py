@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+import sweep
+from sweep import get_executor, run_sweep
+
+BASE_PARAMS = {
+    'Ixx': 0.0221, 'Iyy': 0.0221, 'Izz': 0.0366, 'mass': 1.0, 'g': 9.81,
+    'simulation_time': 0.5, 'dt': 0.01, 'initial_state': np.full(12, 0.1),
+    'Q': np.eye(12), 'R': np.eye(4), 'Q_i': np.eye(3)
+}
+
+def test_executor_is_shared_per_size():
+    one = get_executor(1)
+    two = get_executor(2)
+    assert one is get_executor(1)
+    assert two is not one
+    assert one._max_workers == 1 and two._max_workers == 2
+    assert one._mp_context.get_start_method() != 'fork'
+
+def test_executor_rejects_bad_size():
+    with pytest.raises(ValueError):
+        get_executor(0)
+
+def test_unknown_controller_fails_before_any_work(monkeypatch):
+    monkeypatch.setattr(sweep, 'get_executor', lambda *args: pytest.fail("executor requested"))
+    with pytest.raises(ValueError, match="Unknown controller 'pid'"):
+        run_sweep({**BASE_PARAMS, 'controller': 'pid'}, {'mass': [1.0]})
+
+def test_sweep_runs_on_requested_pool():
+    table = run_sweep(BASE_PARAMS, {'mass': [1.0, 1.2]}, max_workers=1)
+    assert table['errors'] == {}
+    assert [row[0] for row in table['rows']] == [1.0, 1.2]
@@ -0,0 +1,49 @@
+import numpy as np
+from visualization import animation_frames, animation_geometry
+
+class RecordingArray:
+    # Wraps an array and records every index used to read it
+    def __init__(self, array):
+        self.array = array
+        self.reads = []
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        self.reads.append(index)
+        return self.array[index]
+
+def test_animation_geometry_reads_only_sampled_rows():
+    time = np.arange(0, 20.0, 0.001)
+    states = np.zeros((len(time), 12))
+    states[:, 0] = np.sin(time)
+    states[:, 2] = time
+    recorded = RecordingArray(states)
+
+    geometry = animation_geometry(time, recorded, fps=10)
+
+    frames = animation_frames(time, fps=10)
+    assert len(recorded.reads) == 1
+    np.testing.assert_array_equal(recorded.reads[0], frames)
+    sampled = states[frames, 0:3]
+    for k, (low, high) in enumerate(geometry.limits):
+        assert low == sampled[:, k].min() - 1
+        assert high == sampled[:, k].max() + 1
+
+def test_create_animation_defaults_to_every_sample_and_full_trail():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from visualization import create_animation
+
+    time = np.arange(0, 2.0, 0.01)
+    states = np.zeros((len(time), 12))
+    states[:, 0] = time
+    anim, fig = create_animation(time, states)
+    try:
+        scene = anim._func.__self__
+        assert len(scene.geometry.frames) == len(time)
+        assert scene.trail_frames is None
+    finally:
+        plt.close(fig)
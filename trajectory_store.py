@@ -0,0 +1,92 @@
+import os
+import json
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METADATA_FILE = 'trajectory.json'
+
+class MemmapTrajectoryStore:
+    """Writes simulation histories into np.memmap files under one directory.
+
+    Pass it as RecordingSpec(store=...) and run_simulation /
+    simulate_with_disturbance / run_simulation_batch fill the files directly
+    instead of RAM arrays. open_trajectory() maps a finished run back
+    read-only, so results far larger than memory can be inspected lazily.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.arrays = {}
+        self.metadata = {'arrays': {}}
+
+    def allocate(self, name, shape, dtype=np.float64):
+        dtype = np.dtype(dtype)
+        filename = f"{name}.bin"
+        path = os.path.join(self.directory, filename)
+
+        # np.memmap cannot map an empty file, so zero-length arrays stay in RAM
+        if int(np.prod(shape)) == 0:
+            array = np.zeros(shape, dtype=dtype)
+        else:
+            array = np.memmap(path, dtype=dtype, mode='w+', shape=tuple(shape))
+
+        self.arrays[name] = array
+        self.metadata['arrays'][name] = {
+            'file': filename,
+            'dtype': dtype.str,
+            'shape': list(shape)
+        }
+        return array
+
+    def save(self, name, values):
+        array = self.allocate(name, np.shape(values), np.asarray(values).dtype)
+        array[...] = values
+        return array
+
+    def finalize(self, **attributes):
+        # Flush every memmap and record run attributes (reference, final state, ...)
+        for array in self.arrays.values():
+            if isinstance(array, np.memmap):
+                array.flush()
+
+        for key, value in attributes.items():
+            self.metadata[key] = np.asarray(value).tolist() if value is not None else None
+
+        with open(os.path.join(self.directory, METADATA_FILE), 'w') as f:
+            json.dump(self.metadata, f, indent=2)
+
+        logger.info(f"Trajectory written to {self.directory}")
+
+def open_trajectory(directory, mode='r'):
+    # Map a stored run back as a SimulationResult of memmap views (nothing is read yet)
+    from recording import SimulationResult
+
+    with open(os.path.join(directory, METADATA_FILE)) as f:
+        metadata = json.load(f)
+
+    arrays = {}
+    for name, entry in metadata['arrays'].items():
+        shape = tuple(entry['shape'])
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.zeros(shape, dtype=entry['dtype'])
+        else:
+            arrays[name] = np.memmap(os.path.join(directory, entry['file']),
+                                     dtype=entry['dtype'], mode=mode, shape=shape)
+
+    # A tracked trajectory is stored as its own array rather than in the metadata
+    reference = arrays.pop('reference', None)
+    time_varying = reference is not None
+    if not time_varying:
+        reference = metadata.get('reference_state')
+
+    state_indices = metadata.get('state_indices')
+    return SimulationResult(
+        arrays,
+        reference,
+        metadata.get('final_state'),
+        state_indices=slice(None) if state_indices is None else np.array(state_indices),
+        time_varying=time_varying
+    )
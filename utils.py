@@ -4,57 +4,112 @@ import logging
 logger = logging.getLogger(__name__)
 
 def rotation_matrix(phi, theta, psi):
+    # Inertial-to-body rotation for Z-Y-X Euler angles. Angles may be scalars or
+    # arrays of any (matching) shape, e.g. (T,) or (T, N) attitude histories;
+    # the result has shape angles.shape + (3, 3).
+    phi, theta, psi = np.broadcast_arrays(
+        np.asarray(phi, dtype=float), np.asarray(theta, dtype=float), np.asarray(psi, dtype=float)
+    )
+    
     # Pre-compute trigonometric functions
     c_phi, s_phi = np.cos(phi), np.sin(phi)
     c_theta, s_theta = np.cos(theta), np.sin(theta)
     c_psi, s_psi = np.cos(psi), np.sin(psi)
     
-    # Compute rotation matrix
-    R = np.array([
-        [c_theta * c_psi, c_theta * s_psi, -s_theta],
-        [s_phi * s_theta * c_psi - c_phi * s_psi, s_phi * s_theta * s_psi + c_phi * c_psi, s_phi * c_theta],
-        [c_phi * s_theta * c_psi + s_phi * s_psi, c_phi * s_theta * s_psi - s_phi * c_psi, c_phi * c_theta]
-    ])
+    # Compute rotation matrices
+    R = np.empty(phi.shape + (3, 3))
+    R[..., 0, 0] = c_theta * c_psi
+    R[..., 0, 1] = c_theta * s_psi
+    R[..., 0, 2] = -s_theta
+    R[..., 1, 0] = s_phi * s_theta * c_psi - c_phi * s_psi
+    R[..., 1, 1] = s_phi * s_theta * s_psi + c_phi * c_psi
+    R[..., 1, 2] = s_phi * c_theta
+    R[..., 2, 0] = c_phi * s_theta * c_psi + s_phi * s_psi
+    R[..., 2, 1] = c_phi * s_theta * s_psi - s_phi * c_psi
+    R[..., 2, 2] = c_phi * c_theta
     
     return R
 
 def euler_from_quaternion(quaternion):
-    w, x, y, z = quaternion
+    # [w, x, y, z] along the last axis -> [roll, pitch, yaw] along the last axis
+    quaternion = np.asarray(quaternion, dtype=float)
+    w, x, y, z = np.moveaxis(quaternion, -1, 0)
+    
+    euler = np.empty(quaternion.shape[:-1] + (3,))
     
     # Roll (x-axis rotation)
     sinr_cosp = 2 * (w * x + y * z)
     cosr_cosp = 1 - 2 * (x * x + y * y)
-    roll = np.arctan2(sinr_cosp, cosr_cosp)
+    euler[..., 0] = np.arctan2(sinr_cosp, cosr_cosp)
     
-    # Pitch (y-axis rotation)
+    # Pitch (y-axis rotation); clipping gives +-90 degrees when out of range
     sinp = 2 * (w * y - z * x)
-    if np.abs(sinp) >= 1:
-        pitch = np.copysign(np.pi / 2, sinp)  # Use 90 degrees if out of range
-    else:
-        pitch = np.arcsin(sinp)
+    euler[..., 1] = np.arcsin(np.clip(sinp, -1.0, 1.0))
     
     # Yaw (z-axis rotation)
     siny_cosp = 2 * (w * z + x * y)
     cosy_cosp = 1 - 2 * (y * y + z * z)
-    yaw = np.arctan2(siny_cosp, cosy_cosp)
+    euler[..., 2] = np.arctan2(siny_cosp, cosy_cosp)
     
-    return np.array([roll, pitch, yaw])
+    return euler
 
 def quaternion_from_euler(roll, pitch, yaw):
+    # Scalars or arrays of any (matching) shape -> [w, x, y, z] along a new last axis
+    roll, pitch, yaw = np.broadcast_arrays(
+        np.asarray(roll, dtype=float), np.asarray(pitch, dtype=float), np.asarray(yaw, dtype=float)
+    )
+    
     # Pre-compute values
     cr, sr = np.cos(roll * 0.5), np.sin(roll * 0.5)
     cp, sp = np.cos(pitch * 0.5), np.sin(pitch * 0.5)
     cy, sy = np.cos(yaw * 0.5), np.sin(yaw * 0.5)
     
-    # Compute quaternion
-    w = cr * cp * cy + sr * sp * sy
-    x = sr * cp * cy - cr * sp * sy
-    y = cr * sp * cy + sr * cp * sy
-    z = cr * cp * sy - sr * sp * cy
+    # Compute quaternions
+    quaternion = np.empty(roll.shape + (4,))
+    quaternion[..., 0] = cr * cp * cy + sr * sp * sy
+    quaternion[..., 1] = sr * cp * cy - cr * sp * sy
+    quaternion[..., 2] = cr * sp * cy + sr * cp * sy
+    quaternion[..., 3] = cr * cp * sy - sr * sp * cy
+    
+    return quaternion
+
+def rotation_matrix_from_quaternion(quaternion):
+    # Same rotation as rotation_matrix for the equivalent Euler angles, without
+    # trigonometric functions; quaternions are [w, x, y, z] along the last axis
+    quaternion = np.asarray(quaternion, dtype=float)
+    w, x, y, z = np.moveaxis(quaternion, -1, 0)
+    
+    R = np.empty(quaternion.shape[:-1] + (3, 3))
+    R[..., 0, 0] = 1 - 2 * (y * y + z * z)
+    R[..., 0, 1] = 2 * (x * y + w * z)
+    R[..., 0, 2] = 2 * (x * z - w * y)
+    R[..., 1, 0] = 2 * (x * y - w * z)
+    R[..., 1, 1] = 1 - 2 * (x * x + z * z)
+    R[..., 1, 2] = 2 * (y * z + w * x)
+    R[..., 2, 0] = 2 * (x * z + w * y)
+    R[..., 2, 1] = 2 * (y * z - w * x)
+    R[..., 2, 2] = 1 - 2 * (x * x + y * y)
     
-    return np.array([w, x, y, z])
+    return R
+
+# Rows per chunk when computing metrics over memory-mapped results
+METRICS_CHUNK_ROWS = 65536
+
+def _require_full_states(result, what):
+    # Column positions (0:3 position, 6:9 attitude, ...) only hold for full
+    # state histories; a subset RecordingSpec renumbers them
+    if 'states' in result and not getattr(result, 'full_state', True):
+        raise ValueError(f"{what} needs the full state history, but only "
+                         f"{result['states'].shape[-1]} state columns were recorded; "
+                         f"use RecordingSpec(states='all')")
 
 def compute_performance_metrics(result):
+    _require_full_states(result, "compute_performance_metrics")
+    
+    # Memory-mapped histories are reduced chunk by chunk instead of loaded whole
+    if getattr(result, 'out_of_core', False):
+        return _compute_performance_metrics_chunked(result)
+    
     # Extract data
     time = result['time']
     states = result['states']
@@ -80,13 +135,13 @@ def compute_performance_metrics(result):
     rmse_position = np.sqrt(np.mean(position_error_norm**2))
     
     # Integral of absolute error
-    iae_position = np.trapz(position_error_norm, time)
+    iae_position = np.trapezoid(position_error_norm, time)
     
     # Maximum control effort
     max_control_effort = np.max(np.linalg.norm(inputs, axis=1))
     
     # Total control energy
-    control_energy = np.trapz(np.sum(inputs**2, axis=1), time)
+    control_energy = np.trapezoid(np.sum(inputs**2, axis=1), time)
     
     # Angular error metrics
     orientation_error_norm = np.linalg.norm(error[:, 6:9], axis=1)
@@ -106,3 +161,310 @@ def compute_performance_metrics(result):
     }
     
     return metrics
+
+def _compute_performance_metrics_chunked(result, chunk_rows=METRICS_CHUNK_ROWS):
+    time = result['time']
+    inputs = result['inputs']
+    accumulator = PerformanceMetricsAccumulator()
+    for start in range(0, len(time), chunk_rows):
+        stop = start + chunk_rows
+        accumulator.update_many(time[start:stop], result.error_chunk(start, stop), inputs[start:stop])
+    return accumulator.result()
+
+class PerformanceMetricsAccumulator:
+    """Running version of compute_performance_metrics, updated once per step.
+
+    `update(t, error, u)` takes one sample: error (12,) and u (4,), or (N, 12)
+    and (N, 4) for a batch of N trajectories. Samples are buffered in small
+    chunks and reduced with vectorized NumPy, so the full error/input histories
+    are never stored. `update_many(times, errors, inputs)` feeds a block of
+    samples (leading time axis) at once. `result()` returns the same dict as
+    compute_performance_metrics (with (N,) arrays for a batch).
+    """
+
+    def __init__(self, chunk_size=256):
+        self.chunk_size = chunk_size
+        self.count = 0
+        self.single = True
+        
+        # Chunk buffers, allocated on the first sample once N is known
+        self._t = None
+        self._error = None
+        self._u = None
+        self._fill = 0
+        
+        # Last reduced sample, carried over for the trapezoidal integrals
+        self.t_prev = None
+        self.pos_prev = None
+        self.energy_prev = None
+        
+        self.max_position_error = None
+        self.sum_sq_position = None
+        self.iae_position = None
+        self.max_control_effort = None
+        self.control_energy = None
+        self.sum_sq_orientation = None
+        self.max_orientation_error = None
+        
+        # Settling time is the first sample below 2% of the *final* maximum, which
+        # is only known at the end. Every earlier qualifying sample is a new running
+        # minimum, so only those are kept, and only until a minimum falls below 2%
+        # of the running maximum (later samples can no longer be the first).
+        self.running_min = None
+        self.settled = None
+        self.candidate_times = []
+        self.candidate_values = []
+
+    def update(self, t, error, u):
+        if self._t is None:
+            # A single trajectory is handled as a batch of one
+            self.single = np.ndim(error) == 1
+            num = 1 if self.single else len(error)
+            self._t = np.empty(self.chunk_size)
+            self._error = np.empty((self.chunk_size, num, 12))
+            self._u = np.empty((self.chunk_size, num, 4))
+        
+        k = self._fill
+        self._t[k] = t
+        self._error[k] = error
+        self._u[k] = u
+        self._fill = k + 1
+        
+        if self._fill == self.chunk_size:
+            self._flush()
+
+    def update_many(self, times, errors, inputs):
+        times = np.asarray(times, dtype=float)
+        if len(times) == 0:
+            return
+        
+        if self._t is None:
+            self.single = np.ndim(errors) == 2
+        self._flush()
+        
+        # Same (time, trajectory, channel) layout as the chunk buffers
+        errors = np.asarray(errors, dtype=float)
+        inputs = np.asarray(inputs, dtype=float)
+        if self.single:
+            errors = errors[:, None, :]
+            inputs = inputs[:, None, :]
+        self._reduce(times, errors, inputs)
+
+    def _flush(self):
+        k = self._fill
+        if k == 0:
+            return
+        self._fill = 0
+        self._reduce(self._t[:k], self._error[:k], self._u[:k])
+
+    def _reduce(self, t, error, u):
+        k = len(t)
+        pos = np.sqrt(np.sum(error[:, :, 0:3] ** 2, axis=2))
+        ori = np.sqrt(np.sum(error[:, :, 6:9] ** 2, axis=2))
+        energy = np.sum(u ** 2, axis=2)
+        effort = np.sqrt(energy)
+        
+        if self.count == 0:
+            num = pos.shape[1]
+            self.max_position_error = np.full(num, -np.inf)
+            self.sum_sq_position = np.zeros(num)
+            self.iae_position = np.zeros(num)
+            self.max_control_effort = np.full(num, -np.inf)
+            self.control_energy = np.zeros(num)
+            self.sum_sq_orientation = np.zeros(num)
+            self.max_orientation_error = np.full(num, -np.inf)
+            self.running_min = np.full(num, np.inf)
+            self.settled = np.zeros(num, dtype=bool)
+            
+            t_all, pos_all, energy_all = t, pos, energy
+        else:
+            # Prepend the previous chunk's last sample to close the gap
+            t_all = np.concatenate(([self.t_prev], t))
+            pos_all = np.vstack((self.pos_prev, pos))
+            energy_all = np.vstack((self.energy_prev, energy))
+        
+        # Trapezoidal integrals
+        dt = np.diff(t_all)[:, None]
+        self.iae_position += np.sum(0.5 * (pos_all[1:] + pos_all[:-1]) * dt, axis=0)
+        self.control_energy += np.sum(0.5 * (energy_all[1:] + energy_all[:-1]) * dt, axis=0)
+        
+        # Settling candidates: strict new running minima, up to the first one
+        # below 2% of the running maximum
+        if not self.settled.all():
+            running_max = np.maximum.accumulate(
+                np.vstack((self.max_position_error, pos)), axis=0)[1:]
+            prior_min = np.minimum.accumulate(
+                np.vstack((self.running_min, pos)), axis=0)[:-1]
+            record = (pos < prior_min) & ~self.settled
+            
+            settles = record & (pos < 0.02 * running_max)
+            after_settle = np.cumsum(settles, axis=0) - settles > 0
+            record &= ~after_settle
+            
+            rows = record.any(axis=1)
+            if rows.any():
+                self.candidate_times.append(t[rows])
+                self.candidate_values.append(np.where(record, pos, np.inf)[rows])
+            
+            self.settled |= settles.any(axis=0)
+            np.minimum(self.running_min, pos.min(axis=0), out=self.running_min)
+        
+        np.maximum(self.max_position_error, pos.max(axis=0), out=self.max_position_error)
+        self.sum_sq_position += np.sum(pos ** 2, axis=0)
+        np.maximum(self.max_control_effort, effort.max(axis=0), out=self.max_control_effort)
+        self.sum_sq_orientation += np.sum(ori ** 2, axis=0)
+        np.maximum(self.max_orientation_error, ori.max(axis=0), out=self.max_orientation_error)
+        
+        self.count += k
+        self.t_prev = t[-1]
+        self.pos_prev = pos[-1]
+        self.energy_prev = energy[-1]
+
+    def settling_time(self):
+        self._flush()
+        threshold = 0.02 * self.max_position_error
+        settling_time = np.full(threshold.shape, np.inf)
+        
+        if self.candidate_times:
+            times = np.concatenate(self.candidate_times)
+            values = np.vstack(self.candidate_values)
+            
+            # Candidates are in time order, so the first one below threshold wins
+            below = values < threshold
+            hit = below.any(axis=0)
+            settling_time[hit] = times[np.argmax(below, axis=0)[hit]]
+        
+        return settling_time
+
+    def result(self):
+        self._flush()
+        if self.count == 0:
+            raise ValueError("No samples accumulated")
+        
+        metrics = {
+            'settling_time': self.settling_time(),
+            'max_position_error': self.max_position_error,
+            'rmse_position': np.sqrt(self.sum_sq_position / self.count),
+            'iae_position': self.iae_position,
+            'max_control_effort': self.max_control_effort,
+            'control_energy': self.control_energy,
+            'rmse_orientation': np.sqrt(self.sum_sq_orientation / self.count),
+            'max_orientation_error': self.max_orientation_error
+        }
+        
+        # Plain floats for a single trajectory, like compute_performance_metrics
+        if self.single:
+            metrics = {name: float(value[0]) for name, value in metrics.items()}
+        
+        return metrics
+
+def _normalize_columns(values):
+    # Scale every channel to [0, 1] so no single unit dominates the selection
+    values = np.asarray(values, dtype=float).reshape(len(values), -1)
+    lo = values.min(axis=0)
+    span = values.max(axis=0) - lo
+    span[span == 0] = 1.0
+    return (values - lo) / span
+
+def lttb_indices(time, values, max_points):
+    # Largest-Triangle-Three-Buckets on one or more channels. The triangle area is
+    # taken in (time, channel...) space, so a single index set serves every channel.
+    n = len(time)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+    
+    t = np.asarray(time, dtype=float)
+    t = (t - t[0]) / max(t[-1] - t[0], 1e-12)
+    points = np.column_stack((t, _normalize_columns(values)))
+    
+    # Bucket edges for the n - 2 interior samples
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    
+    # Average of every bucket, used as the third triangle vertex
+    sums = np.add.reduceat(points[1:n - 1], edges[:-1] - 1, axis=0)
+    counts = np.diff(edges)[:, None]
+    means = sums / np.maximum(counts, 1)
+    
+    indices = np.empty(max_points, dtype=int)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = points[0]
+    
+    for b in range(max_points - 2):
+        start, stop = edges[b], edges[b + 1]
+        c = means[b + 1] if b + 1 < len(means) else points[-1]
+        
+        # Triangle area from |AB|^2 |AC|^2 - (AB . AC)^2 for every candidate B
+        ab = points[start:stop] - a
+        ac = c - a
+        area2 = np.einsum('ij,ij->i', ab, ab) * ac.dot(ac) - (ab @ ac) ** 2
+        
+        best = start + int(np.argmax(area2))
+        indices[b + 1] = best
+        a = points[best]
+    
+    return indices
+
+def minmax_indices(values, max_points):
+    # Keep the samples holding the highest and lowest normalized value of any
+    # channel in each bucket (fully vectorized, no Python loop over buckets)
+    n = len(values)
+    if max_points >= n or max_points < 4:
+        return np.arange(n)
+    
+    z = _normalize_columns(values)
+    hi = z.max(axis=1)
+    lo = z.min(axis=1)
+    
+    # Pad to a whole number of buckets; padding never wins argmax/argmin
+    num_buckets = (max_points - 2) // 2
+    size = -(-n // num_buckets)
+    pad = num_buckets * size - n
+    hi = np.concatenate((hi, np.full(pad, -np.inf))).reshape(num_buckets, size)
+    lo = np.concatenate((lo, np.full(pad, np.inf))).reshape(num_buckets, size)
+    
+    offsets = np.arange(num_buckets) * size
+    picks = np.concatenate((
+        [0, n - 1],
+        offsets + np.argmax(hi, axis=1),
+        offsets + np.argmin(lo, axis=1)
+    ))
+    
+    return np.unique(picks[picks < n])
+
+def decimate_result(result, max_points, method='lttb'):
+    # Downsample every time series in a simulation result with one shared index set
+    _require_full_states(result, "decimate_result")
+    time = result['time']
+    n = len(time)
+    
+    # A SimulationResult derives 'reference' and 'error' on access; they are
+    # decimated like the stored series
+    names = list(result)
+    names += [name for name in getattr(result, 'DERIVED', ()) if name in result and name not in names]
+    series = [
+        name for name in names
+        if name != 'time' and isinstance(result[name], np.ndarray) and result[name].ndim >= 1
+        and len(result[name]) == n
+    ]
+    
+    if max_points is None or max_points >= n:
+        indices = np.arange(n)
+    else:
+        values = np.hstack([result[name].reshape(n, -1) for name in series])
+        if method == 'lttb':
+            indices = lttb_indices(time, values, max_points)
+        elif method == 'minmax':
+            indices = minmax_indices(values, max_points)
+        else:
+            raise ValueError(f"Unknown decimation method '{method}'")
+    
+    decimated = dict(result)
+    decimated['time'] = time[indices]
+    for name in series:
+        decimated[name] = result[name][indices]
+    
+    # Original sample numbers, so full-resolution data can be requested later
+    decimated['indices'] = indices
+    
+    return decimated
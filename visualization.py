@@ -1,12 +1,41 @@
-import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-import matplotlib.animation as animation
+import os
+import shutil
+import tempfile
+import subprocess
 import logging
+from collections import namedtuple
+import numpy as np
+from utils import rotation_matrix
 
 logger = logging.getLogger(__name__)
 
-def plot_trajectory(time, states, inputs, reference=None, error=None, save_path=None):
+# matplotlib (and Pillow) are imported inside the plotting functions, so
+# importing this module for its helpers does not load a plotting backend
+
+# Rows plotted from memory-mapped histories unless max_points says otherwise
+PLOT_MAX_POINTS = 20000
+
+def _plot_indices(num_rows, max_points):
+    # Evenly spaced rows (first and last included); None means plot everything
+    if max_points is None or num_rows <= max_points:
+        return None
+    return np.unique(np.linspace(0, num_rows - 1, max_points).astype(int))
+
+def plot_trajectory(time, states, inputs, reference=None, error=None, save_path=None,
+                    max_points=None):
+    # max_points thins every series to that many evenly spaced rows before
+    # plotting; memory-mapped states default to PLOT_MAX_POINTS so only the
+    # plotted rows are read from disk
+    if max_points is None and isinstance(states, np.memmap):
+        max_points = PLOT_MAX_POINTS
+    idx = _plot_indices(len(time), max_points)
+    if idx is not None:
+        time, states, inputs = time[idx], states[idx], inputs[idx]
+        reference = reference[idx] if reference is not None else None
+        error = error[idx] if error is not None else None
+    
+    import matplotlib.pyplot as plt
+    
     # Create figure
     fig = plt.figure(figsize=(15, 10))
     
@@ -120,84 +149,234 @@ def plot_trajectory(time, states, inputs, reference=None, error=None, save_path=
     
     return fig
 
-def create_animation(time, states):
-    # Create figure
-    fig = plt.figure(figsize=(10, 8))
-    ax = fig.add_subplot(111, projection='3d')
-    
-    # Drone visualization properties
-    body_size = 0.3
-    arm_length = 0.4
-    
-    # Initialize drone representation
-    body = ax.plot([], [], [], 'bo', markersize=10)[0]
-    arms = [ax.plot([], [], [], 'r-', linewidth=2)[0] for _ in range(4)]
-    trail = ax.plot([], [], [], 'b-', alpha=0.3)[0]
-    
-    # Set axis limits
-    min_x, max_x = np.min(states[:, 0]) - 1, np.max(states[:, 0]) + 1
-    min_y, max_y = np.min(states[:, 1]) - 1, np.max(states[:, 1]) + 1
-    min_z, max_z = np.min(states[:, 2]) - 1, np.max(states[:, 2]) + 1
-    
-    ax.set_xlim([min_x, max_x])
-    ax.set_ylim([min_y, max_y])
-    ax.set_zlim([min_z, max_z])
-    
-    ax.set_xlabel('X (m)')
-    ax.set_ylabel('Y (m)')
-    ax.set_zlabel('Z (m)')
-    ax.set_title('Drone Trajectory')
-    
-    # Animation update function
-    def update(i):
-        i = min(i, len(time) - 1)  # Ensure i doesn't exceed array length
-        
-        # Current state
-        x, y, z = states[i, 0:3]
-        phi, theta, psi = states[i, 6:9]
-        
-        # Rotation matrix from body to inertial frame
-        c_phi, s_phi = np.cos(phi), np.sin(phi)
-        c_theta, s_theta = np.cos(theta), np.sin(theta)
-        c_psi, s_psi = np.cos(psi), np.sin(psi)
+def plot_result(result, save_path=None, max_points=PLOT_MAX_POINTS):
+    # Plot a simulation result dict (or SimulationResult). Rows are selected
+    # before 'reference'/'error' are formed, so lazy or memory-mapped results
+    # never materialize their full error history.
+    time = result['time']
+    idx = _plot_indices(len(time), max_points)
+    if idx is None:
+        idx = slice(None)
+    
+    states = np.asarray(result['states'][idx])
+    reference = np.asarray(result['reference'][idx])
+    return plot_trajectory(time[idx], states, np.asarray(result['inputs'][idx]),
+                           reference=reference, error=states - reference,
+                           save_path=save_path)
+
+# Animation defaults: frames per second of the output and seconds of trail kept
+ANIMATION_FPS = 30
+TRAIL_SECONDS = 3.0
+ARM_LENGTH = 0.4
+
+# Below this many frames an export renders in-process
+PARALLEL_MIN_FRAMES = 300
+
+AnimationGeometry = namedtuple('AnimationGeometry', ['frames', 'time', 'positions', 'arm_ends', 'limits'])
+
+def animation_frames(time, fps=ANIMATION_FPS):
+    # Sample index shown in each output frame: one per 1/fps seconds (first and
+    # last sample included); fps=None keeps every sample
+    time = np.asarray(time)
+    if fps is None or len(time) < 2:
+        return np.arange(len(time))
+    frame_times = np.arange(time[0], time[-1], 1.0 / fps)
+    frames = np.searchsorted(time, frame_times)
+    return np.unique(np.append(frames, len(time) - 1))
+
+def animation_geometry(time, states, fps=ANIMATION_FPS, arm_length=ARM_LENGTH):
+    """Everything an animation draws, for every output frame in one pass.
+
+    Only the decimated frames are read from states (which may be memory
+    mapped). arm_ends is (frames, 4, 3); limits are the padded axis ranges of
+    the sampled positions, which are also the only points the trail draws.
+    """
+    frames = animation_frames(time, fps)
+    sampled = np.asarray(states[frames])
+    positions = sampled[:, 0:3]
+    
+    # Arm endpoints for every frame at once
+    R = rotation_matrix(sampled[:, 6], sampled[:, 7], sampled[:, 8])
+    arm_vectors_body = np.array([
+        [arm_length, 0, 0],
+        [0, arm_length, 0],
+        [-arm_length, 0, 0],
+        [0, -arm_length, 0]
+    ])
+    arm_ends = positions[:, None, :] + np.einsum('tij,aj->tai', R, arm_vectors_body)
+    
+    limits = [(np.min(positions[:, k]) - 1, np.max(positions[:, k]) + 1) for k in range(3)]
+    return AnimationGeometry(frames, np.asarray(time)[frames], positions, arm_ends, limits)
+
+class DroneScene:
+    """3D drone artists on a figure, updated in place for each frame.
+
+    The trail shows at most trail_frames previous frame positions (None keeps
+    the whole flight), so the per-frame cost stays bounded.
+    """
+    
+    def __init__(self, fig, geometry, trail_frames=None):
+        self.geometry = geometry
+        self.trail_frames = trail_frames
         
-        R = np.array([
-            [c_theta * c_psi, c_theta * s_psi, -s_theta],
-            [s_phi * s_theta * c_psi - c_phi * s_psi, s_phi * s_theta * s_psi + c_phi * c_psi, s_phi * c_theta],
-            [c_phi * s_theta * c_psi + s_phi * s_psi, c_phi * s_theta * s_psi - s_phi * c_psi, c_phi * c_theta]
-        ])
+        ax = fig.add_subplot(111, projection='3d')
+        self.body = ax.plot([], [], [], 'bo', markersize=10)[0]
+        self.arms = [ax.plot([], [], [], 'r-', linewidth=2)[0] for _ in range(4)]
+        self.trail = ax.plot([], [], [], 'b-', alpha=0.3)[0]
         
-        # Drone arms in body frame
-        arm_vectors_body = np.array([
-            [arm_length, 0, 0],
-            [0, arm_length, 0],
-            [-arm_length, 0, 0],
-            [0, -arm_length, 0]
-        ])
+        (min_x, max_x), (min_y, max_y), (min_z, max_z) = geometry.limits
+        ax.set_xlim([min_x, max_x])
+        ax.set_ylim([min_y, max_y])
+        ax.set_zlim([min_z, max_z])
         
-        # Transform arms to inertial frame
-        arm_vectors_inertial = np.array([R @ arm for arm in arm_vectors_body])
+        ax.set_xlabel('X (m)')
+        ax.set_ylabel('Y (m)')
+        ax.set_zlabel('Z (m)')
+        ax.set_title('Drone Trajectory')
+        self.ax = ax
+    
+    def update(self, k):
+        k = min(k, len(self.geometry.frames) - 1)
+        x, y, z = self.geometry.positions[k]
         
-        # Update drone visualization
-        body.set_data([x], [y])
-        body.set_3d_properties([z])
+        self.body.set_data([x], [y])
+        self.body.set_3d_properties([z])
         
-        for j, arm in enumerate(arms):
-            arm_end = [x, y, z] + arm_vectors_inertial[j]
+        for arm, arm_end in zip(self.arms, self.geometry.arm_ends[k]):
             arm.set_data([x, arm_end[0]], [y, arm_end[1]])
             arm.set_3d_properties([z, arm_end[2]])
         
-        # Update trail
-        trail.set_data(states[:i+1, 0], states[:i+1, 1])
-        trail.set_3d_properties(states[:i+1, 2])
+        start = 0 if self.trail_frames is None else max(0, k - self.trail_frames)
+        trail = self.geometry.positions[start:k + 1]
+        self.trail.set_data(trail[:, 0], trail[:, 1])
+        self.trail.set_3d_properties(trail[:, 2])
         
-        return [body] + arms + [trail]
+        return [self.body] + self.arms + [self.trail]
+
+def _trail_frames(fps, trail_seconds, time):
+    if trail_seconds is None:
+        return None
+    if fps is None:
+        fps = 1.0 / (time[1] - time[0]) if len(time) > 1 else 1.0
+    return max(1, int(round(trail_seconds * fps)))
+
+def create_animation(time, states, fps=None, trail_seconds=None):
+    # Interactive animation, by default one frame per sample with the whole
+    # flight as trail; fps decimates the frames and trail_seconds bounds the
+    # trail (export_animation defaults to ANIMATION_FPS and TRAIL_SECONDS)
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
+    
+    fig = plt.figure(figsize=(10, 8))
+    geometry = animation_geometry(time, states, fps)
+    scene = DroneScene(fig, geometry, _trail_frames(fps, trail_seconds, time))
+    
+    if fps is not None:
+        interval = int(1000 / fps)
+    else:
+        interval = int(1000 * (time[1] - time[0]))
     
     # Create animation
     anim = animation.FuncAnimation(
-        fig, update, frames=len(time),
-        interval=int(1000 * (time[1] - time[0])),
+        fig, scene.update, frames=len(geometry.frames),
+        interval=interval,
         blit=True
     )
     
     return anim, fig
+
+def _headless_scene(geometry, trail_frames, figsize, dpi):
+    # Agg canvas without pyplot: no GUI backend and no global figure registry
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig, DroneScene(fig, geometry, trail_frames)
+
+def _render_frame_range(task):
+    # Worker: render frames [start, stop) to numbered PNG files
+    geometry, trail_frames, start, stop, pattern, figsize, dpi = task
+    fig, scene = _headless_scene(geometry, trail_frames, figsize, dpi)
+    for k in range(start, stop):
+        scene.update(k)
+        fig.savefig(pattern % k, dpi=dpi)
+    return stop - start
+
+def _export_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.mp4', '.gif'):
+        return extension[1:]
+    if extension == '':
+        return 'frames'
+    raise ValueError(f"Unsupported animation format '{extension}'. Use .mp4, .gif or a directory for PNG frames")
+
+def export_animation(time, states, path, fps=ANIMATION_FPS, trail_seconds=TRAIL_SECONDS,
+                     figsize=(10, 8), dpi=100, workers=None):
+    """Render the drone animation headless to an MP4, a GIF, or PNG frames.
+
+    path ending in .mp4 (needs ffmpeg) or .gif selects a video; any other path
+    is a directory that receives frame_00000.png, ... Frames are decimated to
+    `fps`. Long exports are rendered across processes (workers=None uses the
+    shared sweep pool once there are PARALLEL_MIN_FRAMES frames, workers=1
+    forces in-process rendering). Returns the number of frames written.
+    """
+    import matplotlib
+    import matplotlib.animation as animation
+    
+    kind = _export_format(path)
+    if kind == 'mp4' and not animation.writers.is_available('ffmpeg'):
+        raise RuntimeError("MP4 export needs ffmpeg; export to .gif or a frame directory instead")
+    
+    geometry = animation_geometry(time, states, fps)
+    trail_frames = _trail_frames(fps, trail_seconds, time)
+    num_frames = len(geometry.frames)
+    frame_rate = fps if fps is not None else 1.0 / (time[1] - time[0])
+    parallel = workers != 1 and (workers is not None or num_frames >= PARALLEL_MIN_FRAMES)
+    
+    # Videos rendered in-process stream straight into the writer
+    if kind != 'frames' and not parallel:
+        fig, scene = _headless_scene(geometry, trail_frames, figsize, dpi)
+        writer_class = animation.FFMpegWriter if kind == 'mp4' else animation.PillowWriter
+        writer = writer_class(fps=frame_rate)
+        with writer.saving(fig, path, dpi):
+            for k in range(num_frames):
+                scene.update(k)
+                writer.grab_frame()
+        logger.info(f"Animation saved to {path} ({num_frames} frames)")
+        return num_frames
+    
+    # Otherwise render PNG frames (in parallel chunks) and assemble videos from them
+    frame_dir = path if kind == 'frames' else tempfile.mkdtemp(prefix='animation-')
+    os.makedirs(frame_dir, exist_ok=True)
+    pattern = os.path.join(frame_dir, 'frame_%05d.png')
+    try:
+        if parallel:
+            from sweep import get_executor
+            executor = get_executor(workers)
+            num_workers = getattr(executor, '_max_workers', None) or os.cpu_count() or 1
+            bounds = np.linspace(0, num_frames, num_workers + 1).astype(int)
+            tasks = [(geometry, trail_frames, start, stop, pattern, figsize, dpi)
+                     for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+            list(executor.map(_render_frame_range, tasks))
+        else:
+            _render_frame_range((geometry, trail_frames, 0, num_frames, pattern, figsize, dpi))
+        
+        if kind == 'gif':
+            from PIL import Image
+            frames = (Image.open(pattern % k) for k in range(num_frames))
+            first = next(frames)
+            first.save(path, save_all=True, append_images=frames,
+                       duration=int(round(1000 / frame_rate)), loop=0)
+        elif kind == 'mp4':
+            subprocess.run(
+                [matplotlib.rcParams['animation.ffmpeg_path'], '-y', '-loglevel', 'error',
+                 '-framerate', str(frame_rate), '-i', pattern,
+                 '-pix_fmt', 'yuv420p', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', path],
+                check=True
+            )
+    finally:
+        if kind != 'frames':
+            shutil.rmtree(frame_dir, ignore_errors=True)
+    
+    logger.info(f"Animation saved to {path} ({num_frames} frames)")
+    return num_frames